@@ -1,4 +1,4 @@
-import { useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useMutation, useQueryClient } from "@tanstack/react-query";
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from "@/components/ui/dialog";
 import { Button } from "@/components/ui/button";
@@ -41,14 +41,29 @@ export default function PaymentModal({
   const [cardholderName, setCardholderName] = useState("");
   const [isProcessing, setIsProcessing] = useState(false);
   
+  // Sent with every submit of this payment, so a retry after a lost
+  // response is answered with the first result instead of paying twice
+  const idempotencyKey = useRef<string | null>(null);
+  
   const { toast } = useToast();
   const queryClient = useQueryClient();
 
+  useEffect(() => {
+    if (!isOpen) {
+      idempotencyKey.current = null;
+    }
+  }, [isOpen]);
+
   const paymentMutation = useMutation({
     mutationFn: async (paymentData: any) => {
-      return apiRequest("POST", "/api/payments", paymentData);
+      // randomUUID needs a secure context, which a plain-http LAN address is not
+      idempotencyKey.current ??= typeof crypto.randomUUID === "function"
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+      return apiRequest("POST", "/api/payments", paymentData, { "Idempotency-Key": idempotencyKey.current });
     },
     onSuccess: () => {
+      idempotencyKey.current = null;
       queryClient.invalidateQueries({ queryKey: ["/api/qr"] });
       queryClient.invalidateQueries({ queryKey: ["/api/dashboard"] });
       onPaymentComplete();
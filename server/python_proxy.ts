@@ -9,7 +9,11 @@ export async function startPythonServer(): Promise<void> {
   return new Promise((resolve, reject) => {
     console.log("🐍 Starting Python FastAPI server...");
     
-    pythonProcess = spawn('python', ['-m', 'uvicorn', 'main:app', '--host', '0.0.0.0', '--port', '8000', '--reload'], {
+    // Production runs the launcher (no reload, SPLITPAY_WORKERS processes); development reloads on change
+    const args = process.env.NODE_ENV === 'production'
+      ? ['serve.py', '--host', '0.0.0.0', '--port', '8000', '--log-level', 'info']
+      : ['-m', 'uvicorn', 'main:app', '--host', '0.0.0.0', '--port', '8000', '--reload'];
+    pythonProcess = spawn('python', args, {
       cwd: 'server_python',
       stdio: ['pipe', 'pipe', 'pipe']
     });
@@ -39,6 +43,14 @@ export async function registerPythonRoutes(app: express.Express): Promise<Server
   // Start Python server
   await startPythonServer();
   
+  // Server-Sent Events streams stay open indefinitely; never time them out.
+  // The proxy pipes the upstream body chunk by chunk, so events pass straight through.
+  app.use('/api/stream', (req: Request, _res: Response, next) => {
+    req.socket.setTimeout(0);
+    req.socket.setNoDelay(true);
+    next();
+  });
+
   // Proxy all /api requests to Python server
   app.use('/api', createProxyMiddleware({
     target: 'http://localhost:8000',
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# On-disk tier for closed bills. Bills are written in compressed blocks to
+# append-only segment files; a SQLite index maps every archived bill, item
+# and payment id to the block holding it, so reads by id keep working after
+# the records leave memory.
+
+_FRAME = struct.Struct(">I")
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    bill_id TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+"""
+
+
+class BillArchive:
+    """Append-only, segmented archive of closed bills with an on-disk index.
+
+    Each archived bill is a JSON document {"bill", "items", "payments"} as
+    the API would serialize them. A batch of bills is written as one
+    zlib-compressed frame; segments roll over after `segment_bytes`.
+    Methods block on disk I/O and are meant to be run in a worker thread.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 8 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.executescript(INDEX_SCHEMA)
+
+        segments = self._segments()
+        self._segment = segments[-1] if segments else 1
+        self.archived_bills = self._index.execute("SELECT COUNT(*) FROM entries WHERE id = bill_id").fetchone()[0]
+
+    def _segments(self) -> List[int]:
+        return sorted(
+            int(name[len("segment-"):-len(".log")])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:06d}.log")
+
+    def append(self, documents: List[dict]):
+        """Write a batch of bill documents as one frame and index their ids"""
+        if not documents:
+            return
+        block = zlib.compress(json.dumps(documents, separators=(",", ":")).encode())
+
+        with self._lock:
+            path = self._segment_path(self._segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+                self._segment += 1
+                path = self._segment_path(self._segment)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(_FRAME.pack(len(block)))
+                f.write(block)
+                f.flush()
+                os.fsync(f.fileno())
+
+            location = (self._segment, offset + _FRAME.size, len(block))
+            rows = []
+            for document in documents:
+                bill_id = document["bill"]["id"]
+                rows.append((bill_id, bill_id, *location))
+                rows.extend((item["id"], bill_id, *location) for item in document["items"])
+                rows.extend((payment["id"], bill_id, *location) for payment in document["payments"])
+            with self._index:
+                new_bills = sum(
+                    1 for document in documents
+                    if not self._index.execute("SELECT 1 FROM entries WHERE id = ?", (document["bill"]["id"],)).fetchone()
+                )
+                self._index.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+            self.archived_bills += new_bills
+
+    def _locate(self, id: str) -> Optional[Tuple[str, int, int, int]]:
+        with self._lock:
+            return self._index.execute(
+                "SELECT bill_id, segment, offset, length FROM entries WHERE id = ?", (id,)
+            ).fetchone()
+
+    def _read_document(self, bill_id: str, segment: int, offset: int, length: int) -> Optional[dict]:
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            block = f.read(length)
+        for document in json.loads(zlib.decompress(block)):
+            if document["bill"]["id"] == bill_id:
+                return document
+        return None
+
+    def get(self, id: str) -> Optional[dict]:
+        """The archived bill document containing a bill, item or payment id"""
+        location = self._locate(id)
+        if location is None:
+            return None
+        return self._read_document(*location)
+
+    def _current(self, documents: List[dict], segment: int, offset: int) -> List[dict]:
+        """The documents of a frame the index still points to for their bill"""
+        if not documents:
+            return []
+        ids = [document["bill"]["id"] for document in documents]
+        with self._lock:
+            current = {row[0] for row in self._index.execute(
+                f"SELECT id FROM entries WHERE id IN ({', '.join('?' * len(ids))}) AND segment = ? AND offset = ?",
+                (*ids, segment, offset)
+            )}
+        return [document for document in documents if document["bill"]["id"] in current]
+
+    def end(self) -> Tuple[int, int]:
+        """The position just past the last frame written so far"""
+        with self._lock:
+            path = self._segment_path(self._segment)
+            return self._segment, os.path.getsize(path) if os.path.exists(path) else 0
+
+    def scan(self, position: Tuple[int, int] = (0, 0), end: Optional[Tuple[int, int]] = None,
+             max_bytes: int = 1024 * 1024) -> Tuple[List[dict], Optional[Tuple[int, int]]]:
+        """Archived bill documents in the frames from `position` to `end` (segment, offset).
+
+        Reads whole frames until about `max_bytes` of compressed data, and
+        returns them with the position to continue from, None once the last
+        frame (before `end`, if given) was read. A bill archived more than
+        once is only returned from the frame the index points to.
+        """
+        documents: List[dict] = []
+        read = 0
+        for segment in self._segments():
+            if segment < position[0]:
+                continue
+            if end is not None and segment > end[0]:
+                break
+            limit = end[1] if end is not None and segment == end[0] else None
+            offset = position[1] if segment == position[0] else 0
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                while read < max_bytes and (limit is None or offset < limit):
+                    header = f.read(_FRAME.size)
+                    if len(header) < _FRAME.size:
+                        break
+                    (length,) = _FRAME.unpack(header)
+                    block = f.read(length)
+                    if len(block) < length:
+                        break  # a frame still being written
+                    offset += _FRAME.size
+                    documents.extend(self._current(json.loads(zlib.decompress(block)), segment, offset))
+                    offset += length
+                    read += length
+            if read >= max_bytes:
+                return documents, (segment, offset)
+        return documents, None
+
+    def stats(self) -> Dict[str, int]:
+        segments = self._segments()
+        return {
+            "archived_bills": self.archived_bills,
+            "segments": len(segments),
+            "bytes": sum(os.path.getsize(self._segment_path(segment)) for segment in segments),
+        }
+
+    def close(self):
+        with self._lock:
+            self._index.close()
+
+
+class Compactor:
+    """Background task moving closed bills from a storage's hot set to its archive.
+
+    Each round archives at most `batch_size` bills and spends at most
+    `max_pause` seconds on the event loop collecting them; the disk writes
+    happen in a worker thread.
+    """
+
+    def __init__(self, storage, interval: float = 30.0, batch_size: int = 500, max_pause: float = 0.005):
+        self.storage = storage
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pause = max_pause
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            try:
+                # Keep going without sleeping while there is a backlog
+                while await self.storage.archive_closed_bills(self.batch_size, self.max_pause) >= self.batch_size:
+                    await asyncio.sleep(0)
+            except Exception as e:
+                print(f"Bill archival failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark entering a 30-item order one POST /api/bills/{id}/items call per
+dish against a single POST /api/bills/{id}/items:batch call, on both
+storage backends.
+
+Usage: python benchmarks/bench_batch_items.py [--orders 200] [--items 30]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import routes
+from schemas import TableCreate, BillCreate
+from storage import MemStorage
+from sqlite_storage import SqliteStorage
+
+
+def order(items: int):
+    return [{"name": f"Dish {i}", "price": "12.50", "quantity": "1"} for i in range(items)]
+
+
+async def new_bill(storage, number: int) -> str:
+    table = await storage.create_table(TableCreate(
+        number=number, restaurant_name="bench", qr_code=f"https://splitbill.app/t/{number}/bench",
+    ))
+    bill = await storage.create_bill(BillCreate(table_id=table.id, total="0", remaining="0"))
+    return bill.id
+
+
+async def bench(name: str, storage, args):
+    routes.storage = storage
+    bills = [await new_bill(storage, number) for number in range(1, 2 * args.orders + 1)]
+
+    start = time.perf_counter()
+    for bill_id in bills[:args.orders]:
+        for item in order(args.items):
+            await routes.create_bill_item(bill_id, item)
+    per_item = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for bill_id in bills[args.orders:]:
+        await routes.create_bill_items(bill_id, order(args.items))
+    batch = time.perf_counter() - start
+
+    print(f"{name} ({args.items}-item order):")
+    print(f"  per-item {per_item / args.orders * 1e3:>8.2f} ms/order")
+    print(f"  batch    {batch / args.orders * 1e3:>8.2f} ms/order  ({per_item / batch:.1f}x)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--items", type=int, default=30)
+    args = parser.parse_args()
+
+    await bench("MemStorage", MemStorage(), args)
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite = SqliteStorage(os.path.join(tmp, "bench.db"))
+        try:
+            await bench("SqliteStorage", sqlite, args)
+        finally:
+            sqlite.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark settling a table one POST /api/payments call per guest against a
+single POST /api/bills/{id}/payments:batch call, on both storage backends.
+Each guest pays for their own dishes plus a share of the table's bottle.
+
+Usage: python benchmarks/bench_batch_payments.py [--tables 100] [--guests 12]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import routes
+from schemas import TableCreate, BillCreate, BillItemCreate, PaymentCreate
+from storage import MemStorage
+from sqlite_storage import SqliteStorage
+
+
+async def new_table(storage, number: int, guests: int) -> tuple:
+    table = await storage.create_table(TableCreate(
+        number=number, restaurant_name="bench", qr_code=f"https://splitbill.app/t/{number}/bench",
+    ))
+    bill = await storage.create_bill(BillCreate(table_id=table.id, total="0", remaining="0"))
+    items = await storage.create_bill_items(
+        [BillItemCreate(bill_id=bill.id, name="Wine Bottle (Shared)", price="48.00")]
+        + [BillItemCreate(bill_id=bill.id, name=f"Dish {i}", price="12.50") for i in range(guests)]
+    )
+    return bill.id, [item.id for item in items]
+
+
+def settlement(item_ids: list, guests: int) -> list:
+    bottle, dishes = item_ids[0], item_ids[1:]
+    share = 100 // guests
+    return [
+        {
+            "amount": f"{12.50 + 48.00 * share / 100:.2f}",
+            "tip": "1.00",
+            "items": [{"itemId": dish, "quantity": 1}, {"itemId": bottle, "quantity": share / 100}],
+        }
+        for dish in dishes
+    ]
+
+
+async def bench(name: str, storage, args):
+    routes.storage = storage
+    tables = [await new_table(storage, number, args.guests) for number in range(1, 2 * args.tables + 1)]
+
+    start = time.perf_counter()
+    for bill_id, item_ids in tables[:args.tables]:
+        for payment in settlement(item_ids, args.guests):
+            await routes.create_payment(PaymentCreate(bill_id=bill_id, **payment))
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for bill_id, item_ids in tables[args.tables:]:
+        await routes.create_payments(bill_id, settlement(item_ids, args.guests))
+    batch = time.perf_counter() - start
+
+    print(f"{name} ({args.guests} guests per table):")
+    print(f"  per-payment {single / args.tables * 1e3:>8.2f} ms/table")
+    print(f"  batch       {batch / args.tables * 1e3:>8.2f} ms/table  ({single / batch:.1f}x)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tables", type=int, default=100)
+    parser.add_argument("--guests", type=int, default=12)
+    args = parser.parse_args()
+
+    await bench("MemStorage", MemStorage(), args)
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite = SqliteStorage(os.path.join(tmp, "bench.db"))
+        try:
+            await bench("SqliteStorage", sqlite, args)
+        finally:
+            sqlite.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
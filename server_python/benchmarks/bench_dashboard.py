@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Dashboard serialization benchmark: GET /api/dashboard/tables for --tables
+tables with an open bill of --items items each, through the app's
+document path (FastJSONResponse over storage documents) and through the
+previous model path (response_model=List[DashboardTable] over
+get_dashboard_tables), mounted side by side on the same app.
+
+Usage: python benchmarks/bench_dashboard.py [--tables 200] [--items 20] [--storage memory]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import routes
+from schemas import BillCreate, BillItemCreate, DashboardTable, TableCreate
+from storage import MemStorage
+
+
+@routes.app.get("/bench/dashboard/models", response_model=List[DashboardTable])
+async def dashboard_models(restaurant: Optional[str] = None):
+    return await routes.storage.get_dashboard_tables(restaurant)
+
+
+async def populate(storage, tables: int, items: int):
+    for number in range(1, tables + 1):
+        table = await storage.create_table(TableCreate(number=number, restaurant_name="bench", qr_code=f"QR-{number}"))
+        bill = await storage.create_bill(BillCreate(table_id=table.id, total="0", remaining="0", guest_count=4))
+        await storage.create_bill_items([
+            BillItemCreate(bill_id=bill.id, name=f"Item {i}", price="12.50", quantity="2") for i in range(items)
+        ])
+
+
+async def measure(client: httpx.AsyncClient, url: str, requests: int) -> dict:
+    for _ in range(5):
+        await client.get(url)
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(url)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "bytes": len(response.content),
+        "body": response.content,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "mean": sum(latencies) / len(latencies) * 1000,
+    }
+
+
+async def run(options):
+    if options.storage == "sqlite":
+        from sqlite_storage import SqliteStorage
+        storage = SqliteStorage(os.path.join(tempfile.mkdtemp(), "dashboard.db"))
+    else:
+        storage = MemStorage(sample_data=False)
+    routes.storage = storage
+    await populate(storage, options.tables, options.items)
+
+    transport = httpx.ASGITransport(app=routes.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        before = await measure(client, "/bench/dashboard/models", options.requests)
+        after = await measure(client, "/api/dashboard/tables", options.requests)
+
+    print(f"{options.tables} tables x {options.items} items, {options.storage} storage, {after['bytes']} bytes")
+    for name, result in (("models (before)", before), ("documents (after)", after)):
+        print(f"  {name:<18} p50 {result['p50']:7.2f} ms  p99 {result['p99']:7.2f} ms  mean {result['mean']:7.2f} ms")
+    print(f"  speedup (p50) {before['p50'] / after['p50']:.1f}x; identical bodies: {before['body'] == after['body']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--storage", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
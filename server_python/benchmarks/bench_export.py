@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Export benchmark: GET /api/export/bills over seeded data, with the response
+body discarded as it is sent, while a second client keeps requesting
+/api/tables?limit=1. Reports export throughput, the growth of the process's
+resident memory during the export, and the latency of the concurrent
+requests against the same requests with no export running.
+
+With --archive-ratio, that fraction of the closed bills is moved to the
+memory storage's archive first, so the export reads both tiers.
+
+Usage: python benchmarks/bench_export.py [--restaurants 10] [--tables 20] [--bills 500] [--storage memory]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SPLITPAY_SAMPLE_DATA", "0")
+
+import routes
+from archive import BillArchive
+from seed import SeedConfig, seed_storage
+from storage import MemStorage
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def export(path: str) -> dict:
+    """Drive the app directly, discarding the body, so no client buffers it"""
+    sent = 0
+    peak = rss_mb()
+    requested = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal sent, peak
+        if message["type"] == "http.response.body":
+            sent += len(message.get("body", b""))
+            peak = max(peak, rss_mb())
+            if not message.get("more_body", False):
+                finished.set()
+
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    before = rss_mb()
+    start = time.perf_counter()
+    await routes.app(scope, receive, send)
+    return {"bytes": sent, "seconds": time.perf_counter() - start, "rss_growth": peak - before}
+
+
+async def ping(client: httpx.AsyncClient, latencies: list, done: asyncio.Event):
+    while not done.is_set():
+        start = time.perf_counter()
+        await client.get("/api/tables?limit=1")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+def percentiles(latencies: list) -> str:
+    latencies = sorted(latencies)
+    return (f"p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms  p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms  "
+            f"max {latencies[-1] * 1000:6.2f} ms")
+
+
+async def run(options):
+    directory = tempfile.mkdtemp()
+    if options.storage == "sqlite":
+        from sqlite_storage import SqliteStorage
+        storage = SqliteStorage(os.path.join(directory, "export.db"))
+    else:
+        storage = MemStorage(BillArchive(os.path.join(directory, "archive")), archive_after=0, sample_data=False)
+    routes.storage = storage
+    counts = await seed_storage(storage, SeedConfig(
+        restaurants=options.restaurants, tables=options.tables, bills=options.bills, seed=1
+    ))
+    if options.storage == "memory" and options.archive_ratio > 0:
+        closed = [bill.id for bill in storage.bills.values() if not bill.is_active or bill.status == "paid"]
+        storage._closed_bills.update((bill_id, 0.0) for bill_id in closed[:int(len(closed) * options.archive_ratio)])
+        while await storage.archive_closed_bills(1000, 1.0):
+            pass
+    print(", ".join(f"{count} {name}" for name, count in counts.items()), f"({options.storage} storage)")
+
+    transport = httpx.ASGITransport(app=routes.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle: list = []
+        done = asyncio.Event()
+        pinger = asyncio.create_task(ping(client, idle, done))
+        await asyncio.sleep(2)
+        done.set()
+        await pinger
+        print(f"  concurrent requests, idle      {percentiles(idle)}")
+
+        for query in ("format=ndjson", "format=csv&records=items"):
+            busy: list = []
+            done = asyncio.Event()
+            pinger = asyncio.create_task(ping(client, busy, done))
+            result = await export(f"/api/export/bills?{query}")
+            done.set()
+            await pinger
+            print(f"  {query:<25} {result['bytes'] / 1e6:8.1f} MB in {result['seconds']:5.1f} s "
+                  f"({result['bytes'] / 1e6 / result['seconds']:5.1f} MB/s), resident memory {result['rss_growth']:+.1f} MB")
+            print(f"  concurrent requests, exporting {percentiles(busy)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--storage", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--restaurants", type=int, default=10)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--bills", type=int, default=500)
+    parser.add_argument("--archive-ratio", type=float, default=0.5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
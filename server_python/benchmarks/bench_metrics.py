@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Metrics overhead benchmark: the cost per request of MetricsMiddleware and
+per call of the storage method wrappers, against the same calls
+uninstrumented.
+
+The middleware is measured around a bare ASGI app that sends an empty
+response, so the difference is the middleware alone; storage wrappers
+around MemStorage.get_table.
+
+Usage: python benchmarks/bench_metrics.py [--calls 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metrics import MetricsMiddleware, instrument_storage
+from storage import IStorage, MemStorage
+
+
+class _Route:
+    path = "/api/tables/{table_id}"
+
+
+async def bare_app(scope, receive, send):
+    scope["route"] = _Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def per_call(fn, calls: int) -> float:
+    """Best of three runs, in microseconds per call"""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(calls):
+            await fn()
+        best = min(best, (time.perf_counter() - start) / calls * 1e6)
+    return best
+
+
+async def bench_middleware(calls: int):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def request(app):
+        return lambda: app({"type": "http", "method": "GET", "path": "/api/tables/1"}, receive, send)
+
+    bare = await per_call(request(bare_app), calls)
+    wrapped = await per_call(request(MetricsMiddleware(bare_app)), calls)
+    print(f"middleware:      {bare:6.2f} us bare, {wrapped:6.2f} us instrumented, {wrapped - bare:+.2f} us per request")
+
+
+async def bench_storage(calls: int):
+    storage = MemStorage()
+    table = (await storage.get_all_tables())[0]
+    bare = await per_call(lambda: storage.get_table(table.id), calls)
+    instrument_storage(storage, IStorage)
+    wrapped = await per_call(lambda: storage.get_table(table.id), calls)
+    print(f"storage wrapper: {bare:6.2f} us bare, {wrapped:6.2f} us instrumented, {wrapped - bare:+.2f} us per call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    asyncio.run(bench_middleware(args.calls))
+    asyncio.run(bench_storage(args.calls))
+
+
+if __name__ == "__main__":
+    main()
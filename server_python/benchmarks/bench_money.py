@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the create_payment money path: the old float parse/format
+round trip on string amounts against the integer-cents arithmetic storage
+uses now, plus end-to-end POST /api/payments handler throughput.
+
+Usage: python benchmarks/bench_money.py [--payments 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import routes
+from money import format_cents
+from schemas import Bill, BillItemCreate, PaymentCreate
+from storage import MemStorage, payment_bill_updates
+
+
+def legacy_payment_bill_updates(bill: dict, payment: dict) -> dict:
+    """The float-based update create_payment used to compute on string amounts"""
+    total_amount = float(payment["amount"]) + float(payment["tip"] or "0")
+    new_paid = float(bill["paid"] or "0") + total_amount
+    new_remaining = float(bill["total"]) - new_paid
+
+    status_value = "unpaid"
+    if new_remaining <= 0:
+        status_value = "paid"
+    elif new_paid > 0:
+        status_value = "partial"
+
+    return {
+        "paid": f"{new_paid:.2f}",
+        "remaining": f"{max(0, new_remaining):.2f}",
+        "status": status_value,
+    }
+
+
+def bench_arithmetic(payments: int):
+    legacy_bill = {"paid": "0", "total": "999999.99"}
+    legacy_payment = {"amount": "0.10", "tip": "0.05"}
+    start = time.perf_counter()
+    for _ in range(payments):
+        legacy_bill.update(legacy_payment_bill_updates(legacy_bill, legacy_payment))
+    legacy = time.perf_counter() - start
+
+    bill = Bill(id="bench", table_id="bench", total="999999.99", remaining="999999.99")
+    payment = PaymentCreate(bill_id="bench", amount="0.10", tip="0.05", items=[])
+    start = time.perf_counter()
+    for _ in range(payments):
+        updates = payment_bill_updates(bill, payment)
+        bill.paid = updates["paid"]
+    cents = time.perf_counter() - start
+
+    print(f"bill update arithmetic ({payments} payments):")
+    print(f"  float/str (before) {payments / legacy:>12.0f} ops/s  paid={legacy_bill['paid']}")
+    print(f"  cents (after)      {payments / cents:>12.0f} ops/s  paid={format_cents(bill.paid)}")
+
+
+async def bench_endpoint(payments: int):
+    storage = MemStorage()
+    routes.storage = storage
+    table = await storage.get_table_by_number(7, "bella-vista")
+    bill = await storage.get_bill_by_table_id(table.id)
+    # An item with a hundredth left for each payment, which may not overpay it
+    item, = await storage.create_bill_items([
+        BillItemCreate(bill_id=bill.id, name="Bench Item", price="0.10", quantity=format_cents(payments)),
+    ])
+
+    start = time.perf_counter()
+    for _ in range(payments):
+        await routes.create_payment(PaymentCreate(
+            bill_id=bill.id, amount="0.10", tip="0.05",
+            items=[{"itemId": item.id, "quantity": 0.01}],
+        ))
+    elapsed = time.perf_counter() - start
+    print(f"POST /api/payments handler: {payments / elapsed:.0f} payments/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--payments", type=int, default=100000)
+    args = parser.parse_args()
+
+    bench_arithmetic(args.payments)
+    asyncio.run(bench_endpoint(args.payments // 10))
+
+
+if __name__ == "__main__":
+    main()
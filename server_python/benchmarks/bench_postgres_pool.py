@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Size the PostgreSQL connection pool under concurrent QR load: for each pool
+size, a fixed number of concurrent clients scan table QR codes (and, with
+--payment-ratio, pay) through the route handlers. Reports throughput and
+latency percentiles per pool size; past the point where the database is
+busy, a larger pool only adds waiting inside Postgres.
+
+Needs a PostgreSQL server; the schema is created if missing and the tables
+seeded under a restaurant name of their own, so a scratch database is best.
+
+Usage: python benchmarks/bench_postgres_pool.py [--dsn postgresql://localhost/splitpay_bench]
+       [--pool-sizes 2 5 10 20] [--clients 64] [--requests 5000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SPLITPAY_SAMPLE_DATA", "0")
+
+from starlette.requests import Request
+
+import routes
+from postgres_storage import PostgresStorage
+from schemas import TableCreate, BillCreate, BillItemCreate, PaymentCreate
+
+# Handlers that honour If-None-Match take the request; these carry no headers
+EMPTY_REQUEST = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+
+async def populate(storage: PostgresStorage, restaurant: str, tables: int, items_per_bill: int):
+    bill_ids = []
+    for number in range(1, tables + 1):
+        table = await storage.create_table(TableCreate(
+            number=number,
+            restaurant_name=restaurant,
+            qr_code=f"https://splitbill.app/t/{number}/{restaurant}",
+        ))
+        bill = await storage.create_bill(BillCreate(table_id=table.id, total="1000.00", remaining="1000.00"))
+        await storage.create_bill_items([
+            BillItemCreate(bill_id=bill.id, name=f"Dish {i}", price="12.50") for i in range(items_per_bill)
+        ])
+        bill_ids.append(bill.id)
+    return bill_ids
+
+
+async def load(options, restaurant: str, bill_ids: list) -> list:
+    """Run the requests from `clients` concurrent loops; returns each request's latency"""
+    latencies = []
+    issued = 0
+    payment_every = round(1 / options.payment_ratio) if options.payment_ratio > 0 else 0
+
+    async def client():
+        nonlocal issued
+        while issued < options.requests:
+            i = issued
+            issued += 1
+            start = time.perf_counter()
+            if payment_every and i % payment_every == 0:
+                await routes.create_payment(PaymentCreate(bill_id=bill_ids[i % len(bill_ids)], amount="0.01", items=[]))
+            else:
+                await routes.get_bill_via_qr(i % options.tables + 1, restaurant, EMPTY_REQUEST)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(options.clients)))
+    return latencies
+
+
+async def run(options):
+    restaurant = f"bench-{uuid.uuid4().hex[:8]}"
+    seeding = PostgresStorage(options.dsn, min_size=1, max_size=4)
+    try:
+        bill_ids = await populate(seeding, restaurant, options.tables, options.items)
+    finally:
+        await seeding.aclose()
+    print(f"{options.tables} tables with {options.items} items each ({restaurant}), "
+          f"{options.clients} concurrent clients, {options.requests} requests per pool size")
+
+    for size in options.pool_sizes:
+        storage = PostgresStorage(options.dsn, min_size=size, max_size=size)
+        routes.storage = storage
+        try:
+            # Warm up: open every connection and prepare the statements on them
+            await load(argparse.Namespace(**{**vars(options), "requests": size * 20}), restaurant, bill_ids)
+            start = time.perf_counter()
+            latencies = sorted(await load(options, restaurant, bill_ids))
+            elapsed = time.perf_counter() - start
+        finally:
+            await storage.aclose()
+        print(f"  pool {size:>3}  {len(latencies) / elapsed:>8.0f} req/s  "
+              f"p50 {latencies[len(latencies) // 2] * 1000:7.2f} ms  "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.2f} ms  "
+              f"conflicts {storage.payment_conflicts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dsn", default=os.getenv("SPLITPAY_POSTGRES_DSN", "postgresql://localhost/splitpay_bench"))
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[2, 5, 10, 20])
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--payment-ratio", type=float, default=0.1, help="fraction of requests that are payments")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
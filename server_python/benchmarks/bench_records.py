@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Memory per record and read latency of the slotted records MemStorage keeps
+against the Pydantic API models it used to store directly.
+
+Usage: python benchmarks/bench_records.py [--records 100000] [--reads 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from records import BillItemRecord, PaymentRecord
+from schemas import BillItem, Payment
+from storage import MemStorage
+
+
+def item_fields(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "bill_id": "bench-bill",
+        "name": f"Item {i}",
+        "price": 1250 + i % 100,
+        "quantity": 100,
+        "paid_quantity": 0,
+    }
+
+
+def payment_fields(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "bill_id": "bench-bill",
+        "amount": 2000 + i % 100,
+        "tip": 100,
+        "items": [{"itemId": "bench-item", "quantity": 1}],
+        "payment_method": "card",
+        "status": "completed",
+        "processed_at": datetime.now(),
+    }
+
+
+def measure(label: str, build, count: int):
+    """Bytes allocated per object for `count` objects built by `build`"""
+    # Field values are created up front so only the objects themselves count
+    fields = [build[1](i) for i in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build[0](**f) for f in fields]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list holding them is not part of the record cost
+    per_object = (after - before - sys.getsizeof(objects)) / count
+    print(f"  {label:<28} {per_object:>8.0f} bytes/record")
+    return objects
+
+
+def bench_memory(count: int):
+    print(f"memory ({count} records each):")
+    measure("BillItem (pydantic)", (BillItem, item_fields), count)
+    measure("BillItemRecord (slots)", (BillItemRecord, item_fields), count)
+    measure("Payment (pydantic)", (Payment, payment_fields), count)
+    measure("PaymentRecord (slots)", (PaymentRecord, payment_fields), count)
+
+
+def bench_attribute_reads(reads: int):
+    fields = item_fields(0)
+    model = BillItem(**fields)
+    record = BillItemRecord(**fields)
+
+    print(f"attribute reads ({reads} x price/quantity/paid_quantity):")
+    for label, obj in (("BillItem (pydantic)", model), ("BillItemRecord (slots)", record)):
+        start = time.perf_counter()
+        for _ in range(reads):
+            obj.price * obj.quantity - obj.paid_quantity
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<28} {elapsed / reads * 1e9:>8.1f} ns/read")
+
+
+async def bench_storage_reads(reads: int):
+    storage = MemStorage()
+    table = await storage.get_table_by_number(7, "bella-vista")
+    bill = await storage.get_bill_by_table_id(table.id)
+
+    print(f"storage reads ({reads} each):")
+    for label, call in (
+        ("get_bill", lambda: storage.get_bill(bill.id)),
+        ("get_bill_with_items", lambda: storage.get_bill_with_items(bill.id)),
+        ("get_dashboard_tables", lambda: storage.get_dashboard_tables("bella-vista")),
+    ):
+        start = time.perf_counter()
+        for _ in range(reads):
+            await call()
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<28} {elapsed / reads * 1e6:>8.2f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--reads", type=int, default=200000)
+    args = parser.parse_args()
+
+    bench_memory(args.records)
+    bench_attribute_reads(args.reads)
+    asyncio.run(bench_storage_reads(args.reads // 10))
+
+
+if __name__ == "__main__":
+    main()
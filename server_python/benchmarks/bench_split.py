@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the split engine behind POST /api/bills/{id}/split: per-call
+latency of compute_split for each mode on a bill of --items items split
+between --guests guests, and end-to-end handler latency (request
+validation, derived totals and response model included).
+
+In the by_item and mixed workloads every guest claims a run of items of
+their own plus a few items shared by the whole table, with and without
+explicit quantities, so residues are spread over many parts.
+
+Usage: python benchmarks/bench_split.py [--guests 20] [--items 80] [--repeat 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import routes
+from schemas import BillCreate, BillItemCreate, PaymentCreate, SplitRequest, TableCreate
+from split import compute_split
+from storage import MemStorage
+
+SHARED_ITEMS = 5
+
+
+async def populate(storage: MemStorage, items: int) -> tuple:
+    table = await storage.create_table(TableCreate(number=1, restaurant_name="bench", qr_code="bench"))
+    bill = await storage.create_bill(BillCreate(table_id=table.id, total="0", remaining="0"))
+    records = await storage.create_bill_items([
+        BillItemCreate(bill_id=bill.id, name=f"Dish {i}", price=f"{7 + i % 13}.{i % 100:02d}", quantity=str(1 + i % 3))
+        for i in range(items)
+    ])
+    # Part of the first item is already paid, as on a table mid-checkout
+    await storage.apply_payment(PaymentCreate(bill_id=bill.id, amount="1.00", items=[{"itemId": records[0].id, "quantity": 0.33}]))
+    return bill.id, [record.id for record in records]
+
+
+def requests(guests: int, item_ids: list) -> dict:
+    shared, own = item_ids[:SHARED_ITEMS], item_ids[SHARED_ITEMS:]
+    per_guest = len(own) // guests
+    claims = [
+        [{"item_id": item_id} for item_id in shared]
+        + [{"item_id": item_id, "quantity": "1"} if i % 2 else {"item_id": item_id}
+           for i, item_id in enumerate(own[g * per_guest:(g + 1) * per_guest])]
+        for g in range(guests)
+    ]
+    percentages = [10000 // guests + (1 if g < 10000 % guests else 0) for g in range(guests)]
+    return {
+        "even": {"mode": "even", "guests": [{"name": f"Guest {g}"} for g in range(guests)]},
+        "by_percentage": {"mode": "by_percentage", "guests": [
+            {"name": f"Guest {g}", "percentage": f"{percentages[g] // 100}.{percentages[g] % 100:02d}"} for g in range(guests)
+        ]},
+        "by_item": {"mode": "by_item", "guests": [{"name": f"Guest {g}", "items": claims[g]} for g in range(guests)]},
+        "mixed": {"mode": "mixed", "guests": [{"name": f"Guest {g}", "items": claims[g][:SHARED_ITEMS + 2]} for g in range(guests)]},
+    }
+
+
+async def run(options):
+    storage = MemStorage(sample_data=False)
+    routes.storage = storage
+    bill_id, item_ids = await populate(storage, options.items)
+    totals = await storage.get_bill_totals(bill_id)
+    print(f"{options.guests} guests x {options.items} items, {options.repeat} calls per mode")
+
+    for mode, body in requests(options.guests, item_ids).items():
+        request = SplitRequest.model_validate(body)
+        claims = sum(len(guest.items) for guest in request.guests)
+        split = compute_split(totals, request)
+        assert sum(share.amount for share in split.shares) + split.unassigned == totals.remaining
+
+        start = time.perf_counter()
+        for _ in range(options.repeat):
+            compute_split(totals, request)
+        engine = (time.perf_counter() - start) / options.repeat
+
+        start = time.perf_counter()
+        for _ in range(options.repeat):
+            await routes.split_bill(bill_id, SplitRequest.model_validate(body))
+        handler = (time.perf_counter() - start) / options.repeat
+
+        print(f"  {mode:<14} {claims:>5} claims  engine {engine * 1e6:8.1f} us  handler {handler * 1e6:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guests", type=int, default=20)
+    parser.add_argument("--items", type=int, default=80)
+    parser.add_argument("--repeat", type=int, default=2000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compare MemStorage and SqliteStorage (and PostgresStorage, given a database)
+on the QR scan and payment endpoints.
+
+Usage: python benchmarks/bench_storage_backends.py [--tables 200] [--requests 2000] [--postgres-dsn DSN]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Make the server_python modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from starlette.requests import Request
+
+import routes
+from schemas import TableCreate, BillCreate, BillItemCreate, PaymentCreate
+from storage import MemStorage
+from sqlite_storage import SqliteStorage
+
+RESTAURANT = "bench-bistro"
+
+# Handlers that honour If-None-Match take the request; these carry no headers
+EMPTY_REQUEST = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+
+async def populate(storage, tables: int, items_per_bill: int):
+    bill_ids = []
+    for number in range(1, tables + 1):
+        table = await storage.create_table(TableCreate(
+            number=number,
+            restaurant_name=RESTAURANT,
+            qr_code=f"https://splitbill.app/t/{number}/{RESTAURANT}",
+        ))
+        bill = await storage.create_bill(BillCreate(table_id=table.id, total="1000.00", remaining="1000.00"))
+        for i in range(items_per_bill):
+            await storage.create_bill_item(BillItemCreate(bill_id=bill.id, name=f"Dish {i}", price="12.50"))
+        bill_ids.append(bill.id)
+    return bill_ids
+
+
+async def timed(label: str, count: int, make_call):
+    start = time.perf_counter()
+    for i in range(count):
+        await make_call(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<10} {count / elapsed:>10.0f} req/s  {elapsed / count * 1e6:>8.1f} us/req")
+
+
+async def bench(name: str, storage, args):
+    routes.storage = storage
+    bill_ids = await populate(storage, args.tables, args.items)
+    print(f"{name}:")
+
+    await timed("qr", args.requests, lambda i: routes.get_bill_via_qr(i % args.tables + 1, RESTAURANT, EMPTY_REQUEST))
+    await timed("payment", args.requests, lambda i: routes.create_payment(PaymentCreate(
+        bill_id=bill_ids[i % len(bill_ids)], amount="0.01", items=[],
+    )))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--postgres-dsn", help="also run against this (scratch) PostgreSQL database")
+    args = parser.parse_args()
+
+    await bench("MemStorage", MemStorage(), args)
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite = SqliteStorage(os.path.join(tmp, "bench.db"))
+        try:
+            await bench("SqliteStorage", sqlite, args)
+        finally:
+            sqlite.close()
+    if args.postgres_dsn:
+        from postgres_storage import PostgresStorage
+        postgres = PostgresStorage(args.postgres_dsn)
+        try:
+            await bench("PostgresStorage", postgres, args)
+        finally:
+            await postgres.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Write-ahead log benchmark: payment throughput under each fsync policy, and
+recovery time for a large log, replayed in full and from a snapshot plus a
+10% tail.
+
+Each payment logs three events (the payment, its item and its bill).
+
+Usage: python benchmarks/bench_wal.py [--events 1000000] [--payments 5000] [--concurrency 64]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from money import format_cents
+from schemas import BillItemCreate, PaymentCreate
+from storage import MemStorage
+from wal import FSYNC_POLICIES, WriteAheadLog
+
+
+async def pay(storage: MemStorage, payments: int, concurrency: int):
+    table = await storage.get_table_by_number(7, "bella-vista")
+    bill = await storage.get_bill_by_table_id(table.id)
+    # An item with a hundredth left for each payment, which may not overpay it
+    item, = await storage.create_bill_items([
+        BillItemCreate(bill_id=bill.id, name="Bench Item", price="0.10", quantity=format_cents(payments)),
+    ])
+    payment = PaymentCreate(bill_id=bill.id, amount="0.10", items=[{"itemId": item.id, "quantity": 0.01}])
+
+    async def worker(count: int):
+        for _ in range(count):
+            await storage.apply_payment(payment)
+
+    await asyncio.gather(*(worker(payments // concurrency) for _ in range(concurrency)))
+
+
+async def bench_policies(payments: int, concurrency: int):
+    print(f"apply_payment throughput ({payments} payments, {concurrency} concurrent):")
+    for policy in ("memory only",) + FSYNC_POLICIES:
+        directory = tempfile.mkdtemp()
+        try:
+            wal = None if policy == "memory only" else WriteAheadLog(directory, fsync=policy)
+            storage = MemStorage(wal=wal)
+            start = time.perf_counter()
+            await pay(storage, payments, concurrency)
+            elapsed = time.perf_counter() - start
+            print(f"  {policy:<12} {payments / elapsed:>10.0f} payments/s")
+        finally:
+            shutil.rmtree(directory)
+
+
+async def write_events(directory: str, events: int):
+    storage = MemStorage(wal=WriteAheadLog(directory, fsync="none"))
+    await pay(storage, events // 3, 64)
+    await storage.wal.close()
+
+
+def timed_recovery(directory: str) -> MemStorage:
+    start = time.perf_counter()
+    storage = MemStorage(wal=WriteAheadLog(directory))
+    elapsed = time.perf_counter() - start
+    log_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".log"))
+    print(f"  {elapsed:.2f} s to lsn {storage.wal.lsn} ({log_bytes / 1e6:.0f} MB of log)")
+    return storage
+
+
+async def bench_recovery(events: int):
+    directory = tempfile.mkdtemp()
+    try:
+        await write_events(directory, events)
+        print(f"recovery, full replay of {events} events:")
+        storage = timed_recovery(directory)
+
+        await storage.snapshot()
+        await pay(storage, events // 30, 64)
+        await storage.wal.close()
+        print(f"recovery, snapshot plus {events // 10} event tail:")
+        timed_recovery(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--payments", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    asyncio.run(bench_policies(args.payments, args.concurrency))
+    asyncio.run(bench_recovery(args.events))
+
+
+if __name__ == "__main__":
+    main()
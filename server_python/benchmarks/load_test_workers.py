@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Load test of the production launcher (serve.py) on the SQLite backend:
+requests per second on the QR and payment endpoints as the worker count
+grows.
+
+A fresh database is seeded with one restaurant of --tables tables, each
+with an open bill. For each worker count the server is started, then
+--clients load-generating processes keep --concurrency requests in flight
+each for --duration seconds per endpoint.
+
+Usage: python benchmarks/load_test_workers.py [--workers 1 2 4] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, SERVER_DIR)
+
+from schemas import BillCreate, BillItemCreate, TableCreate
+from sqlite_storage import SqliteStorage
+
+RESTAURANT = "load-test"
+
+
+async def seed(path: str, tables: int) -> list:
+    storage = SqliteStorage(path)
+    bill_ids = []
+    for number in range(1, tables + 1):
+        table = await storage.create_table(TableCreate(number=number, restaurant_name=RESTAURANT, qr_code=f"QR-{number}"))
+        bill = await storage.create_bill(BillCreate(table_id=table.id, total="0", remaining="0"))
+        await storage.create_bill_items([
+            BillItemCreate(bill_id=bill.id, name=f"Item {i}", price="12.50", quantity="2") for i in range(5)
+        ])
+        bill_ids.append(bill.id)
+    storage.close()
+    return bill_ids
+
+
+def start_server(path: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, SPLITPAY_STORAGE="sqlite", SPLITPAY_SQLITE_PATH=path)
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--port", str(port), "--workers", str(workers)],
+        cwd=SERVER_DIR, env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/storage/stats").status_code == 200:
+                # Give every worker time to finish starting, not just the first
+                time.sleep(1 + workers * 0.5)
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("Server did not start")
+
+
+async def generate_load(port: int, endpoint: str, tables: int, bill_ids: list, concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                if endpoint == "qr":
+                    response = await client.get(f"/api/qr/{random.randint(1, tables)}/{RESTAURANT}")
+                else:
+                    response = await client.post("/api/payments", json={
+                        "bill_id": random.choice(bill_ids), "amount": "0.01", "items": [],
+                    })
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(generate_load(*args))
+
+
+def run_endpoint(pool, port: int, endpoint: str, options, bill_ids: list):
+    jobs = [(port, endpoint, options.tables, bill_ids, options.concurrency, options.duration)] * options.clients
+    results = pool.map(client_process, jobs)
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"  {endpoint:<8} {len(latencies) / options.duration:>9.0f} req/s  p50 {p50:6.1f} ms  p99 {p99:6.1f} ms  errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--tables", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    options = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs; {options.clients} client processes x {options.concurrency} in flight")
+    with multiprocessing.get_context("spawn").Pool(options.clients) as pool:
+        for workers in options.workers:
+            directory = tempfile.mkdtemp()
+            path = os.path.join(directory, "load.db")
+            bill_ids = asyncio.run(seed(path, options.tables))
+            server = start_server(path, options.port, workers)
+            try:
+                print(f"{workers} worker(s):")
+                run_endpoint(pool, options.port, "qr", options, bill_ids)
+                run_endpoint(pool, options.port, "payment", options, bill_ids)
+            finally:
+                server.terminate()
+                server.wait()
+                shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
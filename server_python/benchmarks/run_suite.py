@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: drives the FastAPI app in-process with a restaurant
+workload and reports requests/s and p50/p95/p99 latency per endpoint.
+
+The app is served through httpx's ASGI transport (default) or a uvicorn
+server started in this process. The workload is --restaurants restaurants
+of --tables tables, each with an open bill of --items items, and:
+
+  qr         guests scanning table QR codes
+  items      GET /api/bills/{id}/items
+  dashboard  staff refreshing /api/dashboard/tables, per restaurant and overall
+  payments   every bill split between --guests guests paying concurrently
+
+Results are written to JSON so runs can be compared across commits:
+
+  python benchmarks/run_suite.py --output before.json
+  python benchmarks/run_suite.py --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import routes
+from money import format_cents, line_total
+from schemas import BillCreate, BillItemCreate, TableCreate
+from storage import MemStorage
+
+MENU = [("Margherita", 1250), ("Carbonara", 1475), ("Caesar Salad", 950), ("Tiramisu", 725),
+        ("Espresso", 250), ("House Red", 3200), ("Bruschetta", 850), ("Risotto", 1625)]
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Latencies and error counts per endpoint"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.elapsed = {}
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return response
+
+    def results(self) -> dict:
+        results = {}
+        for endpoint, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            results[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": round(len(latencies) / self.elapsed[endpoint], 1),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            }
+        return results
+
+
+async def populate(storage, options) -> list:
+    """Create the restaurants, tables and open bills; returns (restaurant, number, bill_id, items)"""
+    rng = random.Random(options.seed)
+    tables = []
+    for r in range(options.restaurants):
+        restaurant = f"restaurant-{r}"
+        for number in range(1, options.tables + 1):
+            table = await storage.create_table(TableCreate(
+                number=number, restaurant_name=restaurant, qr_code=f"https://splitbill.app/t/{number}/{restaurant}",
+            ))
+            bill = await storage.create_bill(BillCreate(table_id=table.id, total="0", remaining="0", guest_count=options.guests))
+            items = await storage.create_bill_items([
+                BillItemCreate(bill_id=bill.id, name=name, price=format_cents(price), quantity=str(rng.randint(1, 3)))
+                for name, price in (rng.choice(MENU) for _ in range(options.items))
+            ])
+            tables.append((restaurant, number, bill.id, items))
+    return tables
+
+
+async def run_phase(recorder: Recorder, endpoint: str, concurrency: int, calls):
+    """Run the coroutine factories in `calls` with `concurrency` in flight"""
+    queue = list(reversed(calls))
+
+    async def worker():
+        while queue:
+            await queue.pop()()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    recorder.elapsed[endpoint] = time.perf_counter() - start
+
+
+async def run_workload(client: httpx.AsyncClient, tables: list, options) -> dict:
+    rng = random.Random(options.seed)
+    recorder = Recorder()
+    qr = "GET /api/qr/{table_number}/{restaurant}"
+    items = "GET /api/bills/{id}/items"
+    dashboard = "GET /api/dashboard/tables"
+    payments = "POST /api/payments"
+
+    def qr_call(restaurant, number):
+        return lambda: recorder.request(client, qr, "GET", f"/api/qr/{number}/{restaurant}")
+
+    def items_call(bill_id):
+        return lambda: recorder.request(client, items, "GET", f"/api/bills/{bill_id}/items")
+
+    def dashboard_call(restaurant):
+        params = {"restaurant": restaurant} if restaurant else {}
+        return lambda: recorder.request(client, dashboard, "GET", "/api/dashboard/tables", params=params)
+
+    picks = [rng.choice(tables) for _ in range(options.requests)]
+    await run_phase(recorder, qr, options.concurrency, [qr_call(r, n) for r, n, _, _ in picks])
+    await run_phase(recorder, items, options.concurrency, [items_call(b) for _, _, b, _ in picks])
+    restaurants = sorted({r for r, _, _, _ in tables})
+    await run_phase(recorder, dashboard, options.concurrency, [
+        dashboard_call(None if i % 10 == 0 else rng.choice(restaurants)) for i in range(max(1, options.requests // 10))
+    ])
+
+    # Each guest pays for a share of every item on their table's bill, all
+    # guests of a table at once
+    calls = []
+    for _, _, bill_id, bill_items in tables:
+        for guest in range(options.guests):
+            # Shares in whole hundredths, the last guest taking the remainder,
+            # so the guests never pay for more of an item than there is
+            shares = [
+                {"itemId": item.id, "quantity": format_cents(item.quantity // options.guests + (
+                    item.quantity % options.guests if guest == options.guests - 1 else 0))}
+                for item in bill_items
+            ]
+            amount = sum(line_total(item.price, item.quantity) for item in bill_items) // options.guests
+            calls.append(lambda bill_id=bill_id, shares=shares, amount=amount: recorder.request(
+                client, payments, "POST", "/api/payments",
+                json={"bill_id": bill_id, "amount": format_cents(amount), "items": shares},
+            ))
+    await run_phase(recorder, payments, options.concurrency, calls)
+    return recorder.results()
+
+
+async def serve_uvicorn(port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(routes.app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def run(options) -> dict:
+    if options.storage == "sqlite":
+        from sqlite_storage import SqliteStorage
+        directory = tempfile.mkdtemp()
+        storage = SqliteStorage(os.path.join(directory, "suite.db"))
+    else:
+        storage = MemStorage()
+    routes.storage = storage
+    tables = await populate(storage, options)
+
+    limits = httpx.Limits(max_connections=options.concurrency, max_keepalive_connections=options.concurrency)
+    if options.transport == "uvicorn":
+        server, task = await serve_uvicorn(options.port)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{options.port}", limits=limits, timeout=60) as client:
+                return await run_workload(client, tables, options)
+        finally:
+            server.should_exit = True
+            await task
+    async with routes.app.router.lifespan_context(routes.app):
+        transport = httpx.ASGITransport(app=routes.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://suite", limits=limits, timeout=60) as client:
+            return await run_workload(client, tables, options)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(endpoints: dict, baseline: dict = None):
+    print(f"{'endpoint':<42} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for endpoint, result in endpoints.items():
+        line = (f"{endpoint:<42} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} "
+                f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7}")
+        before = (baseline or {}).get(endpoint)
+        if before:
+            line += (f"   req/s {(result['rps'] / before['rps'] - 1) * 100:+.1f}%"
+                     f"  p99 {(result['p99_ms'] / before['p99_ms'] - 1) * 100:+.1f}%")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--storage", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--transport", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--restaurants", type=int, default=10)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--items", type=int, default=8)
+    parser.add_argument("--guests", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    options = parser.parse_args()
+
+    endpoints = asyncio.run(run(options))
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(options).items() if key not in ("output", "compare")},
+        "endpoints": endpoints,
+    }
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)["endpoints"]
+    print_results(endpoints, baseline)
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {options.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Fire thousands of concurrent payments at a handful of bills and check that
+no update is lost: every bill's paid total and every item's paid quantity
+must match the sum of the payments applied to it.
+
+Usage: python benchmarks/stress_concurrent_payments.py [--payments 5000] [--bills 6]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import routes
+from money import to_cents, format_cents
+from schemas import TableCreate, BillCreate, BillItemCreate, PaymentCreate
+from storage import MemStorage
+from sqlite_storage import SqliteStorage
+
+AMOUNT = "1.25"
+QUANTITY = "0.25"
+
+
+async def stress(name: str, storage, args) -> bool:
+    routes.storage = storage
+
+    bills = []
+    for number in range(1, args.bills + 1):
+        table = await storage.create_table(TableCreate(
+            number=number, restaurant_name="stress", qr_code=f"https://splitbill.app/t/{number}/stress",
+        ))
+        total = format_cents(to_cents(AMOUNT) * args.payments)
+        bill = await storage.create_bill(BillCreate(table_id=table.id, total=total, remaining=total))
+        item = await storage.create_bill_item(BillItemCreate(
+            bill_id=bill.id, name="Tasting Menu", price=AMOUNT, quantity=str(args.payments),
+        ))
+        bills.append((bill.id, item.id))
+
+    payments = [
+        routes.create_payment(PaymentCreate(
+            bill_id=bill_id, amount=AMOUNT, items=[{"itemId": item_id, "quantity": QUANTITY}],
+        ))
+        for i in range(args.payments)
+        for bill_id, item_id in [bills[i % len(bills)]]
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*payments)
+    elapsed = time.perf_counter() - start
+
+    ok = True
+    for index, (bill_id, item_id) in enumerate(bills):
+        applied = len(range(index, args.payments, len(bills)))
+        bill = await storage.get_bill(bill_id)
+        item = await storage.get_bill_item(item_id)
+        recorded = await storage.get_payments_by_bill_id(bill_id)
+        if (bill.paid != to_cents(AMOUNT) * applied
+                or item.paid_quantity != to_cents(QUANTITY) * applied
+                or len(recorded) != applied):
+            ok = False
+            print(f"  bill {bill_id}: expected {applied} payments, got paid={format_cents(bill.paid)} "
+                  f"paid_quantity={format_cents(item.paid_quantity)} payments={len(recorded)}")
+
+    print(f"{name}: {args.payments} payments in {elapsed:.2f}s -> {'OK' if ok else 'LOST UPDATES'}")
+    return ok
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--payments", type=int, default=5000)
+    parser.add_argument("--bills", type=int, default=6)
+    args = parser.parse_args()
+
+    ok = await stress("MemStorage", MemStorage(), args)
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite = SqliteStorage(os.path.join(tmp, "stress.db"))
+        try:
+            ok = await stress("SqliteStorage", sqlite, args) and ok
+        finally:
+            sqlite.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
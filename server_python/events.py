@@ -0,0 +1,95 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+from pydantic import BaseModel
+
+# Topic every change is also published on, for unfiltered dashboards
+ALL = "*"
+
+
+def table_topic(table_id: str) -> str:
+    return f"table:{table_id}"
+
+
+def restaurant_topic(restaurant_name: str) -> str:
+    return f"restaurant:{restaurant_name}"
+
+
+class Subscription:
+    """A subscriber's bounded queue of pre-encoded SSE frames"""
+
+    def __init__(self, feed: "ChangeFeed", topic: str, max_pending: int):
+        self.feed = feed
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.feed.unsubscribe(self)
+
+    async def frames(self, keepalive: float = 15.0) -> AsyncIterator[bytes]:
+        """Yield SSE frames until the subscription is closed.
+
+        A subscriber that falls too far behind is closed by the feed; the
+        stream then ends and the client reconnects and refetches.
+        """
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                if self.closed and self.queue.empty():
+                    return
+                try:
+                    yield await asyncio.wait_for(self.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            self.close()
+
+
+class ChangeFeed:
+    """In-process pub/sub of storage changes.
+
+    Each change is encoded once and the same bytes are handed to every
+    subscriber of its topics, so fan-out cost does not depend on payload size.
+    """
+
+    def __init__(self, max_pending: int = 256):
+        self.max_pending = max_pending
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.max_pending)
+        self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.topic]
+
+    def has_subscribers(self, *topics: str) -> bool:
+        if not topics:
+            return bool(self._subscribers)
+        return any(topic in self._subscribers for topic in topics)
+
+    def publish(self, topics: Tuple[str, ...], event: str, data: str):
+        """Send an already JSON-encoded event to every subscriber of the topics"""
+        frame = f"event: {event}\ndata: {data}\n\n".encode()
+        for topic in topics:
+            for subscription in list(self._subscribers.get(topic, ())):
+                try:
+                    subscription.queue.put_nowait(frame)
+                except asyncio.QueueFull:
+                    subscription.close()
+
+    def publish_change(self, event: str, table_id: str, restaurant_name: Optional[str], model: BaseModel):
+        """Publish a changed record to its table, its restaurant and the global topic"""
+        topics = (ALL, table_topic(table_id))
+        if restaurant_name is not None:
+            topics += (restaurant_topic(restaurant_name),)
+        if not self.has_subscribers(*topics):
+            return
+        self.publish(topics, event, f'{{"table_id":{json.dumps(table_id)},"{event}":{model.model_dump_json()}}}')
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Bill export for end-of-day reconciliation: the bills of a restaurant started
+in a date range, with their items and payments, as NDJSON or CSV.
+
+NDJSON has one line per bill, the {"bill", "items", "payments"} document of
+IStorage.iter_bill_exports; CSV has one row per bill, item or payment (per
+--records). Both the API (GET /api/export/bills) and this CLI encode the
+documents in chunks as they are read, so memory use does not grow with the
+size of the export.
+
+As a CLI it exports from the backend configured by the environment
+(SPLITPAY_STORAGE, SPLITPAY_SQLITE_PATH, SPLITPAY_POSTGRES_DSN, SPLITPAY_WAL_DIR,
+SPLITPAY_ARCHIVE_DIR).
+
+Usage: SPLITPAY_STORAGE=sqlite python export.py [--restaurant R] [--start 2026-10-16] [--end 2026-10-17]
+       [--format ndjson|csv] [--records bills|items|payments] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from responses import dumps
+
+FORMATS = ("ndjson", "csv")
+
+# CSV columns by kind of record, from the documents' keys
+CSV_COLUMNS = {
+    "bills": ("id", "table_id", "start_time", "status", "total", "paid", "remaining", "guest_count", "is_active"),
+    "items": ("id", "bill_id", "name", "price", "quantity", "paid_quantity"),
+    "payments": ("id", "bill_id", "processed_at", "amount", "tip", "payment_method", "status", "items"),
+}
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# Encoded output is sent in chunks of about this size
+CHUNK_BYTES = 64 * 1024
+
+
+def local_time(value: Optional[datetime]) -> Optional[datetime]:
+    """A range bound as naive local time, which is how bill start times are stored"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+async def ndjson_chunks(documents: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    lines, size = [], 0
+    async for document in documents:
+        line = dumps(document) + b"\n"
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b"".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield b"".join(lines)
+
+
+def _csv_value(value):
+    # A payment's items are nested; they go in one cell as JSON
+    return json.dumps(value, separators=(",", ":")) if isinstance(value, (list, dict)) else value
+
+
+async def csv_chunks(documents: AsyncIterator[dict], records: str = "bills") -> AsyncIterator[bytes]:
+    columns = CSV_COLUMNS[records]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for document in documents:
+        rows = [document["bill"]] if records == "bills" else document[records]
+        for row in rows:
+            writer.writerow([_csv_value(row[column]) for column in columns])
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_chunks(documents: AsyncIterator[dict], format: str = "ndjson", records: str = "bills") -> AsyncIterator[bytes]:
+    """Encode bill export documents in the given format, chunk by chunk"""
+    if format == "csv":
+        return csv_chunks(documents, records)
+    return ndjson_chunks(documents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--restaurant")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="first start time included (ISO date or datetime)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="first start time excluded (ISO date or datetime)")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--records", choices=tuple(CSV_COLUMNS), default="bills", help="kind of CSV rows")
+    parser.add_argument("--output", help="file to write to (default: standard output)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SPLITPAY_SAMPLE_DATA", "0")
+    from storage import storage
+
+    async def run(out):
+        documents = storage.iter_bill_exports(args.restaurant, local_time(args.start), local_time(args.end))
+        try:
+            async for chunk in export_chunks(documents, args.format, args.records):
+                out.write(chunk)
+        finally:
+            if hasattr(storage, "aclose"):
+                await storage.aclose()
+
+    if args.output:
+        with open(args.output, "wb") as out:
+            asyncio.run(run(out))
+    else:
+        asyncio.run(run(sys.stdout.buffer))
+    if hasattr(storage, "close"):
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
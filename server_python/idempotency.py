@@ -0,0 +1,159 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class IdempotencyKeyReused(Exception):
+    """An idempotency key was sent again with a different request"""
+
+
+class IdempotencyStore:
+    """Size-bounded, TTL-expiring store of responses by idempotency key.
+
+    The first request with a key runs; its response body is stored with a
+    fingerprint of the request, and a retry with the same key gets that body
+    back without running again. A duplicate arriving while the first is
+    still running waits for it. Failures are not stored, so the next attempt
+    with the key runs again.
+
+    Entries expire `ttl` seconds after they were stored. The oldest go first
+    when there are more than `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expiry, fingerprint, body), in expiry order as the TTL is fixed
+        self._entries: "OrderedDict[str, Tuple[float, str, bytes]]" = OrderedDict()
+        self._running: Dict[str, Tuple[str, asyncio.Event]] = {}
+        self.replays = 0
+        self.waits = 0
+
+    def _expire(self, now: float):
+        while self._entries:
+            key, (expiry, _, _) = next(iter(self._entries.items()))
+            if expiry > now:
+                return
+            del self._entries[key]
+
+    async def run(self, key: str, fingerprint: str, execute: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, bool]:
+        """The response body for a key, and whether it was replayed rather than produced by `execute`.
+
+        Raises IdempotencyKeyReused if the key belongs to a request with
+        another fingerprint.
+        """
+        while True:
+            self._expire(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] != fingerprint:
+                    raise IdempotencyKeyReused(key)
+                self.replays += 1
+                return entry[2], True
+            running = self._running.get(key)
+            if running is None:
+                break
+            if running[0] != fingerprint:
+                raise IdempotencyKeyReused(key)
+            # Then replay its response, or run in its place if it failed
+            self.waits += 1
+            await running[1].wait()
+
+        done = asyncio.Event()
+        self._running[key] = (fingerprint, done)
+        try:
+            body = await execute()
+            self._entries[key] = (time.monotonic() + self.ttl, fingerprint, body)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return body, False
+        finally:
+            del self._running[key]
+            done.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "running": len(self._running),
+            "replays": self.replays,
+            "waits": self.waits,
+        }
+
+
+class SharedIdempotencyStore:
+    """IdempotencyStore for several worker processes, keeping its entries in storage.
+
+    `storage` is a SqliteStorage or PostgresStorage that the workers share.
+    The first request with a key claims it there; a retry reaching any
+    worker gets the stored response back. A duplicate in this process waits
+    for the first as in IdempotencyStore, and one in another process polls
+    every `poll_interval` seconds until the first stores its response or,
+    failing, releases the key.
+
+    A claim lasts `lease` seconds: if its worker dies before the request
+    finishes, a retry runs again after that. Stored responses expire after
+    `ttl` seconds.
+    """
+
+    def __init__(self, storage: Any, ttl: float = 24 * 3600, lease: float = 60.0, poll_interval: float = 0.05):
+        self.storage = storage
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._running: Dict[str, Tuple[str, asyncio.Event]] = {}
+        self.replays = 0
+        self.waits = 0
+
+    async def run(self, key: str, fingerprint: str, execute: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, bool]:
+        """The response body for a key, and whether it was replayed rather than produced by `execute`.
+
+        Raises IdempotencyKeyReused if the key belongs to a request with
+        another fingerprint.
+        """
+        claim = str(uuid.uuid4())
+        waited = False
+        while True:
+            running = self._running.get(key)
+            if running is not None:
+                if running[0] != fingerprint:
+                    raise IdempotencyKeyReused(key)
+                waited = True
+                await running[1].wait()
+                continue
+            claimed, stored_fingerprint, body = await self.storage.claim_idempotency_key(key, fingerprint, claim, self.lease)
+            if claimed:
+                break
+            if stored_fingerprint != fingerprint:
+                raise IdempotencyKeyReused(key)
+            if body is not None:
+                self.waits += waited
+                self.replays += 1
+                return body, True
+            # Running in another worker
+            waited = True
+            await asyncio.sleep(self.poll_interval)
+
+        self.waits += waited
+        done = asyncio.Event()
+        self._running[key] = (fingerprint, done)
+        try:
+            try:
+                body = await execute()
+            except BaseException:
+                await self.storage.release_idempotency_key(key, claim)
+                raise
+            await self.storage.store_idempotent_response(key, claim, body, self.ttl)
+            return body, False
+        finally:
+            del self._running[key]
+            done.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": len(self._running),
+            "replays": self.replays,
+            "waits": self.waits,
+        }
@@ -0,0 +1,255 @@
+import bisect
+import inspect
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterSeries:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class GaugeSeries(CounterSeries):
+    __slots__ = ()
+
+    def dec(self, amount: int = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """A named family of series, one per combination of label values.
+
+    Updates are plain attribute arithmetic with no locking: every update is
+    made on the event loop thread (storage calls are timed around their
+    awaits, not in executor threads), so they cannot interleave. Callers on
+    a hot path hold on to the series returned by labels() instead of looking
+    it up on every update.
+    """
+
+    type = ""
+    series_class: type = CounterSeries
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.series: Dict[Tuple[str, ...], object] = {}
+
+    def _new_series(self):
+        return self.series_class()
+
+    def labels(self, *values: str):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = self._new_series()
+        return series
+
+    def samples(self) -> Iterable[str]:
+        for values, series in self.series.items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(series.value)}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: int = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+    series_class = GaugeSeries
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return HistogramSeries(self.buckets)
+
+    def samples(self) -> Iterable[str]:
+        for values, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(series.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """Metrics plus collectors for values that live elsewhere (cache counters, say)"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collect: Callable[[], Iterable[Metric]]):
+        """Register a function building metrics at scrape time"""
+        self.collectors.append(collect)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        metrics = list(self.metrics)
+        for collect in self.collectors:
+            metrics.extend(collect())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests_in_flight = registry.gauge(
+    "splitpay_http_requests_in_flight", "HTTP requests being handled, including open event streams"
+)
+http_request_duration = registry.histogram(
+    "splitpay_http_request_duration_seconds", "HTTP request latency by route template and status",
+    ("method", "route", "status"),
+)
+storage_call_duration = registry.histogram(
+    "splitpay_storage_call_duration_seconds", "Storage method latency", ("method",)
+)
+storage_call_errors = registry.counter(
+    "splitpay_storage_call_errors_total", "Storage method calls that raised", ("method",)
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by route template and status.
+
+    The route is read from the scope after the request is handled, where the
+    router left it; unmatched paths share one "unmatched" label so arbitrary
+    URLs cannot create series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._series: Dict[Tuple[str, str, int], HistogramSeries] = {}
+        self._in_flight = http_requests_in_flight.labels()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = self._in_flight
+        in_flight.value += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.value -= 1
+            route = scope.get("route")
+            key = (scope["method"], getattr(route, "path", "unmatched"), status)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = http_request_duration.labels(key[0], key[1], str(status))
+            series.observe(elapsed)
+
+
+def _timed(name: str, method):
+    series = storage_call_duration.labels(name)
+    errors = storage_call_errors.labels(name)
+
+    async def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        except Exception:
+            errors.value += 1
+            raise
+        finally:
+            series.observe(time.perf_counter() - start)
+
+    timed.__wrapped__ = method
+    return timed
+
+
+def instrument_storage(storage, interface: type):
+    """Time every public async method of `interface` on this storage instance.
+
+    The wrappers are instance attributes shadowing the class methods, so the
+    class itself (and any other instance, such as a benchmark's) is untouched.
+    """
+    for name, attribute in vars(interface).items():
+        if name.startswith("_") or not inspect.iscoroutinefunction(attribute):
+            continue
+        method = getattr(storage, name)
+        if not hasattr(method, "__wrapped__"):
+            setattr(storage, name, _timed(name, method))
+    return storage
@@ -0,0 +1,61 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, localcontext
+from typing import Annotated, Any
+from pydantic import BeforeValidator, PlainSerializer
+
+# Amounts and quantities are fixed-point with two decimals (decimal(10, 2) in
+# shared/schema.ts) and are kept as integer hundredths everywhere inside the
+# server. They are only turned back into strings when serialized to JSON.
+
+_HUNDRED = Decimal(100)
+
+
+def to_cents(value: Any) -> int:
+    """Convert a decimal amount ("12.50", 12.5, Decimal) to integer cents"""
+    if isinstance(value, bool):
+        raise ValueError("Invalid amount")
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, str):
+        # Fast path for the plain "123" / "123.4" / "123.45" the API sends
+        whole, _, frac = value.partition(".")
+        if whole.isascii() and whole.isdigit() and len(frac) <= 2 and (not frac or frac.isascii() and frac.isdigit()):
+            return int(whole) * 100 + int(frac.ljust(2, "0") if frac else 0)
+    try:
+        with localcontext() as ctx:
+            ctx.prec = 28
+            amount = Decimal(value.strip() if isinstance(value, str) else str(value)) * _HUNDRED
+            if not amount.is_finite():
+                raise ValueError("Invalid amount")
+            return int(amount.to_integral_value(rounding=ROUND_HALF_UP))
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Invalid amount: {value!r}")
+
+
+def format_cents(cents: int) -> str:
+    """Format integer cents as a two-decimal string ("12.50")"""
+    sign = "-" if cents < 0 else ""
+    whole, frac = divmod(abs(cents), 100)
+    return f"{sign}{whole}.{frac:02d}"
+
+
+def line_total(price: int, quantity: int) -> int:
+    """Cents for a line of `quantity` hundredths at `price` cents, rounded half up"""
+    amount = price * quantity
+    sign = -1 if amount < 0 else 1
+    return sign * ((abs(amount) + 50) // 100)
+
+
+def _validate_cents(value: Any) -> int:
+    # Validation is the API edge: strings and Decimals are decimal amounts and
+    # ints whole units, as in to_cents. Code that already holds cents builds
+    # records, or models with model_construct, without coming through here.
+    if isinstance(value, (int, str, Decimal)) and not isinstance(value, bool):
+        return to_cents(value)
+    raise ValueError("Amount must be a decimal string or a whole number")
+
+
+# Integer cents in Python, decimal string in JSON
+Money = Annotated[int, BeforeValidator(_validate_cents), PlainSerializer(format_cents, return_type=str, when_used="json")]
+
+# Quantities use the same two-decimal fixed point (hundredths of a unit)
+Quantity = Money
@@ -0,0 +1,957 @@
+import asyncio
+import csv
+import io
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+
+from schemas import Table, TableCreate, Bill, BillCreate, BillItem, BillItemCreate, Payment, PaymentCreate, BillWithItems, BillTotals, DashboardTable
+from events import ChangeFeed, ALL, table_topic, restaurant_topic
+from storage import IStorage, added_items_bill_updates, batch_item_quantities, bill_balance, bill_balanced, changed_item_bill_delta, check_item_quantities, payment_bill_updates
+from money import format_cents, to_cents
+from records import TableRecord, BillRecord, BillItemRecord, PaymentRecord, BillTotalsRecord, record_values, unpaid_quantity, validate_updates
+
+# The tables of shared/schema.ts, column for column, so the TypeScript server
+# can use the same database. Each also gets a `seq` (creation order, what
+# SQLite's rowid gives for free) and, for tables and bills, a `version`.
+SCHEMA = """
+BEGIN;
+-- Workers starting together must not interleave schema creation
+SELECT pg_advisory_xact_lock(7327287291);
+
+CREATE TABLE IF NOT EXISTS tables (
+    id VARCHAR PRIMARY KEY DEFAULT gen_random_uuid(),
+    number INTEGER NOT NULL,
+    restaurant_name TEXT NOT NULL,
+    qr_code TEXT NOT NULL,
+    is_active BOOLEAN DEFAULT true,
+    created_at TIMESTAMP DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS bills (
+    id VARCHAR PRIMARY KEY DEFAULT gen_random_uuid(),
+    table_id VARCHAR NOT NULL REFERENCES tables(id),
+    total NUMERIC(10, 2) NOT NULL,
+    paid NUMERIC(10, 2) DEFAULT 0,
+    remaining NUMERIC(10, 2) NOT NULL,
+    status TEXT NOT NULL DEFAULT 'unpaid',
+    guest_count INTEGER DEFAULT 1,
+    start_time TIMESTAMP DEFAULT now(),
+    is_active BOOLEAN DEFAULT true
+);
+CREATE TABLE IF NOT EXISTS bill_items (
+    id VARCHAR PRIMARY KEY DEFAULT gen_random_uuid(),
+    bill_id VARCHAR NOT NULL REFERENCES bills(id),
+    name TEXT NOT NULL,
+    price NUMERIC(10, 2) NOT NULL,
+    quantity NUMERIC(10, 2) NOT NULL DEFAULT 1,
+    paid_quantity NUMERIC(10, 2) DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS payments (
+    id VARCHAR PRIMARY KEY DEFAULT gen_random_uuid(),
+    bill_id VARCHAR NOT NULL REFERENCES bills(id),
+    amount NUMERIC(10, 2) NOT NULL,
+    tip NUMERIC(10, 2) DEFAULT 0,
+    items JSONB NOT NULL,
+    payment_method TEXT DEFAULT 'card',
+    status TEXT DEFAULT 'completed',
+    processed_at TIMESTAMP DEFAULT now()
+);
+ALTER TABLE tables ADD COLUMN IF NOT EXISTS seq BIGSERIAL, ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE bills ADD COLUMN IF NOT EXISTS seq BIGSERIAL, ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE bill_items ADD COLUMN IF NOT EXISTS seq BIGSERIAL;
+ALTER TABLE payments ADD COLUMN IF NOT EXISTS seq BIGSERIAL;
+
+CREATE INDEX IF NOT EXISTS idx_tables_restaurant_number ON tables(restaurant_name, number);
+CREATE INDEX IF NOT EXISTS idx_tables_number ON tables(number, seq);
+CREATE INDEX IF NOT EXISTS idx_bills_table_id ON bills(table_id, is_active);
+CREATE INDEX IF NOT EXISTS idx_bills_start_time ON bills(start_time, seq);
+CREATE INDEX IF NOT EXISTS idx_bill_items_bill_id ON bill_items(bill_id, seq);
+CREATE INDEX IF NOT EXISTS idx_payments_bill_id ON payments(bill_id, seq);
+
+CREATE TABLE IF NOT EXISTS splitpay_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT INTO splitpay_meta (key, value) VALUES ('epoch', substr(md5(random()::text), 1, 8)) ON CONFLICT DO NOTHING;
+
+-- Version counters for conditional GETs, maintained by triggers so every
+-- writer bumps them in its own transaction. There is no row for the whole
+-- dashboard: its version is the sum of the restaurants', which keeps every
+-- write off a single hot row.
+CREATE TABLE IF NOT EXISTS splitpay_dashboard_versions (
+    restaurant_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION splitpay_touch_dashboard(names TEXT[]) RETURNS void LANGUAGE sql AS $$
+    INSERT INTO splitpay_dashboard_versions (restaurant_name, version)
+        SELECT DISTINCT name, 1 FROM unnest(names) AS name WHERE name IS NOT NULL ORDER BY 1
+    ON CONFLICT (restaurant_name) DO UPDATE SET version = splitpay_dashboard_versions.version + 1;
+$$;
+
+CREATE OR REPLACE FUNCTION splitpay_bump_bill() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE bills SET version = version + 1 WHERE id = NEW.bill_id;
+    IF TG_OP = 'UPDATE' AND OLD.bill_id IS DISTINCT FROM NEW.bill_id THEN
+        UPDATE bills SET version = version + 1 WHERE id = OLD.bill_id;
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION splitpay_bill_version() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF (NEW.table_id, NEW.total, NEW.paid, NEW.remaining, NEW.status, NEW.guest_count, NEW.start_time, NEW.is_active)
+        IS DISTINCT FROM
+       (OLD.table_id, OLD.total, OLD.paid, OLD.remaining, OLD.status, OLD.guest_count, OLD.start_time, OLD.is_active) THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END $$;
+
+CREATE OR REPLACE FUNCTION splitpay_bill_dashboard() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM splitpay_touch_dashboard(ARRAY(SELECT restaurant_name FROM tables WHERE id = NEW.table_id));
+    ELSIF NEW.version IS DISTINCT FROM OLD.version THEN
+        PERFORM splitpay_touch_dashboard(ARRAY(SELECT restaurant_name FROM tables WHERE id IN (NEW.table_id, OLD.table_id)));
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION splitpay_table_version() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF (NEW.number, NEW.restaurant_name, NEW.qr_code, NEW.is_active, NEW.created_at)
+        IS DISTINCT FROM (OLD.number, OLD.restaurant_name, OLD.qr_code, OLD.is_active, OLD.created_at) THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END $$;
+
+CREATE OR REPLACE FUNCTION splitpay_table_dashboard() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM splitpay_touch_dashboard(ARRAY[NEW.restaurant_name]);
+    ELSIF NEW.version IS DISTINCT FROM OLD.version THEN
+        PERFORM splitpay_touch_dashboard(ARRAY[NEW.restaurant_name, OLD.restaurant_name]);
+    END IF;
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS splitpay_bill_items_version ON bill_items;
+CREATE TRIGGER splitpay_bill_items_version AFTER INSERT OR UPDATE ON bill_items
+    FOR EACH ROW EXECUTE FUNCTION splitpay_bump_bill();
+DROP TRIGGER IF EXISTS splitpay_payments_version ON payments;
+CREATE TRIGGER splitpay_payments_version AFTER INSERT ON payments
+    FOR EACH ROW EXECUTE FUNCTION splitpay_bump_bill();
+DROP TRIGGER IF EXISTS splitpay_bills_version ON bills;
+CREATE TRIGGER splitpay_bills_version BEFORE UPDATE ON bills
+    FOR EACH ROW EXECUTE FUNCTION splitpay_bill_version();
+DROP TRIGGER IF EXISTS splitpay_bills_dashboard ON bills;
+CREATE TRIGGER splitpay_bills_dashboard AFTER INSERT OR UPDATE ON bills
+    FOR EACH ROW EXECUTE FUNCTION splitpay_bill_dashboard();
+DROP TRIGGER IF EXISTS splitpay_tables_version ON tables;
+CREATE TRIGGER splitpay_tables_version BEFORE UPDATE ON tables
+    FOR EACH ROW EXECUTE FUNCTION splitpay_table_version();
+DROP TRIGGER IF EXISTS splitpay_tables_dashboard ON tables;
+CREATE TRIGGER splitpay_tables_dashboard AFTER INSERT OR UPDATE ON tables
+    FOR EACH ROW EXECUTE FUNCTION splitpay_table_dashboard();
+
+-- Responses to requests sent with an Idempotency-Key (shared mode), so a
+-- retry reaching another worker process is replayed rather than run again.
+-- A row without a body is a claim on a key whose request is still running.
+CREATE TABLE IF NOT EXISTS splitpay_idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    claim TEXT NOT NULL,
+    body BYTEA,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON splitpay_idempotency_keys(expires_at);
+COMMIT;
+"""
+
+# Takes the key over only if it is free or its entry has expired; the
+# database's clock keeps expiry consistent between hosts
+CLAIM_IDEMPOTENCY_KEY = """
+INSERT INTO splitpay_idempotency_keys (key, fingerprint, claim, expires_at)
+VALUES ($1, $2, $3, now() + $4 * interval '1 second')
+ON CONFLICT (key) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, claim = EXCLUDED.claim, body = NULL, expires_at = EXCLUDED.expires_at
+WHERE splitpay_idempotency_keys.expires_at <= now()
+RETURNING key
+"""
+
+# Change events for other worker processes (shared mode) go out with NOTIFY
+CHANGE_CHANNEL = "splitpay_changes"
+# NOTIFY payloads are limited to 8000 bytes; a larger record is sent by id
+# and read back by the listener
+MAX_NOTIFY_BYTES = 7900
+
+# Selected columns, in the order of the record types' fields, so a row
+# unpacks straight into a record
+TABLE_FIELDS = ("id", "number", "restaurant_name", "qr_code", "is_active", "created_at")
+BILL_FIELDS = ("id", "table_id", "total", "remaining", "paid", "status", "guest_count", "is_active", "start_time")
+BILL_ITEM_FIELDS = ("id", "bill_id", "name", "price", "quantity", "paid_quantity")
+PAYMENT_FIELDS = ("id", "bill_id", "amount", "items", "tip", "payment_method", "status", "processed_at")
+
+
+def _columns(fields: Tuple[str, ...], alias: Optional[str] = None) -> str:
+    return ", ".join(f"{alias}.{field}" if alias else field for field in fields)
+
+
+def _insert(table_name: str, fields: Tuple[str, ...]) -> str:
+    placeholders = ", ".join(f"${index}" for index in range(1, len(fields) + 1))
+    return f"INSERT INTO {table_name} ({_columns(fields)}) VALUES ({placeholders})"
+
+
+TABLE_COLUMNS = _columns(TABLE_FIELDS)
+BILL_COLUMNS = _columns(BILL_FIELDS)
+BILL_ITEM_COLUMNS = _columns(BILL_ITEM_FIELDS)
+PAYMENT_COLUMNS = _columns(PAYMENT_FIELDS)
+
+# Statements are fixed strings (or built from a few fixed variants), so each
+# is prepared once per connection and then found in asyncpg's statement cache
+INSERT_TABLE = _insert("tables", TABLE_FIELDS)
+INSERT_BILL = _insert("bills", BILL_FIELDS)
+INSERT_BILL_ITEM = _insert("bill_items", BILL_ITEM_FIELDS)
+INSERT_PAYMENT = _insert("payments", PAYMENT_FIELDS)
+
+# A bill's items as JSON arrays of record fields, amounts already in hundredths
+ITEM_VALUES = """
+COALESCE((
+    SELECT json_agg(json_build_array(
+        i.id, i.bill_id, i.name, (i.price * 100)::bigint, (i.quantity * 100)::bigint, (i.paid_quantity * 100)::bigint
+    ) ORDER BY i.seq)
+    FROM bill_items i WHERE i.bill_id = b.id
+), '[]') AS item_values
+"""
+
+# The bill, its table and its items in one round trip
+BILL_WITH_ITEMS = f"""
+SELECT {_columns(BILL_FIELDS, "b")},
+       json_build_array({_columns(TABLE_FIELDS, "t")}) AS table_values,
+       {ITEM_VALUES}
+FROM bills b JOIN tables t ON t.id = b.table_id
+WHERE b.id = $1
+"""
+
+# The bill, its items and the count and sum of its payments in one round trip
+BILL_TOTALS = f"""
+SELECT {_columns(BILL_FIELDS, "b")}, {ITEM_VALUES}, p.payment_count, p.payment_total
+FROM bills b, LATERAL (
+    SELECT COUNT(*) AS payment_count, COALESCE(SUM(amount + COALESCE(tip, 0)), 0) AS payment_total
+    FROM payments WHERE bill_id = b.id
+) p
+WHERE b.id = $1
+"""
+
+# Paid quantities are passed as hundredths (bigint[]): numeric arrays would
+# need a binary codec
+PAY_BILL_ITEMS = f"""
+UPDATE bill_items i SET paid_quantity = COALESCE(i.paid_quantity, 0) + q.quantity::numeric / 100
+FROM unnest($1::varchar[], $2::bigint[]) AS q(id, quantity)
+WHERE i.id = q.id AND i.bill_id = $3
+RETURNING {_columns(BILL_ITEM_FIELDS, "i")}
+"""
+
+
+def _record(cls, row: asyncpg.Record):
+    """A record from a row whose leading columns are the record's fields"""
+    return cls(*tuple(row)[:len(cls.__slots__)])
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def _money(cents: Optional[int]) -> Optional[str]:
+    return format_cents(cents) if cents is not None else None
+
+
+def _csv(rows: Iterable[tuple]) -> io.BytesIO:
+    """Rows as CSV for COPY: None is written unquoted and empty, which COPY reads as NULL"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return io.BytesIO(buffer.getvalue().encode())
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    # Decimal columns come and go as integer hundredths, the representation
+    # the models use; JSON is decoded as is
+    await conn.set_type_codec("numeric", schema="pg_catalog", encoder=format_cents, decoder=to_cents, format="text")
+    for name in ("json", "jsonb"):
+        await conn.set_type_codec(name, schema="pg_catalog", encoder=json.dumps, decoder=json.loads, format="text")
+
+
+class PostgresStorage(IStorage):
+    """PostgreSQL storage implementation on asyncpg.
+
+    Connections come from a bounded pool of `min_size` to `max_size`,
+    created in the running event loop on first use; callers beyond
+    `max_size` wait for a connection. asyncpg prepares statements on the
+    server the first time a connection runs them and keeps up to
+    `statement_cache_size` of them per connection.
+
+    A payment locks its bill row (SELECT ... FOR UPDATE) for the length of
+    its transaction, as do item batches, so concurrent writers to one bill
+    are serialized by Postgres, across processes as well. With `shared`
+    set, change events are sent with NOTIFY instead of straight to this
+    process's subscribers; run a ChangeListener to deliver them.
+    """
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10, statement_cache_size: int = 256,
+                 command_timeout: float = 30.0, shared: bool = False):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.command_timeout = command_timeout
+        self.shared = shared
+        self.payment_conflicts = 0
+        self.changes = ChangeFeed()
+        self._pool: Optional[asyncpg.Pool] = None
+        self._open_lock = asyncio.Lock()
+        self._epoch = ""
+
+    async def _open(self) -> asyncpg.Pool:
+        async with self._open_lock:
+            if self._pool is None:
+                pool = await asyncpg.create_pool(
+                    self.dsn, min_size=self.min_size, max_size=self.max_size,
+                    statement_cache_size=self.statement_cache_size, command_timeout=self.command_timeout,
+                    init=_init_connection,
+                )
+                async with pool.acquire() as conn:
+                    await conn.execute(SCHEMA)
+                    self._epoch = await conn.fetchval("SELECT value FROM splitpay_meta WHERE key = 'epoch'")
+                self._pool = pool
+        return self._pool
+
+    async def _fetchrow(self, sql: str, *args) -> Optional[asyncpg.Record]:
+        return await (self._pool or await self._open()).fetchrow(sql, *args)
+
+    async def _fetch(self, sql: str, *args) -> List[asyncpg.Record]:
+        return await (self._pool or await self._open()).fetch(sql, *args)
+
+    async def _execute(self, sql: str, *args) -> None:
+        await (self._pool or await self._open()).execute(sql, *args)
+
+    @asynccontextmanager
+    async def _transaction(self, **options):
+        async with (self._pool or await self._open()).acquire() as conn:
+            async with conn.transaction(**options):
+                yield conn
+
+    async def _update(self, conn, table_name: str, fields: Tuple[str, ...], id: str, updates: dict) -> Optional[asyncpg.Record]:
+        """Apply the updates to known columns and return the row, in one statement"""
+        columns = [key for key in updates if key in fields[1:]]
+        if not columns:
+            return await conn.fetchrow(f"SELECT {_columns(fields)} FROM {table_name} WHERE id = $1", id)
+        assignments = ", ".join(f"{key} = ${index}" for index, key in enumerate(columns, 2))
+        return await conn.fetchrow(
+            f"UPDATE {table_name} SET {assignments} WHERE id = $1 RETURNING {_columns(fields)}",
+            id, *(updates[key] for key in columns)
+        )
+
+    async def _changed(self, event: str, bill_id: str, model):
+        """Publish a change to a bill or one of its records"""
+        await self._changed_many([(event, bill_id, model)])
+
+    async def _changed_many(self, changes: List[Tuple[str, str, Any]]):
+        """Publish changes, in order; in shared mode, NOTIFY them"""
+        if not self.shared and not self.changes.has_subscribers():
+            return
+        rows = await self._fetch(
+            "SELECT b.id, b.table_id, t.restaurant_name FROM bills b LEFT JOIN tables t ON t.id = b.table_id "
+            "WHERE b.id = ANY($1::varchar[])",
+            list({bill_id for _, bill_id, _ in changes})
+        )
+        where = {row["id"]: (row["table_id"], row["restaurant_name"]) for row in rows}
+        if not self.shared:
+            for event, bill_id, model in changes:
+                if bill_id in where:
+                    self.changes.publish_change(event, *where[bill_id], model)
+            return
+
+        payloads = []
+        for event, bill_id, model in changes:
+            if bill_id not in where:
+                continue
+            header = json.dumps([event, *where[bill_id], model.id])
+            payload = f"{header}\n{model.model_dump_json()}"
+            payloads.append((payload if len(payload.encode()) <= MAX_NOTIFY_BYTES else header,))
+        if payloads:
+            await (self._pool or await self._open()).executemany(f"SELECT pg_notify('{CHANGE_CHANNEL}', $1)", payloads)
+
+    async def _changed_model(self, event: str, id: str):
+        if event == "bill":
+            return await self.get_bill(id)
+        if event == "item":
+            return await self.get_bill_item(id)
+        row = await self._fetchrow(f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE id = $1", id)
+        return PaymentRecord(*row).to_model() if row else None
+
+    async def publish_notification(self, payload: str):
+        """Publish a change sent by any worker (see _changed_many) to this process's subscribers"""
+        header, _, data = payload.partition("\n")
+        event, table_id, restaurant_name, id = json.loads(header)
+        topics = (ALL, table_topic(table_id))
+        if restaurant_name is not None:
+            topics += (restaurant_topic(restaurant_name),)
+        if not self.changes.has_subscribers(*topics):
+            return
+        if not data:
+            model = await self._changed_model(event, id)
+            if model is None:
+                return
+            data = model.model_dump_json()
+        self.changes.publish(topics, event, f'{{"table_id":{json.dumps(table_id)},"{event}":{data}}}')
+
+    # Idempotency keys, for SharedIdempotencyStore
+    async def claim_idempotency_key(self, key: str, fingerprint: str, claim: str, lease: float) -> Tuple[bool, str, Optional[bytes]]:
+        """Claim a key for `lease` seconds unless it is held; expired keys are dropped first.
+
+        Returns (True, fingerprint, None) when claimed, else (False, the
+        holder's fingerprint, its stored response or None while it runs).
+        """
+        await self._execute("DELETE FROM splitpay_idempotency_keys WHERE expires_at <= now()")
+        while True:
+            if await self._fetchrow(CLAIM_IDEMPOTENCY_KEY, key, fingerprint, claim, lease):
+                return True, fingerprint, None
+            row = await self._fetchrow("SELECT fingerprint, body FROM splitpay_idempotency_keys WHERE key = $1", key)
+            # Otherwise released between the two statements; claim it again
+            if row is not None:
+                return False, row["fingerprint"], row["body"]
+
+    async def store_idempotent_response(self, key: str, claim: str, body: bytes, ttl: float):
+        """Store the response to a claimed key, kept for `ttl` seconds"""
+        await self._execute(
+            "UPDATE splitpay_idempotency_keys SET body = $3, expires_at = now() + $4 * interval '1 second' "
+            "WHERE key = $1 AND claim = $2",
+            key, claim, body, ttl
+        )
+
+    async def release_idempotency_key(self, key: str, claim: str):
+        """Drop a claim whose request failed, so the key can run again"""
+        await self._execute("DELETE FROM splitpay_idempotency_keys WHERE key = $1 AND claim = $2 AND body IS NULL", key, claim)
+
+    async def aclose(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def close(self):
+        # For callers outside the event loop (CLIs after asyncio.run returns)
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    # Tables
+    async def create_table(self, table: TableCreate) -> Table:
+        record = TableRecord(id=str(uuid.uuid4()), created_at=datetime.now(), **table.model_dump())
+        await self._execute(INSERT_TABLE, *record_values(record))
+        return record.to_model()
+
+    async def get_table(self, id: str) -> Optional[Table]:
+        row = await self._fetchrow(f"SELECT {TABLE_COLUMNS} FROM tables WHERE id = $1", id)
+        return TableRecord(*row).to_model() if row else None
+
+    async def get_table_by_number(self, number: int, restaurant_name: str) -> Optional[Table]:
+        row = await self._fetchrow(
+            f"SELECT {TABLE_COLUMNS} FROM tables WHERE restaurant_name = $1 AND number = $2 ORDER BY seq LIMIT 1",
+            restaurant_name, number
+        )
+        return TableRecord(*row).to_model() if row else None
+
+    async def get_all_tables(self) -> List[Table]:
+        rows = await self._fetch(f"SELECT {TABLE_COLUMNS} FROM tables ORDER BY seq")
+        return [TableRecord(*row).to_model() for row in rows]
+
+    async def iter_table_documents(self, restaurant: Optional[str] = None, after: Optional[str] = None,
+                                   batch: int = 500) -> AsyncIterator[dict]:
+        # Keyset pages on (number, seq), each batch a query of its own
+        key = None
+        if after is not None:
+            key = await self._fetchrow("SELECT number, seq FROM tables WHERE id = $1", after)
+            if key is None:
+                raise ValueError(f"Unknown cursor: {after}")
+            key = tuple(key)
+        while True:
+            conditions, params = [], []
+            if restaurant is not None:
+                params.append(restaurant)
+                conditions.append(f"restaurant_name = ${len(params)}")
+            if key is not None:
+                params.extend(key)
+                conditions.append(f"(number, seq) > (${len(params) - 1}, ${len(params)})")
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            params.append(batch)
+            rows = await self._fetch(
+                f"SELECT {TABLE_COLUMNS}, seq FROM tables {where} ORDER BY number, seq LIMIT ${len(params)}", *params
+            )
+            for row in rows:
+                yield _record(TableRecord, row).to_document()
+            if len(rows) < batch:
+                return
+            key = (rows[-1]["number"], rows[-1]["seq"])
+
+    async def _iter_bill_rows(self, table_name: str, fields: Tuple[str, ...], bill_id: str, after: Optional[str],
+                              batch: int = 500):
+        """A bill's item or payment rows in creation (seq) order, after the row with id `after`"""
+        last = 0
+        if after is not None:
+            last = await (self._pool or await self._open()).fetchval(
+                f"SELECT seq FROM {table_name} WHERE id = $1 AND bill_id = $2", after, bill_id
+            )
+            if last is None:
+                raise ValueError(f"Unknown cursor: {after}")
+        while True:
+            rows = await self._fetch(
+                f"SELECT {_columns(fields)}, seq FROM {table_name} WHERE bill_id = $1 AND seq > $2 ORDER BY seq LIMIT $3",
+                bill_id, last, batch
+            )
+            for row in rows:
+                yield row
+            if len(rows) < batch:
+                return
+            last = rows[-1]["seq"]
+
+    async def update_table(self, id: str, updates: dict) -> Optional[Table]:
+        updates = validate_updates(Table, updates)
+        row = await self._update(self._pool or await self._open(), "tables", TABLE_FIELDS, id, updates)
+        return TableRecord(*row).to_model() if row else None
+
+    # Bills
+    async def create_bill(self, bill: BillCreate) -> Bill:
+        record = BillRecord(
+            id=str(uuid.uuid4()), start_time=datetime.now(),
+            **{**bill.model_dump(), **bill_balance(bill.total, bill.paid or 0)}
+        )
+        await self._execute(INSERT_BILL, *record_values(record))
+        bill = record.to_model()
+        await self._changed("bill", bill.id, bill)
+        return bill
+
+    async def get_bill(self, id: str) -> Optional[Bill]:
+        row = await self._fetchrow(f"SELECT {BILL_COLUMNS} FROM bills WHERE id = $1", id)
+        return BillRecord(*row).to_model() if row else None
+
+    async def get_bill_by_table_id(self, table_id: str) -> Optional[Bill]:
+        row = await self._fetchrow(
+            f"SELECT {BILL_COLUMNS} FROM bills WHERE table_id = $1 AND is_active ORDER BY seq LIMIT 1", table_id
+        )
+        return BillRecord(*row).to_model() if row else None
+
+    async def get_bill_with_items(self, id: str) -> Optional[BillWithItems]:
+        row = await self._fetchrow(BILL_WITH_ITEMS, id)
+        if not row:
+            return None
+        table = row["table_values"]
+        table[5] = _timestamp(table[5])
+        return _record(BillRecord, row).to_model_with_items(
+            [BillItemRecord(*values) for values in row["item_values"]], TableRecord(*table)
+        )
+
+    async def update_bill(self, id: str, updates: dict) -> Optional[Bill]:
+        updates = validate_updates(Bill, updates)
+        async with self._transaction() as conn:
+            row = await self._update(conn, "bills", BILL_FIELDS, id, updates)
+            if not row:
+                return None
+            row = await self._update(conn, "bills", BILL_FIELDS, id, bill_balance(row["total"], row["paid"] or 0))
+        bill = BillRecord(*row).to_model()
+        await self._changed("bill", bill.id, bill)
+        return bill
+
+    async def get_all_active_bills(self) -> List[Bill]:
+        rows = await self._fetch(f"SELECT {BILL_COLUMNS} FROM bills WHERE is_active ORDER BY seq")
+        return [BillRecord(*row).to_model() for row in rows]
+
+    async def iter_bill_exports(self, restaurant: Optional[str] = None, start: Optional[datetime] = None,
+                                end: Optional[datetime] = None, batch: int = 100,
+                                max_pause: float = 0.005) -> AsyncIterator[dict]:
+        # Keyset batches on (start_time, seq), starting at `start`; each
+        # batch's items and payments are read in the same transaction
+        conditions, params = ["(start_time, seq) > ($1, $2)"], []
+        if restaurant is not None:
+            params.append(restaurant)
+            conditions.append(f"table_id IN (SELECT id FROM tables WHERE restaurant_name = ${len(params) + 2})")
+        if end is not None:
+            params.append(end)
+            conditions.append(f"start_time < ${len(params) + 2}")
+        bills_sql = (
+            f"SELECT {BILL_COLUMNS}, seq FROM bills WHERE {' AND '.join(conditions)} "
+            f"ORDER BY start_time, seq LIMIT ${len(params) + 3}"
+        )
+
+        key = (start if start is not None else datetime.min, 0)
+        while True:
+            async with self._transaction(isolation="repeatable_read", readonly=True) as conn:
+                bills = await conn.fetch(bills_sql, *key, *params, batch)
+                ids = [row["id"] for row in bills]
+                items = await conn.fetch(
+                    f"SELECT {BILL_ITEM_COLUMNS} FROM bill_items WHERE bill_id = ANY($1::varchar[]) ORDER BY seq", ids
+                )
+                payments = await conn.fetch(
+                    f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE bill_id = ANY($1::varchar[]) ORDER BY seq", ids
+                )
+            documents = {
+                row["id"]: {"bill": _record(BillRecord, row).to_document(), "items": [], "payments": []} for row in bills
+            }
+            for row in items:
+                documents[row["bill_id"]]["items"].append(BillItemRecord(*row).to_document())
+            for row in payments:
+                documents[row["bill_id"]]["payments"].append(PaymentRecord(*row).to_document())
+            paused = time.monotonic()
+            for document in documents.values():
+                yield document
+                # Encoding a batch can take a while: let other requests run
+                if time.monotonic() - paused > max_pause:
+                    await asyncio.sleep(0)
+                    paused = time.monotonic()
+            if len(bills) < batch:
+                return
+            key = (bills[-1]["start_time"], bills[-1]["seq"])
+
+    # Bill Items
+    async def create_bill_item(self, item: BillItemCreate) -> BillItem:
+        return (await self.create_bill_items([item]))[0]
+
+    async def create_bill_items(self, items: List[BillItemCreate]) -> List[BillItem]:
+        records = [BillItemRecord(id=str(uuid.uuid4()), **item.model_dump()) for item in items]
+        by_bill: Dict[str, List[BillItemRecord]] = {}
+        for record in records:
+            by_bill.setdefault(record.bill_id, []).append(record)
+
+        async with self._transaction() as conn:
+            # Bills are locked in id order so concurrent batches cannot deadlock
+            rows = await conn.fetch(
+                f"SELECT {BILL_COLUMNS} FROM bills WHERE id = ANY($1::varchar[]) ORDER BY id FOR UPDATE", list(by_bill)
+            )
+            await conn.executemany(INSERT_BILL_ITEM, [record_values(record) for record in records])
+            bills = []
+            for row in rows:
+                bill = BillRecord(*row)
+                bills.append(await self._update(conn, "bills", BILL_FIELDS, bill.id, added_items_bill_updates(bill, by_bill[bill.id])))
+
+        models = [record.to_model() for record in records]
+        await self._changed_many(
+            [("item", model.bill_id, model) for model in models]
+            + [("bill", row["id"], BillRecord(*row).to_model()) for row in bills]
+        )
+        return models
+
+    async def get_bill_items(self, bill_id: str) -> List[BillItem]:
+        rows = await self._fetch(f"SELECT {BILL_ITEM_COLUMNS} FROM bill_items WHERE bill_id = $1 ORDER BY seq", bill_id)
+        return [BillItemRecord(*row).to_model() for row in rows]
+
+    async def iter_bill_item_documents(self, bill_id: str, after: Optional[str] = None) -> AsyncIterator[dict]:
+        async for row in self._iter_bill_rows("bill_items", BILL_ITEM_FIELDS, bill_id, after):
+            yield _record(BillItemRecord, row).to_document()
+
+    async def update_bill_item(self, id: str, updates: dict) -> Optional[BillItem]:
+        updates = validate_updates(BillItem, updates)
+        async with self._transaction() as conn:
+            bill_id = await conn.fetchval("SELECT bill_id FROM bill_items WHERE id = $1", id)
+            if bill_id is None:
+                return None
+            # Bills before the item, in id order, like apply_payment and create_bill_items
+            await conn.execute(
+                "SELECT 1 FROM bills WHERE id = ANY($1::varchar[]) ORDER BY id FOR UPDATE",
+                list({bill_id, updates.get("bill_id", bill_id)})
+            )
+            before = await conn.fetchrow(f"SELECT {BILL_ITEM_COLUMNS} FROM bill_items WHERE id = $1 FOR UPDATE", id)
+            row = await self._update(conn, "bill_items", BILL_ITEM_FIELDS, id, updates)
+            bills = []
+            for bill_id, delta in changed_item_bill_delta(BillItemRecord(*before), BillItemRecord(*row)).items():
+                bill = await conn.fetchrow("SELECT total, paid FROM bills WHERE id = $1", bill_id)
+                if bill:
+                    bills.append(await self._update(
+                        conn, "bills", BILL_FIELDS, bill_id, bill_balance(bill["total"] + delta, bill["paid"] or 0)
+                    ))
+
+        item = BillItemRecord(*row).to_model()
+        await self._changed_many(
+            [("item", item.bill_id, item)] + [("bill", bill["id"], BillRecord(*bill).to_model()) for bill in bills]
+        )
+        return item
+
+    async def get_bill_item(self, id: str) -> Optional[BillItem]:
+        row = await self._fetchrow(f"SELECT {BILL_ITEM_COLUMNS} FROM bill_items WHERE id = $1", id)
+        return BillItemRecord(*row).to_model() if row else None
+
+    # Payments
+    async def create_payment(self, payment: PaymentCreate) -> Payment:
+        record = PaymentRecord(id=str(uuid.uuid4()), processed_at=datetime.now(), **payment.model_dump())
+        await self._execute(INSERT_PAYMENT, *record_values(record))
+        payment = record.to_model()
+        await self._changed("payment", payment.bill_id, payment)
+        return payment
+
+    async def apply_payment(self, payment: PaymentCreate) -> Optional[Tuple[Payment, Bill]]:
+        record = PaymentRecord(id=str(uuid.uuid4()), processed_at=datetime.now(), **payment.model_dump())
+        quantities = batch_item_quantities([payment])
+
+        async with self._transaction() as conn:
+            # The bill row stays locked until commit. SKIP LOCKED comes back
+            # empty when another transaction holds it, which is counted as a
+            # conflict before waiting for the lock.
+            row = await conn.fetchrow(f"SELECT {BILL_COLUMNS} FROM bills WHERE id = $1 FOR UPDATE SKIP LOCKED", payment.bill_id)
+            if row is None:
+                row = await conn.fetchrow(f"SELECT {BILL_COLUMNS} FROM bills WHERE id = $1 FOR UPDATE", payment.bill_id)
+                if row is None:
+                    return None
+                self.payment_conflicts += 1
+            if quantities:
+                await self._check_item_quantities(conn, payment.bill_id, quantities)
+            await conn.execute(INSERT_PAYMENT, *record_values(record))
+            row = await self._update(conn, "bills", BILL_FIELDS, row["id"], payment_bill_updates(BillRecord(*row), payment))
+            items = await conn.fetch(PAY_BILL_ITEMS, list(quantities), list(quantities.values()), payment.bill_id) if quantities else []
+
+        bill = BillRecord(*row).to_model()
+        await self._changed_many(
+            [("payment", bill.id, record.to_model())]
+            + [("item", bill.id, BillItemRecord(*item).to_model()) for item in items]
+            + [("bill", bill.id, bill)]
+        )
+        return record.to_model(), bill
+
+    async def _check_item_quantities(self, conn: asyncpg.Connection, bill_id: str, quantities: Dict[str, int]):
+        """check_item_quantities against the bill's items, read under its row lock"""
+        unpaid = {
+            item["id"]: unpaid_quantity(BillItemRecord(*item))
+            for item in await conn.fetch(f"SELECT {BILL_ITEM_COLUMNS} FROM bill_items WHERE bill_id = $1", bill_id)
+        }
+        check_item_quantities(quantities, unpaid)
+
+    async def apply_payments(self, bill_id: str, payments: List[PaymentCreate]) -> Optional[List[Tuple[Payment, Bill]]]:
+        records = [PaymentRecord(id=str(uuid.uuid4()), processed_at=datetime.now(), **payment.model_dump()) for payment in payments]
+        quantities = batch_item_quantities(payments)
+
+        async with self._transaction() as conn:
+            # Locked like apply_payment's bill row; item paid quantities are
+            # only written under their bill's lock, so they stay put too
+            row = await conn.fetchrow(f"SELECT {BILL_COLUMNS} FROM bills WHERE id = $1 FOR UPDATE SKIP LOCKED", bill_id)
+            if row is None:
+                row = await conn.fetchrow(f"SELECT {BILL_COLUMNS} FROM bills WHERE id = $1 FOR UPDATE", bill_id)
+                if row is None:
+                    return None
+                self.payment_conflicts += 1
+            # Raising here rolls the transaction back before anything is written
+            await self._check_item_quantities(conn, bill_id, quantities)
+
+            bill, bills = BillRecord(*row), []
+            for record in records:
+                for key, value in payment_bill_updates(bill, record).items():
+                    setattr(bill, key, value)
+                bills.append(bill.to_model())
+            await conn.executemany(INSERT_PAYMENT, [record_values(record) for record in records])
+            # One write of the final state rather than one per payment
+            row = await self._update(conn, "bills", BILL_FIELDS, bill_id, bill_balance(bill.total, bill.paid or 0))
+            items = await conn.fetch(PAY_BILL_ITEMS, list(quantities), list(quantities.values()), bill_id) if quantities else []
+
+        await self._changed_many(
+            [("payment", bill_id, record.to_model()) for record in records]
+            + [("item", bill_id, BillItemRecord(*item).to_model()) for item in items]
+            + [("bill", bill_id, bill) for bill in bills[-1:]]
+        )
+        return [(record.to_model(), bill) for record, bill in zip(records, bills)]
+
+    async def get_payments_by_bill_id(self, bill_id: str) -> List[Payment]:
+        rows = await self._fetch(f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE bill_id = $1 ORDER BY seq", bill_id)
+        return [PaymentRecord(*row).to_model() for row in rows]
+
+    async def iter_payment_documents(self, bill_id: str, after: Optional[str] = None) -> AsyncIterator[dict]:
+        async for row in self._iter_bill_rows("payments", PAYMENT_FIELDS, bill_id, after):
+            yield _record(PaymentRecord, row).to_document()
+
+    # Derived totals: counted per read from the bill's indexed items and
+    # payments, as a cache here would have to be shared between processes
+    async def get_bill_totals(self, bill_id: str) -> Optional[BillTotals]:
+        row = await self._fetchrow(BILL_TOTALS, bill_id)
+        if not row:
+            return None
+        totals = BillTotalsRecord(payment_count=row["payment_count"], payment_total=row["payment_total"])
+        for values in row["item_values"]:
+            totals.add_item(BillItemRecord(*values))
+        return totals.to_model(_record(BillRecord, row))
+
+    async def verify_bill_totals(self, rebuild: bool = False) -> List[str]:
+        rows = await self._fetch("SELECT total, paid, remaining, status, id FROM bills ORDER BY id")
+        ids = [row["id"] for row in rows if not bill_balanced(*tuple(row)[:4])]
+        if not rebuild or not ids:
+            return ids
+        async with self._transaction() as conn:
+            rows = await conn.fetch("SELECT id, total, paid FROM bills WHERE id = ANY($1::varchar[]) ORDER BY id FOR UPDATE", ids)
+            bills = [
+                await self._update(conn, "bills", BILL_FIELDS, row["id"], bill_balance(row["total"], row["paid"] or 0))
+                for row in rows
+            ]
+        await self._changed_many([("bill", row["id"], BillRecord(*row).to_model()) for row in bills])
+        return ids
+
+    # Dashboard
+    async def _dashboard_records(self, restaurant: Optional[str]) -> List[Tuple[TableRecord, Optional[BillRecord], List[BillItemRecord]]]:
+        """Each table of the dashboard with its active bill and the bill's items, read from one snapshot"""
+        where, params = ("WHERE t.restaurant_name = $1", (restaurant,)) if restaurant is not None else ("", ())
+        active = f"{where} {'AND' if where else 'WHERE'} b.is_active"
+        async with self._transaction(isolation="repeatable_read", readonly=True) as conn:
+            tables = await conn.fetch(f"SELECT {_columns(TABLE_FIELDS, 't')} FROM tables t {where} ORDER BY t.number, t.seq", *params)
+            bills = await conn.fetch(
+                f"SELECT DISTINCT ON (b.table_id) {_columns(BILL_FIELDS, 'b')} FROM bills b JOIN tables t ON t.id = b.table_id "
+                f"{active} ORDER BY b.table_id, b.seq",
+                *params
+            )
+            items = await conn.fetch(
+                f"SELECT {_columns(BILL_ITEM_FIELDS, 'i')} FROM bill_items i JOIN bills b ON b.id = i.bill_id "
+                f"JOIN tables t ON t.id = b.table_id {active} ORDER BY i.seq",
+                *params
+            )
+
+        bill_by_table = {row["table_id"]: BillRecord(*row) for row in bills}
+        items_by_bill: Dict[str, List[BillItemRecord]] = {}
+        for row in items:
+            items_by_bill.setdefault(row["bill_id"], []).append(BillItemRecord(*row))
+        records = []
+        for row in tables:
+            bill = bill_by_table.get(row["id"])
+            records.append((TableRecord(*row), bill, items_by_bill.get(bill.id, []) if bill else []))
+        return records
+
+    async def get_dashboard_tables(self, restaurant: Optional[str] = None) -> List[DashboardTable]:
+        return [
+            DashboardTable.model_construct(
+                id=table.id,
+                number=table.number,
+                restaurant_name=table.restaurant_name,
+                bill=bill.to_model() if bill else None,
+                items=[item.to_model() for item in items],
+                guest_count=bill.guest_count or 0 if bill else 0,
+                start_time=bill.start_time if bill else None
+            )
+            for table, bill, items in await self._dashboard_records(restaurant)
+        ]
+
+    async def get_dashboard_documents(self, restaurant: Optional[str] = None) -> List[dict]:
+        return [
+            {
+                "id": table.id,
+                "number": table.number,
+                "restaurant_name": table.restaurant_name,
+                "bill": bill.to_document() if bill else None,
+                "items": [item.to_document() for item in items],
+                "guest_count": bill.guest_count or 0 if bill else 0,
+                "start_time": bill.start_time.isoformat() if bill and bill.start_time else None,
+            }
+            for table, bill, items in await self._dashboard_records(restaurant)
+        ]
+
+    # Versions
+    async def get_bill_version(self, id: str) -> Optional[str]:
+        row = await self._fetchrow(
+            "SELECT b.version AS bill_version, t.version AS table_version "
+            "FROM bills b LEFT JOIN tables t ON t.id = b.table_id WHERE b.id = $1",
+            id
+        )
+        if not row:
+            return None
+        return f"{self._epoch}-{row['bill_version']}-{row['table_version'] or 0}"
+
+    async def get_dashboard_version(self, restaurant: Optional[str] = None) -> str:
+        if restaurant is None:
+            # sum() of bigint is numeric, which would be decoded as hundredths
+            row = await self._fetchrow("SELECT COALESCE(sum(version), 0)::bigint AS version FROM splitpay_dashboard_versions")
+        else:
+            row = await self._fetchrow("SELECT version FROM splitpay_dashboard_versions WHERE restaurant_name = $1", restaurant)
+        return f"{self._epoch}-{row['version'] if row else 0}"
+
+    async def get_storage_stats(self) -> Dict[str, int]:
+        row = await self._fetchrow(
+            "SELECT (SELECT COUNT(*) FROM tables) AS tables, (SELECT COUNT(*) FROM bills) AS bills, "
+            "(SELECT COUNT(*) FROM bill_items) AS bill_items, (SELECT COUNT(*) FROM payments) AS payments"
+        )
+        stats = dict(row)
+        stats["pool_size"] = self._pool.get_size()
+        stats["pool_idle"] = self._pool.get_idle_size()
+        return stats
+
+    # Seeding
+    async def bulk_load(self, tables: List[TableRecord], bills: List[BillRecord], items: List[BillItemRecord],
+                        payments: List[PaymentRecord]) -> None:
+        async with self._transaction() as conn:
+            # COPY in foreign key order. The per-row triggers only bump
+            # versions, which is done once below, so they are disabled for the
+            # load; the ALTERs lock the tables until commit, so no other
+            # writer runs without them.
+            for table_name in ("tables", "bills", "bill_items", "payments"):
+                await conn.execute(f"ALTER TABLE {table_name} DISABLE TRIGGER USER")
+            await conn.copy_to_table("tables", source=_csv(
+                (t.id, t.number, t.restaurant_name, t.qr_code, t.is_active, t.created_at) for t in tables
+            ), columns=list(TABLE_FIELDS), format="csv")
+            await conn.copy_to_table("bills", source=_csv(
+                (b.id, b.table_id, _money(b.total), _money(b.remaining), _money(b.paid), b.status, b.guest_count,
+                 b.is_active, b.start_time) for b in bills
+            ), columns=list(BILL_FIELDS), format="csv")
+            await conn.copy_to_table("bill_items", source=_csv(
+                (i.id, i.bill_id, i.name, _money(i.price), _money(i.quantity), _money(i.paid_quantity)) for i in items
+            ), columns=list(BILL_ITEM_FIELDS), format="csv")
+            await conn.copy_to_table("payments", source=_csv(
+                (p.id, p.bill_id, _money(p.amount), json.dumps(p.items), _money(p.tip), p.payment_method, p.status,
+                 p.processed_at) for p in payments
+            ), columns=list(PAYMENT_FIELDS), format="csv")
+            for table_name in ("tables", "bills", "bill_items", "payments"):
+                await conn.execute(f"ALTER TABLE {table_name} ENABLE TRIGGER USER")
+            await conn.execute(
+                "SELECT splitpay_touch_dashboard(ARRAY(SELECT restaurant_name FROM tables WHERE id = ANY($1::varchar[])))",
+                list({t.id for t in tables} | {b.table_id for b in bills})
+            )
+
+
+class ChangeListener:
+    """Background task delivering NOTIFY change events from every worker to local subscribers.
+
+    Listens on a dedicated connection (outside the pool), reconnecting after
+    `retry_interval` seconds if it is lost.
+    """
+
+    def __init__(self, storage: PostgresStorage, retry_interval: float = 1.0):
+        self.storage = storage
+        self.retry_interval = retry_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.storage.dsn)
+                payloads: asyncio.Queue = asyncio.Queue()
+                await conn.add_listener(CHANGE_CHANNEL, lambda _conn, _pid, _channel, payload: payloads.put_nowait(payload))
+                conn.add_termination_listener(lambda _conn: payloads.put_nowait(None))
+                while (payload := await payloads.get()) is not None:
+                    await self.storage.publish_notification(payload)
+                print("Change listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Change listener failed: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(self.retry_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
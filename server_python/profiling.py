@@ -0,0 +1,175 @@
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from types import FrameType
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+class RequestProfiler:
+    """Stack-sampling profiler for a sampled fraction of requests, or slow ones.
+
+    A background thread samples the event loop thread's stack every
+    `interval` seconds while profiled requests are in flight, and charges the
+    sample to the request whose task is running at that moment: the one whose
+    outermost coroutine frame is on the stack. Requests on one event loop
+    interleave, so a process-wide profiler such as cProfile could not tell
+    them apart; the running task can.
+
+    A request's samples are only kept when it was picked by `sample_rate` or
+    took at least `slow_threshold` seconds. Its hottest frames then go into a
+    ring buffer of the last `max_entries` profiles. Samples measure time on
+    the event loop; time spent waiting (for SQLite's executor thread, say) is
+    the difference between `elapsed_ms` and `sampled_ms`.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, slow_threshold: float = 0.0, interval: float = 0.005,
+                 max_entries: int = 100, top: int = 15):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.interval = interval
+        self.top = top
+        self.profiles: Deque[Dict[str, Any]] = deque(maxlen=max_entries)
+        self._active: Dict[asyncio.Task, Tuple[FrameType, Counter]] = {}
+        # The same counters by each task's outermost coroutine frame, for the sampler
+        self._frames: Dict[FrameType, Counter] = {}
+        self._thread_id: Optional[int] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_threshold > 0
+
+    @classmethod
+    def from_env(cls) -> "RequestProfiler":
+        return cls(
+            sample_rate=float(os.getenv("SPLITPAY_PROFILE_SAMPLE_RATE", "0")),
+            slow_threshold=float(os.getenv("SPLITPAY_PROFILE_SLOW_MS", "0")) / 1000,
+            interval=float(os.getenv("SPLITPAY_PROFILE_INTERVAL_MS", "5")) / 1000,
+            max_entries=int(os.getenv("SPLITPAY_PROFILE_BUFFER", "100")),
+        )
+
+    def begin(self) -> Optional[Tuple[asyncio.Task, bool]]:
+        """Start profiling the current request, or return None to skip it"""
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_threshold <= 0:
+            return None
+        task = asyncio.current_task()
+        frame = getattr(task.get_coro(), "cr_frame", None) if task is not None else None
+        if frame is None:
+            return None
+        self._thread_id = threading.get_ident()
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+            self._sampler.start()
+        samples = Counter()
+        self._active[task] = frame, samples
+        self._frames[frame] = samples
+        return task, sampled
+
+    def end(self, token: Tuple[asyncio.Task, bool], elapsed: float, details: Dict[str, Any], keep: bool = True):
+        """Finish a request's profile, keeping it if it was sampled or slow (and `keep`)"""
+        task, sampled = token
+        frame, samples = self._active.pop(task, (None, None))
+        self._frames.pop(frame, None)
+        slow = self.slow_threshold > 0 and elapsed >= self.slow_threshold
+        if samples is None or not keep or not (sampled or slow):
+            return
+        self.profiles.append({
+            **details,
+            "reason": "slow" if slow else "sampled",
+            "at": datetime.now().isoformat(),
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "sampled_ms": round(sum(samples.values()) * self.interval * 1000, 3),
+            **self._summarize(samples),
+        })
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            if not self._frames:
+                continue
+            # Reading another thread's frames is a snapshot; at worst a sample
+            # lands on a neighbouring instruction
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            samples = None
+            while frame is not None and samples is None:
+                if len(stack) < 64:
+                    stack.append((frame.f_code, frame.f_lineno))
+                samples = self._frames.get(frame)
+                frame = frame.f_back
+            if samples is not None:
+                samples[tuple(stack)] += 1
+
+    def _summarize(self, samples: Counter) -> Dict[str, List[Dict[str, Any]]]:
+        """Top frames by self time (the line running) and by total time (the function anywhere on the stack)"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in samples.items():
+            if stack:
+                code, line = stack[0]
+                own[f"{code.co_filename}:{line} {code.co_name}"] += count
+            for code in {code for code, _ in stack}:
+                total[f"{code.co_filename}:{code.co_firstlineno} {code.co_name}"] += count
+
+        def rows(counter: Counter) -> List[Dict[str, Any]]:
+            return [
+                {"frame": frame, "samples": count, "ms": round(count * self.interval * 1000, 3)}
+                for frame, count in counter.most_common(self.top)
+            ]
+
+        return {"self": rows(own), "total": rows(total)}
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self._stopped.clear()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware handing every HTTP request to a RequestProfiler"""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = self.profiler.begin()
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        streaming = False
+
+        async def send_with_status(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(name == b"content-type" and value.startswith(b"text/event-stream")
+                                for name, value in message.get("headers", ()))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            # An event stream is slow by design, so it is never kept
+            self.profiler.end(token, time.perf_counter() - start, {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "route": getattr(route, "path", None),
+                "status": status,
+            }, keep=not streaming)
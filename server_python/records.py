@@ -0,0 +1,288 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Annotated, Any, Dict, List, Optional, Type
+from pydantic import BaseModel, TypeAdapter
+from money import format_cents, line_total
+from schemas import Table, Bill, BillItem, Payment, BillWithItems, BillTotals
+
+# Internal record types used by MemStorage. They are plain slotted
+# dataclasses holding already-validated values (amounts in cents); Pydantic
+# models are only built from them when a storage call returns data.
+#
+# to_document() gives the record as its model serializes to JSON (same keys,
+# same order, amounts as decimal strings) without building the model, for
+# hot paths that encode many records at once.
+
+
+@lru_cache(maxsize=None)
+def _field_adapter(model: Type[BaseModel], name: str) -> TypeAdapter:
+    field = model.model_fields[name]
+    if field.metadata:
+        return TypeAdapter(Annotated[(field.annotation, *field.metadata)])
+    return TypeAdapter(field.annotation)
+
+
+def validate_updates(model: Type[BaseModel], updates: dict) -> dict:
+    """Validate a partial update against a model's fields, dropping unknown keys and the id"""
+    return {
+        key: _field_adapter(model, key).validate_python(value)
+        for key, value in updates.items()
+        if key in model.model_fields and key != "id"
+    }
+
+
+def _money(cents: Optional[int]) -> Optional[str]:
+    return format_cents(cents) if cents is not None else None
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def record_values(record) -> tuple:
+    """A record's field values in declaration order, as its constructor takes them"""
+    return tuple(getattr(record, name) for name in record.__slots__)
+
+
+@dataclass(slots=True)
+class TableRecord:
+    id: str
+    number: int
+    restaurant_name: str
+    qr_code: str
+    is_active: Optional[bool] = True
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_model(cls, table: Table) -> "TableRecord":
+        return cls(table.id, table.number, table.restaurant_name, table.qr_code, table.is_active, table.created_at)
+
+    def update(self, updates: dict):
+        """Apply updates already checked with validate_updates"""
+        for key, value in updates.items():
+            setattr(self, key, value)
+
+    def to_model(self) -> Table:
+        return Table.model_construct(
+            id=self.id,
+            number=self.number,
+            restaurant_name=self.restaurant_name,
+            qr_code=self.qr_code,
+            is_active=self.is_active,
+            created_at=self.created_at,
+        )
+
+    def to_document(self) -> dict:
+        return {
+            "number": self.number,
+            "restaurant_name": self.restaurant_name,
+            "qr_code": self.qr_code,
+            "is_active": self.is_active,
+            "id": self.id,
+            "created_at": _timestamp(self.created_at),
+        }
+
+
+@dataclass(slots=True)
+class BillRecord:
+    id: str
+    table_id: str
+    total: int
+    remaining: int
+    paid: Optional[int] = 0
+    status: Optional[str] = "unpaid"
+    guest_count: Optional[int] = 1
+    is_active: Optional[bool] = True
+    start_time: Optional[datetime] = None
+
+    @classmethod
+    def from_model(cls, bill: Bill) -> "BillRecord":
+        return cls(bill.id, bill.table_id, bill.total, bill.remaining, bill.paid, bill.status,
+                   bill.guest_count, bill.is_active, bill.start_time)
+
+    def update(self, updates: dict):
+        """Apply updates already checked with validate_updates"""
+        for key, value in updates.items():
+            setattr(self, key, value)
+
+    def _fields(self) -> dict:
+        return {
+            "id": self.id,
+            "table_id": self.table_id,
+            "total": self.total,
+            "paid": self.paid,
+            "remaining": self.remaining,
+            "status": self.status,
+            "guest_count": self.guest_count,
+            "is_active": self.is_active,
+            "start_time": self.start_time,
+        }
+
+    def to_model(self) -> Bill:
+        return Bill.model_construct(**self._fields())
+
+    def to_document(self) -> dict:
+        return {
+            "table_id": self.table_id,
+            "total": _money(self.total),
+            "paid": _money(self.paid),
+            "remaining": _money(self.remaining),
+            "status": self.status,
+            "guest_count": self.guest_count,
+            "is_active": self.is_active,
+            "id": self.id,
+            "start_time": _timestamp(self.start_time),
+        }
+
+    def to_model_with_items(self, items: List["BillItemRecord"], table: TableRecord) -> BillWithItems:
+        return BillWithItems.model_construct(
+            **self._fields(),
+            items=[item.to_model() for item in items],
+            table=table.to_model(),
+        )
+
+
+@dataclass(slots=True)
+class BillItemRecord:
+    id: str
+    bill_id: str
+    name: str
+    price: int
+    quantity: int = 100
+    paid_quantity: Optional[int] = 0
+
+    @classmethod
+    def from_model(cls, item: BillItem) -> "BillItemRecord":
+        return cls(item.id, item.bill_id, item.name, item.price, item.quantity, item.paid_quantity)
+
+    def update(self, updates: dict):
+        """Apply updates already checked with validate_updates"""
+        for key, value in updates.items():
+            setattr(self, key, value)
+
+    def to_model(self) -> BillItem:
+        return BillItem.model_construct(
+            id=self.id,
+            bill_id=self.bill_id,
+            name=self.name,
+            price=self.price,
+            quantity=self.quantity,
+            paid_quantity=self.paid_quantity,
+        )
+
+    def to_document(self) -> dict:
+        return {
+            "bill_id": self.bill_id,
+            "name": self.name,
+            "price": _money(self.price),
+            "quantity": _money(self.quantity),
+            "paid_quantity": _money(self.paid_quantity),
+            "id": self.id,
+        }
+
+
+@dataclass(slots=True)
+class PaymentRecord:
+    id: str
+    bill_id: str
+    amount: int
+    items: Any
+    tip: Optional[int] = 0
+    payment_method: Optional[str] = "card"
+    status: Optional[str] = "completed"
+    processed_at: Optional[datetime] = None
+
+    @classmethod
+    def from_model(cls, payment: Payment) -> "PaymentRecord":
+        return cls(payment.id, payment.bill_id, payment.amount, payment.items, payment.tip,
+                   payment.payment_method, payment.status, payment.processed_at)
+
+    def to_model(self) -> Payment:
+        return Payment.model_construct(
+            id=self.id,
+            bill_id=self.bill_id,
+            amount=self.amount,
+            tip=self.tip,
+            items=self.items,
+            payment_method=self.payment_method,
+            status=self.status,
+            processed_at=self.processed_at,
+        )
+
+    def to_document(self) -> dict:
+        return {
+            "bill_id": self.bill_id,
+            "amount": _money(self.amount),
+            "tip": _money(self.tip),
+            "items": self.items,
+            "payment_method": self.payment_method,
+            "status": self.status,
+            "id": self.id,
+            "processed_at": _timestamp(self.processed_at),
+        }
+
+
+def unpaid_quantity(item) -> int:
+    """Hundredths of an item not paid for yet"""
+    return max(0, item.quantity - (item.paid_quantity or 0))
+
+
+def item_outstanding(item) -> int:
+    """Cents still owed on an item: the line total of its unpaid quantity"""
+    return line_total(item.price, unpaid_quantity(item))
+
+
+@dataclass(slots=True)
+class BillTotalsRecord:
+    """Running aggregates over a bill's items and payments.
+
+    Each change is applied as a delta (an item is removed with its old
+    values and added back with its new ones), so keeping these current
+    costs O(1) per item or payment instead of a pass over the whole bill.
+    """
+    item_total: int = 0
+    paid_quantity: int = 0
+    outstanding_total: int = 0
+    payment_count: int = 0
+    payment_total: int = 0
+    # item id -> cents still owed on it, and hundredths not yet paid for
+    outstanding: Dict[str, int] = field(default_factory=dict)
+    outstanding_quantity: Dict[str, int] = field(default_factory=dict)
+
+    def add_item(self, item) -> None:
+        owed = item_outstanding(item)
+        self.item_total += line_total(item.price, item.quantity)
+        self.paid_quantity += item.paid_quantity or 0
+        self.outstanding_total += owed
+        self.outstanding[item.id] = owed
+        self.outstanding_quantity[item.id] = unpaid_quantity(item)
+
+    def remove_item(self, item) -> None:
+        self.item_total -= line_total(item.price, item.quantity)
+        self.paid_quantity -= item.paid_quantity or 0
+        self.outstanding_total -= self.outstanding.pop(item.id, 0)
+        self.outstanding_quantity.pop(item.id, None)
+
+    def add_payment(self, payment) -> None:
+        self.payment_count += 1
+        self.payment_total += payment.amount + (payment.tip or 0)
+
+    def to_model(self, bill, item_ids: Optional[List[str]] = None) -> BillTotals:
+        """The totals with the bill's balance; `item_ids` gives the order to list items in"""
+        if item_ids is None:
+            item_ids = list(self.outstanding)
+        return BillTotals.model_construct(
+            bill_id=bill.id,
+            total=bill.total,
+            paid=bill.paid or 0,
+            remaining=bill.remaining,
+            status=bill.status,
+            item_total=self.item_total,
+            paid_quantity=self.paid_quantity,
+            outstanding_total=self.outstanding_total,
+            outstanding={id: self.outstanding[id] for id in item_ids},
+            outstanding_quantity={id: self.outstanding_quantity[id] for id in item_ids},
+            payment_count=self.payment_count,
+            payment_total=self.payment_total,
+        )
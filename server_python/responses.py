@@ -0,0 +1,45 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# orjson is optional: it encodes several times faster than the json module,
+# which is kept as the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return jsonable_encoder(value)
+
+
+def dumps(content: Any) -> bytes:
+    """Encode JSON compactly; models are encoded as their JSON form"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoding with orjson when it is installed.
+
+    Content is encoded as given, without response model validation. It is
+    meant for data that already has the response's JSON shape, such as
+    storage documents (see records.py), where building and re-validating
+    models only to serialize them again is the dominant cost.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,10 +1,63 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
-from storage import storage
-from schemas import Table, TableCreate, Bill, BillCreate, BillItem, BillItemCreate, Payment, PaymentCreate, BillWithItems, DashboardTable
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import hmac
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pydantic import TypeAdapter, ValidationError
+from typing import Annotated, AsyncIterator, Awaitable, Callable, List, Dict, Any, Optional, Tuple
+from storage import IStorage, storage
+from archive import Compactor
+from wal import Snapshotter
+from seed import SeedConfig, seed_storage
+from export import CSV_COLUMNS, MEDIA_TYPES, export_chunks, local_time
+from events import ALL, table_topic, restaurant_topic
+from response_cache import ResponseCache
+from idempotency import IdempotencyKeyReused, IdempotencyStore, SharedIdempotencyStore
+from split import compute_split
+from responses import FastJSONResponse, dumps
+from metrics import CONTENT_TYPE, Counter, Gauge, MetricsMiddleware, instrument_storage, registry
+from profiling import ProfilingMiddleware, RequestProfiler
+from schemas import Table, TableCreate, Bill, BillCreate, BillItem, BillItemCreate, Payment, PaymentCreate, PaymentBatch, PaymentResult, BillWithItems, BillTotals, BillSplit, SplitRequest, DashboardTable
 
-app = FastAPI(title="SplitBill API", description="Restaurant group payment system API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Archival, snapshotting and change log polling run only when the storage has them configured
+    tasks = []
+    if getattr(storage, "archive", None) is not None:
+        tasks.append(Compactor(storage, interval=float(os.getenv("SPLITPAY_ARCHIVE_INTERVAL", "30"))))
+    if getattr(storage, "shared", False) and hasattr(storage, "publish_notification"):
+        from postgres_storage import ChangeListener
+        tasks.append(ChangeListener(storage))
+    elif getattr(storage, "shared", False):
+        from sqlite_storage import ChangeLogPoller
+        tasks.append(ChangeLogPoller(storage, interval=float(os.getenv("SPLITPAY_CHANGE_POLL_INTERVAL", "0.1"))))
+    if getattr(storage, "wal", None) is not None:
+        tasks.append(Snapshotter(
+            storage,
+            interval=float(os.getenv("SPLITPAY_SNAPSHOT_INTERVAL", "300")),
+            max_log_bytes=int(os.getenv("SPLITPAY_SNAPSHOT_LOG_BYTES", str(64 * 1024 * 1024))),
+        ))
+    for task in tasks:
+        task.start()
+
+    # Synthetic data for an empty storage, e.g. SPLITPAY_SEED="restaurants=5,tables=20,bills=30"
+    seed_spec = os.getenv("SPLITPAY_SEED")
+    if seed_spec and (await storage.get_storage_stats())["tables"] == 0:
+        await seed_storage(storage, SeedConfig.from_spec(seed_spec))
+    yield
+    for task in tasks:
+        await task.stop()
+    profiler.stop()
+    if getattr(storage, "wal", None) is not None:
+        # A final snapshot keeps the next startup's replay short
+        await storage.snapshot()
+    if hasattr(storage, "aclose"):
+        # Connection pools are closed in the loop that opened them
+        await storage.aclose()
+
+app = FastAPI(title="SplitBill API", description="Restaurant group payment system API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -15,14 +68,125 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Tables endpoints
-@app.get("/api/tables", response_model=List[Table])
-async def get_tables():
-    """Get all tables"""
+# Latency histograms per route and per storage method, served on /metrics
+METRICS_ENABLED = os.getenv("SPLITPAY_METRICS", "1") == "1"
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrument_storage(storage, IStorage)
+
+# Opt-in profiles of sampled or slow requests, served on /debug/profiles, e.g.
+# SPLITPAY_PROFILE_SLOW_MS=200 SPLITPAY_PROFILE_SAMPLE_RATE=0.01 SPLITPAY_DEBUG_TOKEN=...
+profiler = RequestProfiler.from_env()
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+def etag_for(version: str) -> str:
+    return f'"{version}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Check If-None-Match against an ETag (weak comparison, as RFC 9110 requires)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+bill_items_adapter = TypeAdapter(List[BillItemCreate])
+payments_adapter = TypeAdapter(List[PaymentCreate])
+
+# Ready-to-send BillWithItems JSON, keyed by bill id and version
+bill_cache = ResponseCache(int(os.getenv("SPLITPAY_BILL_CACHE_SIZE", "1024")))
+
+async def cached_bill_response(bill_id: str, version: str, etag: str) -> Optional[Response]:
+    """Serve a bill with items from the response cache, building it on a miss"""
+    body = bill_cache.get(bill_id, version)
+    if body is None:
+        bill = await storage.get_bill_with_items(bill_id)
+        if not bill:
+            return None
+        body = bill.model_dump_json().encode()
+        bill_cache.put(bill_id, version, body)
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+# Listings: ?limit=&cursor= pages (the next cursor is sent in X-Next-Cursor
+# and a Link header) and ?fields= projections, encoded from storage documents
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH = 500
+
+def parse_fields(fields: Optional[str], model) -> Optional[Tuple[str, ...]]:
+    """Field names of a ?fields=a,b,c projection, checked against the model"""
+    if fields is None:
+        return None
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in model.model_fields]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown) or fields}")
+    return names
+
+def project(documents: List[dict], fields: Optional[Tuple[str, ...]]) -> List[dict]:
+    if fields is None:
+        return documents
+    return [{name: document[name] for name in fields} for document in documents]
+
+async def next_batch(documents: AsyncIterator[dict], size: int) -> List[dict]:
+    batch = []
+    async for document in documents:
+        batch.append(document)
+        if len(batch) == size:
+            break
+    return batch
+
+async def list_response(request: Request, documents: AsyncIterator[dict], limit: Optional[int],
+                        fields: Optional[Tuple[str, ...]]) -> Response:
+    """A JSON array of documents: one page when there is a limit, otherwise all of them,
+    streamed in batches when there are more than fit in one"""
+    if limit is not None:
+        page = await next_batch(documents, limit + 1)
+        await documents.aclose()
+        headers = {}
+        if len(page) > limit:
+            page = page[:limit]
+            cursor = page[-1]["id"]
+            headers["X-Next-Cursor"] = cursor
+            headers["Link"] = f'<{request.url.include_query_params(cursor=cursor)}>; rel="next"'
+        return FastJSONResponse(project(page, fields), headers=headers)
+    
+    first = await next_batch(documents, STREAM_BATCH)
+    if len(first) < STREAM_BATCH:
+        return FastJSONResponse(project(first, fields))
+    
+    async def stream():
+        try:
+            yield b"[" + dumps(project(first, fields))[1:-1]
+            while batch := await next_batch(documents, STREAM_BATCH):
+                yield b"," + dumps(project(batch, fields))[1:-1]
+            yield b"]"
+        finally:
+            await documents.aclose()
+    
+    return StreamingResponse(stream(), media_type="application/json")
+
+async def list_or_error(request: Request, documents: AsyncIterator[dict], limit: Optional[int],
+                        fields: Optional[Tuple[str, ...]], detail: str) -> Response:
     try:
-        return await storage.get_all_tables()
+        return await list_response(request, documents, limit, fields)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception:
-        raise HTTPException(status_code=500, detail="Failed to fetch tables")
+        raise HTTPException(status_code=500, detail=detail)
+
+# Tables endpoints
+@app.get("/api/tables", response_model=List[Table])
+async def get_tables(request: Request, restaurant: Optional[str] = None, cursor: Optional[str] = None,
+                     limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None):
+    """Get tables by number, optionally of a single restaurant, paginated and projected"""
+    projection = parse_fields(fields, Table)
+    return await list_or_error(request, storage.iter_table_documents(restaurant, cursor), limit, projection,
+                               "Failed to fetch tables")
 
 @app.post("/api/tables", response_model=Table, status_code=status.HTTP_201_CREATED)
 async def create_table(table_data: TableCreate):
@@ -62,13 +226,20 @@ async def get_bill_by_table_id(table_id: str):
         raise HTTPException(status_code=500, detail="Failed to fetch bill")
 
 @app.get("/api/bills/{bill_id}", response_model=BillWithItems)
-async def get_bill(bill_id: str):
+async def get_bill(bill_id: str, request: Request):
     """Get a bill with items by ID"""
     try:
-        bill = await storage.get_bill_with_items(bill_id)
-        if not bill:
+        version = await storage.get_bill_version(bill_id)
+        if version is None:
             raise HTTPException(status_code=404, detail="Bill not found")
-        return bill
+        etag = etag_for(version)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        
+        cached = await cached_bill_response(bill_id, version, etag)
+        if not cached:
+            raise HTTPException(status_code=404, detail="Bill not found")
+        return cached
     except HTTPException:
         raise
     except Exception:
@@ -92,17 +263,47 @@ async def update_bill(bill_id: str, updates: Dict[str, Any]):
         return bill
     except HTTPException:
         raise
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid bill data")
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to update bill")
 
-# Bill Items endpoints
-@app.get("/api/bills/{bill_id}/items", response_model=List[BillItem])
-async def get_bill_items(bill_id: str):
-    """Get all items for a bill"""
+@app.get("/api/bills/{bill_id}/totals", response_model=BillTotals)
+async def get_bill_totals(bill_id: str):
+    """Get a bill's balance with what is still owed on each of its items"""
+    try:
+        totals = await storage.get_bill_totals(bill_id)
+        if not totals:
+            raise HTTPException(status_code=404, detail="Bill not found")
+        return totals
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to fetch bill totals")
+
+@app.post("/api/bills/{bill_id}/split", response_model=BillSplit)
+async def split_bill(bill_id: str, split_request: SplitRequest):
+    """Work out each guest's share of what is still owed on a bill, evenly, by item, by percentage or mixed"""
     try:
-        return await storage.get_bill_items(bill_id)
+        totals = await storage.get_bill_totals(bill_id)
+        if not totals:
+            raise HTTPException(status_code=404, detail="Bill not found")
+        return compute_split(totals, split_request)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception:
-        raise HTTPException(status_code=500, detail="Failed to fetch bill items")
+        raise HTTPException(status_code=500, detail="Failed to split bill")
+
+# Bill Items endpoints
+@app.get("/api/bills/{bill_id}/items", response_model=List[BillItem])
+async def get_bill_items(bill_id: str, request: Request, cursor: Optional[str] = None,
+                         limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None):
+    """Get the items of a bill, paginated and projected"""
+    projection = parse_fields(fields, BillItem)
+    return await list_or_error(request, storage.iter_bill_item_documents(bill_id, cursor), limit, projection,
+                               "Failed to fetch bill items")
 
 @app.post("/api/bills/{bill_id}/items", response_model=BillItem, status_code=status.HTTP_201_CREATED)
 async def create_bill_item(bill_id: str, item_data: Dict[str, Any]):
@@ -114,6 +315,23 @@ async def create_bill_item(bill_id: str, item_data: Dict[str, Any]):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid bill item data")
 
+@app.post("/api/bills/{bill_id}/items:batch", response_model=List[BillItem], status_code=status.HTTP_201_CREATED)
+async def create_bill_items(bill_id: str, items_data: List[Dict[str, Any]]):
+    """Create several bill items at once, adding them to the bill total"""
+    try:
+        items = bill_items_adapter.validate_python([{**item_data, "bill_id": bill_id} for item_data in items_data])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid bill item data")
+    
+    try:
+        if not await storage.get_bill(bill_id):
+            raise HTTPException(status_code=404, detail="Bill not found")
+        return await storage.create_bill_items(items)
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to create bill items")
+
 @app.patch("/api/bill-items/{item_id}", response_model=BillItem)
 async def update_bill_item(item_id: str, updates: Dict[str, Any]):
     """Update a bill item"""
@@ -124,74 +342,151 @@ async def update_bill_item(item_id: str, updates: Dict[str, Any]):
         return item
     except HTTPException:
         raise
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid bill item data")
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to update bill item")
 
 # Payments endpoints
+# Responses to payments sent with an Idempotency-Key, replayed to retries.
+# Worker processes sharing a storage share the keys through it too, so a
+# retry reaching another worker is not paid again.
+IDEMPOTENCY_TTL = float(os.getenv("SPLITPAY_IDEMPOTENCY_TTL", str(24 * 3600)))
+if getattr(storage, "shared", False):
+    payment_idempotency = SharedIdempotencyStore(storage, IDEMPOTENCY_TTL)
+else:
+    payment_idempotency = IdempotencyStore(int(os.getenv("SPLITPAY_IDEMPOTENCY_KEYS", "10000")), IDEMPOTENCY_TTL)
+
+async def idempotent_response(idempotency_key: str, fingerprint: str, execute: Callable[[], Awaitable[Any]]) -> Response:
+    """A 201 response with `execute`'s result, or the stored one for a retried Idempotency-Key"""
+    async def body() -> bytes:
+        return (await execute()).model_dump_json().encode()
+    
+    try:
+        content, replayed = await payment_idempotency.run(idempotency_key, fingerprint, body)
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different payment")
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return Response(content, status_code=status.HTTP_201_CREATED, media_type="application/json", headers=headers)
+
+async def unpayable_bill(bill_id: str) -> HTTPException:
+    """The error for a payment to a bill storage did not take it for: archived or unknown"""
+    if await storage.get_bill(bill_id):
+        return HTTPException(status_code=409, detail="Bill is archived")
+    return HTTPException(status_code=404, detail="Bill not found")
+
+async def apply_payment(payment_data: PaymentCreate) -> Payment:
+    try:
+        result = await storage.apply_payment(payment_data)
+    except ValueError as e:
+        # An item not on the bill, or paid for beyond its unpaid quantity;
+        # anything else is a server error and goes on to the 500 handler
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise await unpayable_bill(payment_data.bill_id)
+    return result[0]
+
 @app.post("/api/payments", response_model=Payment, status_code=status.HTTP_201_CREATED)
-async def create_payment(payment_data: PaymentCreate):
-    """Create a new payment"""
+async def create_payment(payment_data: PaymentCreate,
+                         idempotency_key: Annotated[Optional[str], Header(min_length=1, max_length=255)] = None):
+    """Create a new payment.
+    
+    With an Idempotency-Key header, a retry with the same key and payment gets the first response back
+    (marked Idempotent-Replayed) instead of paying again; reusing a key for another payment is an error.
+    """
+    if idempotency_key is None:
+        return await apply_payment(payment_data)
+    return await idempotent_response(idempotency_key, payment_data.model_dump_json(), lambda: apply_payment(payment_data))
+
+async def apply_payments(bill_id: str, payments: List[PaymentCreate]) -> PaymentBatch:
     try:
-        payment = await storage.create_payment(payment_data)
-        
-        # Update bill with new payment
-        bill = await storage.get_bill(payment_data.bill_id)
-        if bill:
-            total_amount = float(payment_data.amount) + float(payment_data.tip or "0")
-            new_paid = float(bill.paid or "0") + total_amount
-            new_remaining = float(bill.total) - new_paid
-            
-            status_value = "unpaid"
-            if new_remaining <= 0:
-                status_value = "paid"
-            elif new_paid > 0:
-                status_value = "partial"
-            
-            await storage.update_bill(bill.id, {
-                "paid": f"{new_paid:.2f}",
-                "remaining": f"{max(0, new_remaining):.2f}",
-                "status": status_value,
-            })
-            
-            # Update paid quantities for items
-            if hasattr(payment_data.items, '__iter__') and payment_data.items:
-                for item_payment in payment_data.items:
-                    if isinstance(item_payment, dict):
-                        item_id = item_payment.get("itemId")
-                        quantity = item_payment.get("quantity")
-                        
-                        if item_id and quantity:
-                            bill_item = await storage.get_bill_item(item_id)
-                            if bill_item:
-                                new_paid_qty = float(bill_item.paid_quantity or "0") + float(quantity)
-                                await storage.update_bill_item(item_id, {
-                                    "paid_quantity": f"{new_paid_qty:.2f}",
-                                })
-        
-        return payment
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Invalid payment data")
+        results = await storage.apply_payments(bill_id, payments)
+        if results is None:
+            raise await unpayable_bill(bill_id)
+        bill = await storage.get_bill_with_items(bill_id)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Paying for more of an item than is left unpaid
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to apply payments")
+    return PaymentBatch.model_construct(
+        bill=bill,
+        payments=[
+            PaymentResult.model_construct(payment=payment, remaining=after.remaining, status=after.status)
+            for payment, after in results
+        ],
+    )
 
-@app.get("/api/payments/bill/{bill_id}", response_model=List[Payment])
-async def get_payments_by_bill(bill_id: str):
-    """Get all payments for a bill"""
+@app.post("/api/bills/{bill_id}/payments:batch", response_model=PaymentBatch, status_code=status.HTTP_201_CREATED)
+async def create_payments(bill_id: str, payments_data: List[Dict[str, Any]],
+                          idempotency_key: Annotated[Optional[str], Header(min_length=1, max_length=255)] = None):
+    """Settle a table: apply every guest's payment to a bill at once, all or none.
+    
+    The item quantities of the whole batch are checked against what is still unpaid before anything is
+    written. Returns the final bill with its items and, per payment, the bill's balance after it.
+    Idempotency-Key works as for POST /api/payments, covering the batch as a whole.
+    """
     try:
-        return await storage.get_payments_by_bill_id(bill_id)
+        payments = payments_adapter.validate_python([{**payment_data, "bill_id": bill_id} for payment_data in payments_data])
     except Exception:
-        raise HTTPException(status_code=500, detail="Failed to fetch payments")
+        raise HTTPException(status_code=400, detail="Invalid payment data")
+    if not payments:
+        raise HTTPException(status_code=400, detail="No payments to apply")
+    
+    if idempotency_key is None:
+        return await apply_payments(bill_id, payments)
+    fingerprint = payments_adapter.dump_json(payments).decode()
+    return await idempotent_response(idempotency_key, fingerprint, lambda: apply_payments(bill_id, payments))
+
+@app.get("/api/payments/bill/{bill_id}", response_model=List[Payment])
+async def get_payments_by_bill(bill_id: str, request: Request, cursor: Optional[str] = None,
+                               limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), fields: Optional[str] = None):
+    """Get the payments of a bill, paginated and projected"""
+    projection = parse_fields(fields, Payment)
+    return await list_or_error(request, storage.iter_payment_documents(bill_id, cursor), limit, projection,
+                               "Failed to fetch payments")
 
 # Dashboard endpoints  
 @app.get("/api/dashboard/tables", response_model=List[DashboardTable])
-async def get_dashboard_tables():
-    """Get dashboard data for all tables"""
+async def get_dashboard_tables(request: Request, restaurant: Optional[str] = None):
+    """Get dashboard data for all tables, optionally for a single restaurant"""
     try:
-        return await storage.get_dashboard_tables()
+        etag = etag_for(await storage.get_dashboard_version(restaurant))
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        
+        # Encoded as is: the documents already have DashboardTable's JSON form
+        return FastJSONResponse(await storage.get_dashboard_documents(restaurant), headers={"ETag": etag})
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to fetch dashboard data")
 
+# Export endpoints
+@app.get("/api/export/bills")
+async def export_bills(restaurant: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+                       records: str = Query("bills", pattern=f"^({'|'.join(CSV_COLUMNS)})$")):
+    """Stream the bills started in [start, end), optionally of a single restaurant, with their items and payments.
+    
+    NDJSON has a line per bill with its items and payments; CSV a row per bill, item or payment (per `records`).
+    """
+    documents = storage.iter_bill_exports(restaurant, local_time(start), local_time(end))
+    
+    async def stream():
+        try:
+            async for chunk in export_chunks(documents, format, records):
+                yield chunk
+        finally:
+            await documents.aclose()
+    
+    filename = f"bills.{format}" if format == "ndjson" else f"{records}.csv"
+    return StreamingResponse(stream(), media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 # QR Code endpoints
 @app.get("/api/qr/{table_number}/{restaurant}", response_model=BillWithItems)
-async def get_bill_via_qr(table_number: int, restaurant: str):
+async def get_bill_via_qr(table_number: int, restaurant: str, request: Request):
     """Get bill via QR code scan"""
     try:
         table = await storage.get_table_by_number(table_number, restaurant)
@@ -202,9 +497,106 @@ async def get_bill_via_qr(table_number: int, restaurant: str):
         if not bill:
             raise HTTPException(status_code=404, detail="No active bill for this table")
         
-        bill_with_items = await storage.get_bill_with_items(bill.id)
-        return bill_with_items
+        # The bill id is part of the tag: a new bill on the same table must not match
+        version = await storage.get_bill_version(bill.id)
+        etag = etag_for(f"{bill.id}-{version}")
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        
+        cached = await cached_bill_response(bill.id, version, etag)
+        if not cached:
+            raise HTTPException(status_code=404, detail="No active bill for this table")
+        return cached
     except HTTPException:
         raise
     except Exception:
-        raise HTTPException(status_code=500, detail="Failed to fetch bill via QR code")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to fetch bill via QR code")
+
+# Push endpoints (Server-Sent Events)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.get("/api/stream/tables/{table_id}")
+async def stream_table(table_id: str):
+    """Stream bill, item and payment changes for a table"""
+    table = await storage.get_table(table_id)
+    if not table:
+        raise HTTPException(status_code=404, detail="Table not found")
+    
+    subscription = storage.changes.subscribe(table_topic(table_id))
+    return StreamingResponse(subscription.frames(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/api/stream/dashboard")
+async def stream_dashboard(restaurant: Optional[str] = None):
+    """Stream bill, item and payment changes for the dashboard, optionally for a single restaurant"""
+    topic = restaurant_topic(restaurant) if restaurant is not None else ALL
+    subscription = storage.changes.subscribe(topic)
+    return StreamingResponse(subscription.frames(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# Cache statistics
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss counters for the bill response cache and the payment idempotency store"""
+    return {"bills": bill_cache.stats(), "payment_idempotency": payment_idempotency.stats()}
+
+# Metrics
+def collect_app_metrics():
+    """Counters kept by the bill cache, the idempotency store and the storage, read at scrape time"""
+    cache = bill_cache.stats()
+    hits = Counter("splitpay_bill_cache_hits_total", "Bill response cache hits")
+    hits.inc(cache["hits"])
+    misses = Counter("splitpay_bill_cache_misses_total", "Bill response cache misses")
+    misses.inc(cache["misses"])
+    entries = Gauge("splitpay_bill_cache_entries", "Bill responses held in the cache")
+    entries.labels().set(cache["entries"])
+    replays = Counter("splitpay_payment_replays_total", "Payment retries answered with the response stored for their Idempotency-Key")
+    replays.inc(payment_idempotency.replays)
+    metrics = [hits, misses, entries, replays]
+    # Only backends where payments can wait on one another count conflicts
+    if storage.payment_conflicts is not None:
+        conflicts = Counter("splitpay_payment_conflicts_total", "Payments that collided with a concurrent payment to the same bill")
+        conflicts.inc(storage.payment_conflicts)
+        metrics.append(conflicts)
+    return metrics
+
+registry.add_collector(collect_app_metrics)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+# Debug endpoints, available only when SPLITPAY_DEBUG_TOKEN is set
+def require_debug_token(request: Request):
+    token = os.getenv("SPLITPAY_DEBUG_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-debug-token", ""), token):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+@app.get("/debug/profiles", include_in_schema=False)
+async def get_profiles(request: Request, limit: int = 20):
+    """Get the most recent request profiles, newest first"""
+    require_debug_token(request)
+    profiles = list(profiler.profiles)[::-1][:limit]
+    return {
+        "enabled": profiler.enabled,
+        "sample_rate": profiler.sample_rate,
+        "slow_threshold_ms": profiler.slow_threshold * 1000,
+        "interval_ms": profiler.interval * 1000,
+        "profiles": profiles,
+    }
+
+@app.post("/debug/bill-totals/verify", include_in_schema=False)
+async def verify_bill_totals(request: Request, rebuild: bool = False):
+    """Check every bill's derived totals against its items and payments, correcting them with rebuild=true"""
+    require_debug_token(request)
+    return {"mismatched": await storage.verify_bill_totals(rebuild), "rebuilt": rebuild}
+
+# Storage statistics
+@app.get("/api/storage/stats")
+async def get_storage_stats():
+    """Get record counts held by the storage (the in-memory hot set for memory storage)"""
+    try:
+        return await storage.get_storage_stats()
+    except Exception:
+        raise HTTPException(status_code=500, detail="Failed to fetch storage stats")
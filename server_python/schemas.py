@@ -1,7 +1,8 @@
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict, Literal
 from pydantic import BaseModel
 from datetime import datetime
 import uuid
+from money import Money, Quantity
 
 # Table Models
 class TableBase(BaseModel):
@@ -20,9 +21,9 @@ class TableCreate(TableBase):
 # Bill Models  
 class BillBase(BaseModel):
     table_id: str
-    total: str
-    paid: Optional[str] = "0"
-    remaining: str
+    total: Money
+    paid: Optional[Money] = 0
+    remaining: Money
     status: Optional[str] = "unpaid"  # 'unpaid', 'partial', 'paid'
     guest_count: Optional[int] = 1
     is_active: Optional[bool] = True
@@ -38,9 +39,9 @@ class BillCreate(BillBase):
 class BillItemBase(BaseModel):
     bill_id: str
     name: str
-    price: str
-    quantity: str = "1"
-    paid_quantity: Optional[str] = "0"
+    price: Money
+    quantity: Quantity = 100
+    paid_quantity: Optional[Quantity] = 0
 
 class BillItem(BillItemBase):
     id: str
@@ -51,8 +52,8 @@ class BillItemCreate(BillItemBase):
 # Payment Models
 class PaymentBase(BaseModel):
     bill_id: str
-    amount: str
-    tip: Optional[str] = "0"
+    amount: Money
+    tip: Optional[Money] = 0
     items: Any  # JSON data for payment items
     payment_method: Optional[str] = "card"
     status: Optional[str] = "completed"
@@ -64,6 +65,49 @@ class Payment(PaymentBase):
 class PaymentCreate(PaymentBase):
     pass
 
+# Derived Models
+class BillTotals(BaseModel):
+    bill_id: str
+    total: Money
+    paid: Money
+    remaining: Money
+    status: str
+    item_total: Money
+    paid_quantity: Quantity
+    outstanding_total: Money
+    outstanding: Dict[str, Money]  # item id -> amount still owed
+    outstanding_quantity: Dict[str, Quantity]  # item id -> quantity not yet paid for
+    payment_count: int
+    payment_total: Money  # amounts plus tips
+
+# Split Models
+class SplitItemClaim(BaseModel):
+    item_id: str
+    quantity: Optional[Quantity] = None  # None: an even part of what the item's explicit claims leave
+
+class SplitGuest(BaseModel):
+    name: str
+    items: List[SplitItemClaim] = []
+    percentage: Optional[Money] = None  # percent, kept in hundredths (25 or "25.00")
+
+class SplitRequest(BaseModel):
+    mode: Literal["even", "by_item", "by_percentage", "mixed"]
+    guests: List[SplitGuest] = []
+
+class GuestShare(BaseModel):
+    name: str
+    item_amount: Money
+    shared_amount: Money
+    amount: Money
+    items: List[Dict[str, Any]]  # payment items payload for POST /api/payments
+
+class BillSplit(BaseModel):
+    bill_id: str
+    mode: str
+    remaining: Money
+    unassigned: Money
+    shares: List[GuestShare]
+
 # Combined Models
 class BillWithItems(Bill):
     items: List[BillItem]
@@ -76,4 +120,14 @@ class DashboardTable(BaseModel):
     bill: Optional[Bill] = None
     items: List[BillItem] = []
     guest_count: int = 0
-    start_time: Optional[datetime] = None
\ No newline at end of file
+    start_time: Optional[datetime] = None
+
+# Batch Results
+class PaymentResult(BaseModel):
+    payment: Payment
+    remaining: Money  # the bill's remaining once this payment was applied
+    status: str
+
+class PaymentBatch(BaseModel):
+    bill: BillWithItems
+    payments: List[PaymentResult]
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Synthetic data seeder: N restaurants x M tables x K historical bills, with
+their items and payments, bulk-loaded into a storage backend.
+
+As a CLI it seeds the backend configured by the environment
+(SPLITPAY_STORAGE, SPLITPAY_SQLITE_PATH, SPLITPAY_POSTGRES_DSN, SPLITPAY_WAL_DIR);
+a plain memory backend is discarded on exit, so that is only useful for
+timing.
+
+Usage: SPLITPAY_STORAGE=sqlite python seed.py [--restaurants 10] [--tables 20] [--bills 500]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+
+from money import line_total
+from records import TableRecord, BillRecord, BillItemRecord, PaymentRecord
+
+if TYPE_CHECKING:
+    from storage import IStorage
+
+# (name, min price, max price) in cents, by course
+MENU = {
+    "starter": [("Bruschetta", 600, 950), ("Caesar Salad", 900, 1450), ("Soup of the Day", 550, 850),
+                ("Calamari", 950, 1500), ("Burrata", 1100, 1600)],
+    "main": [("Margherita", 1050, 1450), ("Carbonara", 1300, 1800), ("Grilled Salmon", 2200, 3400),
+             ("Ribeye", 2800, 4200), ("Risotto", 1400, 2100), ("Burger", 1300, 1900)],
+    "dessert": [("Tiramisu", 650, 950), ("Panna Cotta", 600, 900), ("Gelato", 450, 750)],
+    "drink": [("Espresso", 200, 350), ("Sparkling Water", 300, 550), ("Beer", 450, 800),
+              ("Glass of Wine", 700, 1300), ("Wine Bottle (Shared)", 2800, 7500)],
+}
+
+GUEST_WEIGHTS = {1: 8, 2: 35, 3: 15, 4: 22, 5: 7, 6: 8, 7: 2, 8: 3}
+PAYMENT_METHODS = {"card": 80, "apple_pay": 12, "cash": 8}
+
+
+@dataclass
+class SeedConfig:
+    restaurants: int = 10
+    tables: int = 20  # per restaurant
+    bills: int = 50  # closed, historical bills per table
+    open_ratio: float = 0.6  # share of tables with a bill in progress
+    days: int = 90  # history spans this many days back
+    seed: int = 0
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "SeedConfig":
+        """Parse "restaurants=5,tables=20,bills=30" (as in SPLITPAY_SEED)"""
+        types = {field.name: field.type for field in fields(cls)}
+        values = {}
+        for part in filter(None, spec.split(",")):
+            key, _, value = part.partition("=")
+            key = key.strip()
+            if key not in types:
+                raise ValueError(f"Unknown seed setting: {key}")
+            values[key] = float(value) if types[key] in (float, "float") else int(value)
+        return cls(**values)
+
+
+class _Generator:
+    def __init__(self, config: SeedConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.now = datetime.now()
+        self.guest_counts, self.guest_weights = zip(*GUEST_WEIGHTS.items())
+        self.methods, self.method_weights = zip(*PAYMENT_METHODS.items())
+
+    def id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def menu(self) -> Dict[str, List[Tuple[str, int]]]:
+        """A restaurant's menu: every dish at a price of its own, rounded to 50 cents"""
+        return {
+            course: [(name, self.rng.randint(low // 50, high // 50) * 50) for name, low, high in dishes]
+            for course, dishes in MENU.items()
+        }
+
+    def order(self, menu, bill_id: str, guests: int) -> List[BillItemRecord]:
+        rng = self.rng
+        lines = [rng.choice(menu["main"]) for _ in range(guests)]
+        lines += [rng.choice(menu["starter"]) for _ in range(rng.randint(0, max(1, guests // 2)))]
+        lines += [rng.choice(menu["dessert"]) for _ in range(rng.randint(0, guests))]
+        items = [BillItemRecord(self.id(), bill_id, name, price, 100, 0) for name, price in lines]
+        for name, price in rng.sample(menu["drink"], rng.randint(1, 3)):
+            quantity = 100 if "Bottle" in name else rng.randint(1, guests) * 100
+            items.append(BillItemRecord(self.id(), bill_id, name, price, quantity, 0))
+        return items
+
+    def payments(self, bill_id: str, items: List[BillItemRecord], total: int, payers: int, at: datetime) -> List[PaymentRecord]:
+        """Payments covering `payers` even shares of the total, with tips"""
+        rng = self.rng
+        share, residue = divmod(total, payers)
+        payments = []
+        for i in range(payers):
+            amount = share + (1 if i < residue else 0)
+            paid_items = [{"itemId": item.id, "quantity": item.quantity / 100} for item in items] if payers == 1 else []
+            payments.append(PaymentRecord(
+                id=self.id(),
+                bill_id=bill_id,
+                amount=amount,
+                items=paid_items,
+                tip=amount * rng.choice((0, 0, 5, 10, 10, 15, 18, 20)) // 100,
+                payment_method=rng.choices(self.methods, self.method_weights)[0],
+                status="completed",
+                processed_at=at + timedelta(minutes=rng.randint(40, 150)),
+            ))
+        return payments
+
+    def bill(self, menu, table_id: str, start_time: datetime, open_bill: bool):
+        rng = self.rng
+        bill_id = self.id()
+        guests = rng.choices(self.guest_counts, self.guest_weights)[0]
+        items = self.order(menu, bill_id, guests)
+        total = sum(line_total(item.price, item.quantity) for item in items)
+
+        if open_bill:
+            # A table mid-meal: maybe one guest has already paid their share
+            payers = guests if guests > 1 and rng.random() < 0.3 else 0
+            payments = self.payments(bill_id, items, total, payers, start_time)[:1] if payers else []
+        else:
+            payers = 1 if guests == 1 or rng.random() < 0.3 else guests
+            payments = self.payments(bill_id, items, total, payers, start_time)
+            for item in items:
+                item.paid_quantity = item.quantity
+
+        paid = sum(payment.amount + payment.tip for payment in payments)
+        remaining = max(0, total - paid)
+        status = "paid" if remaining == 0 else "partial" if paid > 0 else "unpaid"
+        bill = BillRecord(
+            id=bill_id, table_id=table_id, total=total, remaining=remaining, paid=paid, status=status,
+            guest_count=guests, is_active=open_bill, start_time=start_time,
+        )
+        return bill, items, payments
+
+    def restaurant(self, index: int):
+        config, rng = self.config, self.rng
+        name = f"restaurant-{index + 1}"
+        menu = self.menu()
+        tables, bills, items, payments = [], [], [], []
+        for number in range(1, config.tables + 1):
+            table = TableRecord(
+                id=self.id(), number=number, restaurant_name=name, qr_code=f"https://splitbill.app/t/{number}/{name}",
+                is_active=True, created_at=self.now - timedelta(days=config.days),
+            )
+            tables.append(table)
+            starts = sorted(
+                self.now - timedelta(seconds=rng.randint(3 * 3600, config.days * 86400)) for _ in range(config.bills)
+            )
+            if rng.random() < config.open_ratio:
+                starts.append(self.now - timedelta(minutes=rng.randint(5, 150)))
+            for i, start_time in enumerate(starts):
+                bill, bill_items, bill_payments = self.bill(menu, table.id, start_time, open_bill=i >= config.bills)
+                bills.append(bill)
+                items += bill_items
+                payments += bill_payments
+        return tables, bills, items, payments
+
+
+def generate(config: SeedConfig) -> Iterator[Tuple[List[TableRecord], List[BillRecord], List[BillItemRecord], List[PaymentRecord]]]:
+    """Yield the tables, bills, items and payments of one restaurant at a time"""
+    generator = _Generator(config)
+    for index in range(config.restaurants):
+        yield generator.restaurant(index)
+
+
+async def seed_storage(storage: "IStorage", config: SeedConfig) -> Dict[str, int]:
+    """Generate data and bulk-load it into a storage; returns record counts"""
+    counts = {"tables": 0, "bills": 0, "bill_items": 0, "payments": 0}
+    for tables, bills, items, payments in generate(config):
+        await storage.bulk_load(tables, bills, items, payments)
+        counts["tables"] += len(tables)
+        counts["bills"] += len(bills)
+        counts["bill_items"] += len(items)
+        counts["payments"] += len(payments)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    for field in fields(SeedConfig):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=float if field.type in (float, "float") else int,
+                            default=field.default)
+    args = parser.parse_args()
+    config = SeedConfig(**{field.name: getattr(args, field.name) for field in fields(SeedConfig)})
+
+    os.environ.setdefault("SPLITPAY_SAMPLE_DATA", "0")
+    from storage import storage
+
+    async def run():
+        start = time.perf_counter()
+        counts = await seed_storage(storage, config)
+        elapsed = time.perf_counter() - start
+        total = sum(counts.values())
+        print(", ".join(f"{count} {name}" for name, count in counts.items()))
+        print(f"{total} records in {elapsed:.1f} s ({total / elapsed:.0f} records/s)")
+        if hasattr(storage, "aclose"):
+            await storage.aclose()
+
+    asyncio.run(run())
+    if hasattr(storage, "close"):
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
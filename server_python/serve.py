@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Production launcher for the SplitBill API: no reload, optionally several
+worker processes.
+
+Worker processes each hold their own storage, so more than one worker
+needs a backend that shares state between processes: SQLite
+(SPLITPAY_STORAGE=sqlite) or PostgreSQL (SPLITPAY_STORAGE=postgres), which
+is switched into shared mode so change events reach SSE subscribers
+connected to any worker, and payment Idempotency-Keys are kept in the
+database, so a retry reaching another worker is not paid twice.
+
+Usage: python serve.py [--host 0.0.0.0] [--port 8000] [--workers 4]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+import uvicorn
+
+
+def seed_once(spec: str):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from seed import SeedConfig, seed_storage
+    from storage import storage
+
+    async def run():
+        try:
+            if (await storage.get_storage_stats())["tables"] == 0:
+                await seed_storage(storage, SeedConfig.from_spec(spec))
+        finally:
+            if hasattr(storage, "aclose"):
+                await storage.aclose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SPLITPAY_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SPLITPAY_WORKERS", "1")))
+    parser.add_argument("--log-level", default=os.getenv("SPLITPAY_LOG_LEVEL", "warning"))
+    args = parser.parse_args()
+
+    # The demo restaurant is for development only
+    os.environ.setdefault("SPLITPAY_SAMPLE_DATA", "0")
+
+    if args.workers > 1:
+        backend = os.getenv("SPLITPAY_STORAGE", "memory")
+        if backend not in ("sqlite", "postgres"):
+            sys.exit("More than one worker needs shared storage: set SPLITPAY_STORAGE=sqlite or postgres")
+        # Inherited by the worker processes
+        os.environ[f"SPLITPAY_{backend.upper()}_SHARED"] = "1"
+        seed_spec = os.environ.pop("SPLITPAY_SEED", None)
+        if seed_spec:
+            # Once, here, rather than racing in every worker's startup
+            seed_once(seed_spec)
+
+    uvicorn.run(
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reload=False,
+        log_level=args.log_level,
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from money import format_cents
+from schemas import BillSplit, BillTotals, GuestShare, SplitGuest, SplitRequest
+
+# Splits are worked out in integer cents (and hundredths for quantities) from
+# a bill's derived totals. A part that does not divide exactly is rounded
+# down and the cents left over go one each to the parts with the largest
+# remainders, earlier guests first on ties: the parts always add up to the
+# whole, and the same request always splits the same way.
+
+# Percentages are in hundredths, like amounts
+WHOLE = 100 * 100
+
+
+def allocate(amount: int, weights: Sequence[int]) -> List[int]:
+    """Split `amount` in proportion to non-negative integer weights, the parts adding up to it.
+
+    All-zero weights get nothing, so the parts add up to 0.
+    """
+    total = sum(weights)
+    if total == 0:
+        return [0] * len(weights)
+    scaled = [amount * weight for weight in weights]
+    parts = [value // total for value in scaled]
+    residue = amount - sum(parts)
+    if residue:
+        remainders = [value % total for value in scaled]
+        # sorted() is stable with reverse=True too, so ties keep guest order
+        for index in sorted(range(len(parts)), key=remainders.__getitem__, reverse=True)[:residue]:
+            parts[index] += 1
+    return parts
+
+
+def _claim_items(totals: BillTotals, guests: List[SplitGuest]) -> Tuple[List[int], List[List[dict]]]:
+    """Each guest's cost for the items they claim, and those claims as payment items"""
+    claims: Dict[str, List[Tuple[int, Optional[int]]]] = {}
+    for index, guest in enumerate(guests):
+        for claim in guest.items:
+            if claim.item_id not in totals.outstanding:
+                raise ValueError(f"Unknown item: {claim.item_id}")
+            claims.setdefault(claim.item_id, []).append((index, claim.quantity))
+
+    amounts = [0] * len(guests)
+    payment_items: List[List[dict]] = [[] for _ in guests]
+    outstanding, outstanding_quantity = totals.outstanding, totals.outstanding_quantity
+    for item_id, item_claims in claims.items():
+        unpaid = outstanding_quantity[item_id]
+        if len(item_claims) == 1:
+            # The common case of one guest per item: the whole item, or a
+            # line of it rounded half up (what allocate gives for two parts)
+            index, quantity = item_claims[0]
+            if quantity is None:
+                quantity, amount = unpaid, outstanding[item_id]
+            elif quantity > unpaid:
+                raise ValueError(f"Item {item_id}: {format_cents(quantity)} claimed, {format_cents(unpaid)} unpaid")
+            elif quantity:
+                amount, remainder = divmod(outstanding[item_id] * quantity, unpaid)
+                if remainder and 2 * remainder >= unpaid:
+                    amount += 1
+            else:
+                amount = 0
+            amounts[index] += amount
+            if quantity:
+                payment_items[index].append({"itemId": item_id, "quantity": format_cents(quantity)})
+            continue
+
+        explicit = sum(quantity for _, quantity in item_claims if quantity is not None)
+        if explicit > unpaid:
+            raise ValueError(f"Item {item_id}: {format_cents(explicit)} claimed, {format_cents(unpaid)} unpaid")
+        open_claims = sum(1 for _, quantity in item_claims if quantity is None)
+        left = unpaid - explicit
+
+        # Claims without a quantity share what the others leave, so the item
+        # is fully claimed; otherwise the unclaimed rest is one more part.
+        # Explicit quantities are scaled by the number of open claims so
+        # each open claim weighs exactly its share of `left`.
+        scale = open_claims or 1
+        weights = [left if quantity is None else quantity * scale for _, quantity in item_claims]
+        weights.append(0 if open_claims else left)
+        cents = allocate(outstanding[item_id], weights)
+        open_quantities = iter(allocate(left, [1] * open_claims))
+
+        for (index, quantity), amount in zip(item_claims, cents):
+            if quantity is None:
+                quantity = next(open_quantities)
+            amounts[index] += amount
+            if quantity:
+                payment_items[index].append({"itemId": item_id, "quantity": format_cents(quantity)})
+    return amounts, payment_items
+
+
+def _percentages(guests: List[SplitGuest]) -> List[int]:
+    percentages = [guest.percentage for guest in guests]
+    if any(percentage is None or percentage < 0 for percentage in percentages):
+        raise ValueError("Every guest needs a percentage of zero or more")
+    if sum(percentages) != WHOLE:
+        raise ValueError(f"Percentages add up to {format_cents(sum(percentages))}, not 100.00")
+    return percentages
+
+
+def compute_split(totals: BillTotals, request: SplitRequest) -> BillSplit:
+    """Each guest's share of what is still owed on a bill.
+
+    even           the remaining amount in equal parts
+    by_percentage  the remaining amount by the guests' percentages, which add up to 100
+    by_item        what the items each guest claims cost; the rest is left unassigned
+    mixed          item claims first, then what is left by percentage if the guests
+                   give one, otherwise evenly
+
+    Raises ValueError when the request cannot be split: no guests, an
+    unknown item, an item claimed beyond its unpaid quantity or percentages
+    that do not add up to 100.
+    """
+    guests = request.guests
+    if not guests:
+        raise ValueError("A split needs at least one guest")
+
+    item_amounts = [0] * len(guests)
+    payment_items: List[List[dict]] = [[] for _ in guests]
+    if request.mode in ("by_item", "mixed"):
+        item_amounts, payment_items = _claim_items(totals, guests)
+
+    # Items can cost more than is owed when payments were not tied to items
+    rest = max(0, totals.remaining - sum(item_amounts))
+    if request.mode == "by_item":
+        shared = [0] * len(guests)
+    elif request.mode == "by_percentage" or (request.mode == "mixed" and any(guest.percentage is not None for guest in guests)):
+        shared = allocate(rest, _percentages(guests))
+    else:
+        shared = allocate(rest, [1] * len(guests))
+
+    return BillSplit.model_construct(
+        bill_id=totals.bill_id,
+        mode=request.mode,
+        remaining=totals.remaining,
+        unassigned=rest - sum(shared),
+        shares=[
+            GuestShare.model_construct(
+                name=guest.name,
+                item_amount=item_amount,
+                shared_amount=shared_amount,
+                amount=item_amount + shared_amount,
+                items=items,
+            )
+            for guest, item_amount, shared_amount, items in zip(guests, item_amounts, shared, payment_items)
+        ],
+    )
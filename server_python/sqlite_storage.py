@@ -0,0 +1,1092 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from schemas import Table, TableCreate, Bill, BillCreate, BillItem, BillItemCreate, Payment, PaymentCreate, BillWithItems, BillTotals, DashboardTable
+from events import ChangeFeed, ALL, table_topic, restaurant_topic
+from storage import IStorage, added_items_bill_updates, batch_item_quantities, bill_balance, bill_balanced, changed_item_bill_delta, check_item_quantities, payment_bill_updates
+from money import format_cents
+from records import TableRecord, BillRecord, BillItemRecord, PaymentRecord, BillTotalsRecord, unpaid_quantity, validate_updates
+
+# Mirrors shared/schema.ts. Decimal columns hold integer hundredths (cents for
+# amounts), the same fixed-point representation the models use.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tables (
+    id TEXT PRIMARY KEY,
+    number INTEGER NOT NULL,
+    restaurant_name TEXT NOT NULL,
+    qr_code TEXT NOT NULL,
+    is_active INTEGER DEFAULT 1,
+    created_at TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS bills (
+    id TEXT PRIMARY KEY,
+    table_id TEXT NOT NULL REFERENCES tables(id),
+    total INTEGER NOT NULL,
+    paid INTEGER DEFAULT 0,
+    remaining INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'unpaid',
+    guest_count INTEGER DEFAULT 1,
+    start_time TEXT,
+    is_active INTEGER DEFAULT 1,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS bill_items (
+    id TEXT PRIMARY KEY,
+    bill_id TEXT NOT NULL REFERENCES bills(id),
+    name TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 100,
+    paid_quantity INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS payments (
+    id TEXT PRIMARY KEY,
+    bill_id TEXT NOT NULL REFERENCES bills(id),
+    amount INTEGER NOT NULL,
+    tip INTEGER DEFAULT 0,
+    items TEXT NOT NULL,
+    payment_method TEXT DEFAULT 'card',
+    status TEXT DEFAULT 'completed',
+    processed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tables_restaurant_number ON tables(restaurant_name, number);
+CREATE INDEX IF NOT EXISTS idx_tables_number ON tables(number);
+CREATE INDEX IF NOT EXISTS idx_bills_table_id ON bills(table_id, is_active);
+CREATE INDEX IF NOT EXISTS idx_bills_start_time ON bills(start_time);
+CREATE INDEX IF NOT EXISTS idx_bill_items_bill_id ON bill_items(bill_id);
+CREATE INDEX IF NOT EXISTS idx_payments_bill_id ON payments(bill_id);
+
+-- Version counters for conditional GETs. They are maintained by triggers so
+-- every writer, in any process, bumps them in the same transaction.
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', lower(hex(randomblob(4))));
+CREATE TABLE IF NOT EXISTS dashboard_versions (
+    restaurant_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS bill_items_insert_version AFTER INSERT ON bill_items BEGIN
+    UPDATE bills SET version = version + 1 WHERE id = NEW.bill_id;
+END;
+CREATE TRIGGER IF NOT EXISTS bill_items_update_version AFTER UPDATE ON bill_items BEGIN
+    UPDATE bills SET version = version + 1 WHERE id IN (NEW.bill_id, OLD.bill_id);
+END;
+CREATE TRIGGER IF NOT EXISTS payments_insert_version AFTER INSERT ON payments BEGIN
+    UPDATE bills SET version = version + 1 WHERE id = NEW.bill_id;
+END;
+CREATE TRIGGER IF NOT EXISTS bills_update_version
+AFTER UPDATE OF table_id, total, paid, remaining, status, guest_count, start_time, is_active ON bills BEGIN
+    UPDATE bills SET version = version + 1 WHERE id = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS bills_dashboard_version AFTER UPDATE OF version ON bills BEGIN
+    INSERT INTO dashboard_versions (restaurant_name, version)
+        SELECT restaurant_name, 1 FROM tables WHERE id IN (NEW.table_id, OLD.table_id)
+        ON CONFLICT (restaurant_name) DO UPDATE SET version = version + 1;
+    INSERT INTO dashboard_versions (restaurant_name, version) VALUES ('*', 1)
+        ON CONFLICT (restaurant_name) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS bills_insert_dashboard_version AFTER INSERT ON bills BEGIN
+    INSERT INTO dashboard_versions (restaurant_name, version)
+        SELECT restaurant_name, 1 FROM tables WHERE id = NEW.table_id
+        ON CONFLICT (restaurant_name) DO UPDATE SET version = version + 1;
+    INSERT INTO dashboard_versions (restaurant_name, version) VALUES ('*', 1)
+        ON CONFLICT (restaurant_name) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS tables_insert_dashboard_version AFTER INSERT ON tables BEGIN
+    INSERT INTO dashboard_versions (restaurant_name, version) VALUES (NEW.restaurant_name, 1), ('*', 1)
+        ON CONFLICT (restaurant_name) DO UPDATE SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS tables_update_version
+AFTER UPDATE OF number, restaurant_name, qr_code, is_active, created_at ON tables BEGIN
+    UPDATE tables SET version = version + 1 WHERE id = NEW.id;
+    INSERT INTO dashboard_versions (restaurant_name, version)
+        SELECT DISTINCT name, 1 FROM (SELECT NEW.restaurant_name AS name UNION SELECT OLD.restaurant_name UNION SELECT '*') WHERE true
+        ON CONFLICT (restaurant_name) DO UPDATE SET version = version + 1;
+END;
+"""
+
+# Change events for other worker processes (shared mode). Each worker
+# appends its changes and polls for everyone's, so SSE subscribers see
+# changes made in any process.
+CHANGE_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS change_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    table_id TEXT NOT NULL,
+    restaurant_name TEXT,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Responses to requests sent with an Idempotency-Key (shared mode), so a
+# retry reaching another worker process is replayed rather than run again.
+# A row without a body is a claim on a key whose request is still running.
+IDEMPOTENCY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    claim TEXT NOT NULL,
+    body BLOB,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+"""
+
+# Columns that update_* may touch; anything else is ignored, like MemStorage does
+TABLE_COLUMNS = ("number", "restaurant_name", "qr_code", "is_active", "created_at")
+BILL_COLUMNS = ("table_id", "total", "paid", "remaining", "status", "guest_count", "start_time", "is_active")
+BILL_ITEM_COLUMNS = ("bill_id", "name", "price", "quantity", "paid_quantity")
+
+
+def _to_db(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _money(cents: Optional[int]) -> Optional[str]:
+    return format_cents(cents) if cents is not None else None
+
+
+def _bool(value: Optional[int]) -> Optional[bool]:
+    return bool(value) if value is not None else None
+
+
+def _datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+# Rows hold cents already, so models are built from them with model_construct
+# rather than validated as if they were API input
+
+def _table(row: sqlite3.Row) -> Table:
+    return Table.model_construct(
+        id=row["id"],
+        number=row["number"],
+        restaurant_name=row["restaurant_name"],
+        qr_code=row["qr_code"],
+        is_active=_bool(row["is_active"]),
+        created_at=_datetime(row["created_at"]),
+    )
+
+
+def _bill_fields(row: sqlite3.Row) -> dict:
+    return {
+        "id": row["id"],
+        "table_id": row["table_id"],
+        "total": row["total"],
+        "paid": row["paid"],
+        "remaining": row["remaining"],
+        "status": row["status"],
+        "guest_count": row["guest_count"],
+        "is_active": _bool(row["is_active"]),
+        "start_time": _datetime(row["start_time"]),
+    }
+
+
+def _bill(row: sqlite3.Row) -> Bill:
+    return Bill.model_construct(**_bill_fields(row))
+
+
+def _bill_item(row: sqlite3.Row) -> BillItem:
+    return BillItem.model_construct(
+        id=row["id"],
+        bill_id=row["bill_id"],
+        name=row["name"],
+        price=row["price"],
+        quantity=row["quantity"],
+        paid_quantity=row["paid_quantity"],
+    )
+
+
+def _table_document(row: sqlite3.Row) -> dict:
+    """A table row in Table's JSON form"""
+    return {
+        "number": row["number"],
+        "restaurant_name": row["restaurant_name"],
+        "qr_code": row["qr_code"],
+        "is_active": _bool(row["is_active"]),
+        "id": row["id"],
+        "created_at": row["created_at"],
+    }
+
+
+def _bill_document(row: sqlite3.Row) -> dict:
+    """A bill row in Bill's JSON form"""
+    return {
+        "table_id": row["table_id"],
+        "total": _money(row["total"]),
+        "paid": _money(row["paid"]),
+        "remaining": _money(row["remaining"]),
+        "status": row["status"],
+        "guest_count": row["guest_count"],
+        "is_active": _bool(row["is_active"]),
+        "id": row["id"],
+        "start_time": row["start_time"],
+    }
+
+
+def _bill_item_document(row: sqlite3.Row) -> dict:
+    """A bill item row in BillItem's JSON form"""
+    return {
+        "bill_id": row["bill_id"],
+        "name": row["name"],
+        "price": _money(row["price"]),
+        "quantity": _money(row["quantity"]),
+        "paid_quantity": _money(row["paid_quantity"]),
+        "id": row["id"],
+    }
+
+
+def _payment_document(row: sqlite3.Row) -> dict:
+    """A payment row in Payment's JSON form"""
+    return {
+        "bill_id": row["bill_id"],
+        "amount": _money(row["amount"]),
+        "tip": _money(row["tip"]),
+        "items": json.loads(row["items"]),
+        "payment_method": row["payment_method"],
+        "status": row["status"],
+        "id": row["id"],
+        "processed_at": row["processed_at"],
+    }
+
+
+def _payment(row: sqlite3.Row) -> Payment:
+    return Payment.model_construct(
+        id=row["id"],
+        bill_id=row["bill_id"],
+        amount=row["amount"],
+        tip=row["tip"],
+        items=json.loads(row["items"]),
+        payment_method=row["payment_method"],
+        status=row["status"],
+        processed_at=_datetime(row["processed_at"]),
+    )
+
+
+class SqliteStorage(IStorage):
+    """SQLite storage implementation.
+
+    All queries run on a single dedicated thread that owns the connection,
+    so callers on the event loop never block on disk I/O.
+
+    Several processes may open the same database: writes that read before
+    writing take SQLite's write lock up front (BEGIN IMMEDIATE), and a
+    writer that finds the database locked waits up to `busy_timeout`
+    seconds. With `shared` set, change events go through the change_log
+    table instead of straight to this process's subscribers; run a
+    ChangeLogPoller to deliver them.
+    """
+
+    def __init__(self, path: str = "splitpay.db", shared: bool = False, busy_timeout: float = 30.0):
+        self.path = path
+        self.shared = shared
+        self.busy_timeout = busy_timeout
+        self.payment_conflicts = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._conn = self._executor.submit(self._connect).result()
+        self.changes = ChangeFeed()
+        self._epoch = self._executor.submit(
+            lambda: self._fetchone("SELECT value FROM meta WHERE key = 'epoch'")["value"]
+        ).result()
+
+    def _connect(self) -> sqlite3.Connection:
+        # cached_statements keeps every statement below prepared for reuse
+        conn = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, check_same_thread=False, cached_statements=256, isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        # Workers starting together must not interleave schema creation
+        conn.executescript(f"BEGIN IMMEDIATE; {SCHEMA} {CHANGE_LOG_SCHEMA} {IDEMPOTENCY_SCHEMA} COMMIT;")
+        return conn
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        return self._conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        return self._conn.execute(sql, params).fetchall()
+
+    def _update(self, table_name: str, columns: tuple, id: str, updates: dict) -> None:
+        fields = [key for key in updates if key in columns]
+        if not fields:
+            return
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        self._conn.execute(
+            f"UPDATE {table_name} SET {assignments} WHERE id = ?",
+            (*(_to_db(updates[key]) for key in fields), id)
+        )
+
+    async def _changed(self, event: str, bill_id: str, model):
+        """Publish a change to a bill or one of its records"""
+        await self._changed_many([(event, bill_id, model)])
+
+    async def _changed_many(self, changes: List[Tuple[str, str, Any]]):
+        """Publish changes, in order; in shared mode, append them to the change log"""
+        if self.shared:
+            created_at = time.time()
+            await self._run(self._log_changes, [
+                (event, model.model_dump_json(), created_at, bill_id) for event, bill_id, model in changes
+            ])
+            return
+        if not self.changes.has_subscribers():
+            return
+        for event, bill_id, model in changes:
+            row = await self._run(
+                self._fetchone,
+                "SELECT b.table_id, t.restaurant_name FROM bills b LEFT JOIN tables t ON t.id = b.table_id WHERE b.id = ?",
+                (bill_id,)
+            )
+            if row:
+                self.changes.publish_change(event, row["table_id"], row["restaurant_name"], model)
+
+    def _log_changes(self, rows: List[tuple]):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(
+                "INSERT INTO change_log (event, table_id, restaurant_name, data, created_at) "
+                "SELECT ?, b.table_id, t.restaurant_name, ?, ? FROM bills b LEFT JOIN tables t ON t.id = b.table_id WHERE b.id = ?",
+                rows
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _read_change_log(self, after_id: int, limit: int) -> List[sqlite3.Row]:
+        return self._fetchall("SELECT * FROM change_log WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+
+    async def publish_logged_changes(self, after_id: int, limit: int = 1000) -> int:
+        """Publish change log entries after `after_id` to this process's subscribers; returns the last id seen"""
+        rows = await self._run(self._read_change_log, after_id, limit)
+        for row in rows:
+            topics = (ALL, table_topic(row["table_id"]))
+            if row["restaurant_name"] is not None:
+                topics += (restaurant_topic(row["restaurant_name"]),)
+            if self.changes.has_subscribers(*topics):
+                self.changes.publish(
+                    topics, row["event"], f'{{"table_id":{json.dumps(row["table_id"])},"{row["event"]}":{row["data"]}}}'
+                )
+        return rows[-1]["id"] if rows else after_id
+
+    async def last_change_id(self) -> int:
+        row = await self._run(self._fetchone, "SELECT MAX(id) AS id FROM change_log")
+        return row["id"] or 0
+
+    async def prune_change_log(self, max_age: float):
+        await self._run(self._conn.execute, "DELETE FROM change_log WHERE created_at < ?", (time.time() - max_age,))
+
+    # Idempotency keys, for SharedIdempotencyStore
+    def _claim_idempotency_key(self, key: str, fingerprint: str, claim: str, lease: float) -> Tuple[bool, str, Optional[bytes]]:
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+            row = self._fetchone("SELECT fingerprint, body FROM idempotency_keys WHERE key = ?", (key,))
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO idempotency_keys (key, fingerprint, claim, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, fingerprint, claim, now + lease)
+                )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return (True, fingerprint, None) if row is None else (False, row["fingerprint"], row["body"])
+
+    async def claim_idempotency_key(self, key: str, fingerprint: str, claim: str, lease: float) -> Tuple[bool, str, Optional[bytes]]:
+        """Claim a key for `lease` seconds unless it is held; expired keys are dropped first.
+
+        Returns (True, fingerprint, None) when claimed, else (False, the
+        holder's fingerprint, its stored response or None while it runs).
+        """
+        return await self._run(self._claim_idempotency_key, key, fingerprint, claim, lease)
+
+    async def store_idempotent_response(self, key: str, claim: str, body: bytes, ttl: float):
+        """Store the response to a claimed key, kept for `ttl` seconds"""
+        await self._run(
+            self._conn.execute, "UPDATE idempotency_keys SET body = ?, expires_at = ? WHERE key = ? AND claim = ?",
+            (body, time.time() + ttl, key, claim)
+        )
+
+    async def release_idempotency_key(self, key: str, claim: str):
+        """Drop a claim whose request failed, so the key can run again"""
+        await self._run(
+            self._conn.execute, "DELETE FROM idempotency_keys WHERE key = ? AND claim = ? AND body IS NULL", (key, claim)
+        )
+
+    def close(self):
+        self._executor.submit(self._conn.close).result()
+        self._executor.shutdown()
+
+    # Tables
+    async def create_table(self, table: TableCreate) -> Table:
+        table = Table(
+            id=str(uuid.uuid4()),
+            created_at=datetime.now(),
+            **table.model_dump()
+        )
+        await self._run(
+            self._conn.execute,
+            "INSERT INTO tables (id, number, restaurant_name, qr_code, is_active, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (table.id, table.number, table.restaurant_name, table.qr_code, table.is_active, _to_db(table.created_at))
+        )
+        return table
+
+    async def get_table(self, id: str) -> Optional[Table]:
+        row = await self._run(self._fetchone, "SELECT * FROM tables WHERE id = ?", (id,))
+        return _table(row) if row else None
+
+    async def get_table_by_number(self, number: int, restaurant_name: str) -> Optional[Table]:
+        row = await self._run(
+            self._fetchone,
+            "SELECT * FROM tables WHERE restaurant_name = ? AND number = ? ORDER BY rowid LIMIT 1",
+            (restaurant_name, number)
+        )
+        return _table(row) if row else None
+
+    async def get_all_tables(self) -> List[Table]:
+        rows = await self._run(self._fetchall, "SELECT * FROM tables ORDER BY rowid")
+        return [_table(row) for row in rows]
+
+    async def iter_table_documents(self, restaurant: Optional[str] = None, after: Optional[str] = None,
+                                   batch: int = 500) -> AsyncIterator[dict]:
+        # Keyset pages on (number, rowid), each batch a query of its own
+        key = None
+        if after is not None:
+            key = await self._run(self._fetchone, "SELECT number, rowid FROM tables WHERE id = ?", (after,))
+            if key is None:
+                raise ValueError(f"Unknown cursor: {after}")
+            key = tuple(key)
+        while True:
+            conditions, params = [], []
+            if restaurant is not None:
+                conditions.append("restaurant_name = ?")
+                params.append(restaurant)
+            if key is not None:
+                conditions.append("(number, rowid) > (?, ?)")
+                params.extend(key)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = await self._run(
+                self._fetchall, f"SELECT rowid AS _rowid, * FROM tables {where} ORDER BY number, rowid LIMIT ?", (*params, batch)
+            )
+            for row in rows:
+                yield _table_document(row)
+            if len(rows) < batch:
+                return
+            key = (rows[-1]["number"], rows[-1]["_rowid"])
+
+    async def _iter_bill_rows(self, table_name: str, bill_id: str, after: Optional[str], batch: int = 500):
+        """A bill's item or payment rows in creation (rowid) order, after the row with id `after`"""
+        last = 0
+        if after is not None:
+            row = await self._run(self._fetchone, f"SELECT rowid FROM {table_name} WHERE id = ? AND bill_id = ?", (after, bill_id))
+            if row is None:
+                raise ValueError(f"Unknown cursor: {after}")
+            last = row[0]
+        while True:
+            rows = await self._run(
+                self._fetchall,
+                f"SELECT rowid AS _rowid, * FROM {table_name} WHERE bill_id = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                (bill_id, last, batch)
+            )
+            for row in rows:
+                yield row
+            if len(rows) < batch:
+                return
+            last = rows[-1]["_rowid"]
+
+    async def update_table(self, id: str, updates: dict) -> Optional[Table]:
+        updates = validate_updates(Table, updates)
+
+        def update():
+            self._update("tables", TABLE_COLUMNS, id, updates)
+            return self._fetchone("SELECT * FROM tables WHERE id = ?", (id,))
+
+        row = await self._run(update)
+        return _table(row) if row else None
+
+    # Bills
+    async def create_bill(self, bill: BillCreate) -> Bill:
+        bill = Bill.model_construct(
+            id=str(uuid.uuid4()),
+            start_time=datetime.now(),
+            **{**bill.model_dump(), **bill_balance(bill.total, bill.paid or 0)}
+        )
+        await self._run(
+            self._conn.execute,
+            "INSERT INTO bills (id, table_id, total, paid, remaining, status, guest_count, start_time, is_active) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (bill.id, bill.table_id, bill.total, bill.paid, bill.remaining, bill.status,
+             bill.guest_count, _to_db(bill.start_time), bill.is_active)
+        )
+        await self._changed("bill", bill.id, bill)
+        return bill
+
+    async def get_bill(self, id: str) -> Optional[Bill]:
+        row = await self._run(self._fetchone, "SELECT * FROM bills WHERE id = ?", (id,))
+        return _bill(row) if row else None
+
+    async def get_bill_by_table_id(self, table_id: str) -> Optional[Bill]:
+        row = await self._run(
+            self._fetchone,
+            "SELECT * FROM bills WHERE table_id = ? AND is_active = 1 ORDER BY rowid LIMIT 1",
+            (table_id,)
+        )
+        return _bill(row) if row else None
+
+    async def get_bill_with_items(self, id: str) -> Optional[BillWithItems]:
+        def fetch():
+            bill = self._fetchone("SELECT * FROM bills WHERE id = ?", (id,))
+            if not bill:
+                return None
+            table = self._fetchone("SELECT * FROM tables WHERE id = ?", (bill["table_id"],))
+            if not table:
+                return None
+            items = self._fetchall("SELECT * FROM bill_items WHERE bill_id = ? ORDER BY rowid", (id,))
+            return bill, items, table
+
+        result = await self._run(fetch)
+        if not result:
+            return None
+
+        bill, items, table = result
+        return BillWithItems.model_construct(
+            **_bill_fields(bill),
+            items=[_bill_item(row) for row in items],
+            table=_table(table)
+        )
+
+    async def update_bill(self, id: str, updates: dict) -> Optional[Bill]:
+        updates = validate_updates(Bill, updates)
+
+        def update():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._update("bills", BILL_COLUMNS, id, updates)
+                row = self._fetchone("SELECT * FROM bills WHERE id = ?", (id,))
+                if row:
+                    self._update("bills", BILL_COLUMNS, id, bill_balance(row["total"], row["paid"] or 0))
+                    row = self._fetchone("SELECT * FROM bills WHERE id = ?", (id,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return row
+
+        row = await self._run(update)
+        if not row:
+            return None
+        bill = _bill(row)
+        await self._changed("bill", bill.id, bill)
+        return bill
+
+    async def get_all_active_bills(self) -> List[Bill]:
+        rows = await self._run(self._fetchall, "SELECT * FROM bills WHERE is_active = 1 ORDER BY rowid")
+        return [_bill(row) for row in rows]
+
+    # Bill Items
+    async def create_bill_item(self, item: BillItemCreate) -> BillItem:
+        return (await self.create_bill_items([item]))[0]
+
+    async def create_bill_items(self, items: List[BillItemCreate]) -> List[BillItem]:
+        records = [BillItem.model_construct(id=str(uuid.uuid4()), **item.model_dump()) for item in items]
+        by_bill: Dict[str, List[BillItem]] = {}
+        for record in records:
+            by_bill.setdefault(record.bill_id, []).append(record)
+
+        def insert():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO bill_items (id, bill_id, name, price, quantity, paid_quantity) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(r.id, r.bill_id, r.name, r.price, r.quantity, r.paid_quantity) for r in records]
+                )
+                bills = []
+                for bill_id, bill_records in by_bill.items():
+                    row = self._fetchone("SELECT * FROM bills WHERE id = ?", (bill_id,))
+                    if row:
+                        self._update("bills", BILL_COLUMNS, bill_id, added_items_bill_updates(_bill(row), bill_records))
+                        bills.append(self._fetchone("SELECT * FROM bills WHERE id = ?", (bill_id,)))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return bills
+
+        bills = await self._run(insert)
+        await self._changed_many(
+            [("item", record.bill_id, record) for record in records]
+            + [("bill", row["id"], _bill(row)) for row in bills]
+        )
+        return records
+
+    async def get_bill_items(self, bill_id: str) -> List[BillItem]:
+        rows = await self._run(self._fetchall, "SELECT * FROM bill_items WHERE bill_id = ? ORDER BY rowid", (bill_id,))
+        return [_bill_item(row) for row in rows]
+
+    async def iter_bill_item_documents(self, bill_id: str, after: Optional[str] = None) -> AsyncIterator[dict]:
+        async for row in self._iter_bill_rows("bill_items", bill_id, after):
+            yield _bill_item_document(row)
+
+    async def update_bill_item(self, id: str, updates: dict) -> Optional[BillItem]:
+        updates = validate_updates(BillItem, updates)
+
+        def update():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._fetchone("SELECT * FROM bill_items WHERE id = ?", (id,))
+                bills = []
+                if row:
+                    self._update("bill_items", BILL_ITEM_COLUMNS, id, updates)
+                    before, row = row, self._fetchone("SELECT * FROM bill_items WHERE id = ?", (id,))
+                    for bill_id, delta in changed_item_bill_delta(_bill_item(before), _bill_item(row)).items():
+                        bill = self._fetchone("SELECT total, paid FROM bills WHERE id = ?", (bill_id,))
+                        if bill:
+                            self._update("bills", BILL_COLUMNS, bill_id, bill_balance(bill["total"] + delta, bill["paid"] or 0))
+                            bills.append(self._fetchone("SELECT * FROM bills WHERE id = ?", (bill_id,)))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return row, bills
+
+        row, bills = await self._run(update)
+        if not row:
+            return None
+        item = _bill_item(row)
+        await self._changed_many(
+            [("item", item.bill_id, item)] + [("bill", bill["id"], _bill(bill)) for bill in bills]
+        )
+        return item
+
+    async def get_bill_item(self, id: str) -> Optional[BillItem]:
+        row = await self._run(self._fetchone, "SELECT * FROM bill_items WHERE id = ?", (id,))
+        return _bill_item(row) if row else None
+
+    # Payments
+    def _insert_payment(self, payment: Payment) -> None:
+        self._conn.execute(
+            "INSERT INTO payments (id, bill_id, amount, tip, items, payment_method, status, processed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (payment.id, payment.bill_id, payment.amount, payment.tip, json.dumps(payment.items),
+             payment.payment_method, payment.status, _to_db(payment.processed_at))
+        )
+
+    def _check_item_quantities(self, bill_id: str, quantities: Dict[str, int]) -> None:
+        """check_item_quantities against the bill's items; call inside the payment's write transaction"""
+        unpaid = {
+            item["id"]: unpaid_quantity(_bill_item(item))
+            for item in self._fetchall("SELECT * FROM bill_items WHERE bill_id = ?", (bill_id,))
+        }
+        check_item_quantities(quantities, unpaid)
+
+    def _pay_bill_items(self, quantities: Dict[str, int]) -> List[sqlite3.Row]:
+        """Add checked paid quantities to their items, returning the updated rows"""
+        items = []
+        for item_id, quantity in quantities.items():
+            self._conn.execute(
+                "UPDATE bill_items SET paid_quantity = COALESCE(paid_quantity, 0) + ? WHERE id = ?", (quantity, item_id)
+            )
+            items.append(self._fetchone("SELECT * FROM bill_items WHERE id = ?", (item_id,)))
+        return items
+
+    async def create_payment(self, payment: PaymentCreate) -> Payment:
+        payment = Payment.model_construct(
+            id=str(uuid.uuid4()),
+            processed_at=datetime.now(),
+            **payment.model_dump()
+        )
+        await self._run(self._insert_payment, payment)
+        await self._changed("payment", payment.bill_id, payment)
+        return payment
+
+    async def apply_payment(self, payment: PaymentCreate) -> Optional[Tuple[Payment, Bill]]:
+        record = Payment.model_construct(
+            id=str(uuid.uuid4()),
+            processed_at=datetime.now(),
+            **payment.model_dump()
+        )
+        quantities = batch_item_quantities([payment])
+
+        def apply():
+            # BEGIN IMMEDIATE takes the write lock up front, so the read of the
+            # bill below cannot be invalidated by another writer
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                # Still locked by another process after the busy timeout
+                self.payment_conflicts += 1
+                raise
+            try:
+                row = self._fetchone("SELECT * FROM bills WHERE id = ?", (payment.bill_id,))
+                items = []
+                if row:
+                    if quantities:
+                        self._check_item_quantities(payment.bill_id, quantities)
+                    self._insert_payment(record)
+                    self._update("bills", BILL_COLUMNS, row["id"], payment_bill_updates(_bill(row), payment))
+                    items = self._pay_bill_items(quantities)
+                    row = self._fetchone("SELECT * FROM bills WHERE id = ?", (payment.bill_id,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return row, items
+
+        row, items = await self._run(apply)
+        if not row:
+            return None
+
+        bill = _bill(row)
+        await self._changed_many(
+            [("payment", bill.id, record)]
+            + [("item", bill.id, _bill_item(item)) for item in items]
+            + [("bill", bill.id, bill)]
+        )
+        return record, bill
+
+    async def apply_payments(self, bill_id: str, payments: List[PaymentCreate]) -> Optional[List[Tuple[Payment, Bill]]]:
+        records = [Payment.model_construct(id=str(uuid.uuid4()), processed_at=datetime.now(), **payment.model_dump()) for payment in payments]
+        quantities = batch_item_quantities(payments)
+
+        def apply():
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                self.payment_conflicts += 1
+                raise
+            try:
+                row = self._fetchone("SELECT * FROM bills WHERE id = ?", (bill_id,))
+                items, bills = [], []
+                if row:
+                    self._check_item_quantities(bill_id, quantities)
+                    bill = _bill(row)
+                    for record in records:
+                        self._insert_payment(record)
+                        bill = bill.model_copy(update=payment_bill_updates(bill, record))
+                        bills.append(bill)
+                    # One write of the final state rather than one per payment
+                    self._update("bills", BILL_COLUMNS, bill_id, bill_balance(bill.total, bill.paid))
+                    items = self._pay_bill_items(quantities)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return row, bills, items
+
+        row, bills, items = await self._run(apply)
+        if not row:
+            return None
+
+        await self._changed_many(
+            [("payment", bill_id, record) for record in records]
+            + [("item", bill_id, _bill_item(item)) for item in items]
+            + [("bill", bill_id, bill) for bill in bills[-1:]]
+        )
+        return list(zip(records, bills))
+
+    async def get_payments_by_bill_id(self, bill_id: str) -> List[Payment]:
+        rows = await self._run(self._fetchall, "SELECT * FROM payments WHERE bill_id = ? ORDER BY rowid", (bill_id,))
+        return [_payment(row) for row in rows]
+
+    # Derived totals: counted per read from the bill's indexed items and
+    # payments, as a cache here would have to be shared between processes
+    async def get_bill_totals(self, bill_id: str) -> Optional[BillTotals]:
+        def fetch():
+            bill = self._fetchone("SELECT * FROM bills WHERE id = ?", (bill_id,))
+            if not bill:
+                return None
+            items = self._fetchall("SELECT * FROM bill_items WHERE bill_id = ? ORDER BY rowid", (bill_id,))
+            payments = self._fetchone(
+                "SELECT COUNT(*) AS count, COALESCE(SUM(amount + COALESCE(tip, 0)), 0) AS total FROM payments WHERE bill_id = ?",
+                (bill_id,)
+            )
+            return bill, items, payments
+
+        result = await self._run(fetch)
+        if not result:
+            return None
+
+        bill, items, payments = result
+        totals = BillTotalsRecord(payment_count=payments["count"], payment_total=payments["total"])
+        for row in items:
+            totals.add_item(_bill_item(row))
+        return totals.to_model(_bill(bill))
+
+    async def verify_bill_totals(self, rebuild: bool = False) -> List[str]:
+        def verify():
+            self._conn.execute("BEGIN IMMEDIATE" if rebuild else "BEGIN")
+            try:
+                mismatched = []
+                for row in self._fetchall("SELECT id, total, paid, remaining, status FROM bills ORDER BY id"):
+                    if not bill_balanced(row["total"], row["paid"], row["remaining"], row["status"]):
+                        mismatched.append(row["id"])
+                        if rebuild:
+                            self._update("bills", BILL_COLUMNS, row["id"], bill_balance(row["total"], row["paid"] or 0))
+                bills = [self._fetchone("SELECT * FROM bills WHERE id = ?", (id,)) for id in mismatched] if rebuild else []
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return mismatched, bills
+
+        mismatched, bills = await self._run(verify)
+        await self._changed_many([("bill", row["id"], _bill(row)) for row in bills])
+        return mismatched
+
+    async def iter_payment_documents(self, bill_id: str, after: Optional[str] = None) -> AsyncIterator[dict]:
+        async for row in self._iter_bill_rows("payments", bill_id, after):
+            yield _payment_document(row)
+
+    async def iter_bill_exports(self, restaurant: Optional[str] = None, start: Optional[datetime] = None,
+                                end: Optional[datetime] = None, batch: int = 100,
+                                max_pause: float = 0.005) -> AsyncIterator[dict]:
+        # Keyset batches on (start_time, rowid), starting at `start`; each
+        # batch's items and payments are read in the same executor call
+        conditions, params = ["(start_time, rowid) > (?, ?)"], []
+        if restaurant is not None:
+            conditions.append("table_id IN (SELECT id FROM tables WHERE restaurant_name = ?)")
+            params.append(restaurant)
+        if end is not None:
+            conditions.append("start_time < ?")
+            params.append(end.isoformat())
+        where = " AND ".join(conditions)
+
+        def fetch(key: tuple):
+            bills = self._fetchall(
+                f"SELECT rowid AS _rowid, * FROM bills WHERE {where} ORDER BY start_time, rowid LIMIT ?", (*key, *params, batch)
+            )
+            ids = [row["id"] for row in bills]
+            placeholders = ", ".join("?" * len(ids))
+            items = self._fetchall(f"SELECT * FROM bill_items WHERE bill_id IN ({placeholders}) ORDER BY rowid", ids)
+            payments = self._fetchall(f"SELECT * FROM payments WHERE bill_id IN ({placeholders}) ORDER BY rowid", ids)
+            return bills, items, payments
+
+        key = (start.isoformat() if start is not None else "", 0)
+        while True:
+            bills, items, payments = await self._run(fetch, key)
+            documents = {row["id"]: {"bill": _bill_document(row), "items": [], "payments": []} for row in bills}
+            for row in items:
+                documents[row["bill_id"]]["items"].append(_bill_item_document(row))
+            for row in payments:
+                documents[row["bill_id"]]["payments"].append(_payment_document(row))
+            paused = time.monotonic()
+            for document in documents.values():
+                yield document
+                # Encoding a batch can take a while: let other requests run
+                if time.monotonic() - paused > max_pause:
+                    await asyncio.sleep(0)
+                    paused = time.monotonic()
+            if len(bills) < batch:
+                return
+            key = (bills[-1]["start_time"], bills[-1]["_rowid"])
+
+    # Dashboard
+    async def _fetch_dashboard(self, restaurant: Optional[str]) -> Tuple[List[sqlite3.Row], List[sqlite3.Row], List[sqlite3.Row]]:
+        def fetch():
+            where, params = ("WHERE t.restaurant_name = ?", (restaurant,)) if restaurant is not None else ("", ())
+            tables = self._fetchall(f"SELECT * FROM tables t {where} ORDER BY t.number, t.rowid", params)
+            bills = self._fetchall(
+                f"SELECT b.* FROM bills b JOIN tables t ON t.id = b.table_id "
+                f"{where} {'AND' if where else 'WHERE'} b.is_active = 1 ORDER BY b.rowid",
+                params
+            )
+            items = self._fetchall(
+                f"SELECT i.* FROM bill_items i JOIN bills b ON b.id = i.bill_id JOIN tables t ON t.id = b.table_id "
+                f"{where} {'AND' if where else 'WHERE'} b.is_active = 1 ORDER BY i.rowid",
+                params
+            )
+            return tables, bills, items
+
+        return await self._run(fetch)
+
+    async def get_dashboard_tables(self, restaurant: Optional[str] = None) -> List[DashboardTable]:
+        tables, bills, items = await self._fetch_dashboard(restaurant)
+
+        bill_by_table: Dict[str, Bill] = {}
+        for row in bills:
+            bill_by_table.setdefault(row["table_id"], _bill(row))
+        items_by_bill: Dict[str, List[BillItem]] = {}
+        for row in items:
+            items_by_bill.setdefault(row["bill_id"], []).append(_bill_item(row))
+
+        dashboard_tables = []
+        for row in tables:
+            bill = bill_by_table.get(row["id"])
+            dashboard_tables.append(DashboardTable(
+                id=row["id"],
+                number=row["number"],
+                restaurant_name=row["restaurant_name"],
+                bill=bill,
+                items=items_by_bill.get(bill.id, []) if bill else [],
+                guest_count=bill.guest_count or 0 if bill else 0,
+                start_time=bill.start_time if bill else None
+            ))
+        return dashboard_tables
+
+    async def get_dashboard_documents(self, restaurant: Optional[str] = None) -> List[dict]:
+        # Built from the rows, which hold cents and ISO timestamps already
+        tables, bills, items = await self._fetch_dashboard(restaurant)
+
+        bill_by_table: Dict[str, dict] = {}
+        for row in bills:
+            if row["table_id"] not in bill_by_table:
+                bill_by_table[row["table_id"]] = _bill_document(row)
+        items_by_bill: Dict[str, List[dict]] = {}
+        for row in items:
+            items_by_bill.setdefault(row["bill_id"], []).append(_bill_item_document(row))
+
+        documents = []
+        for row in tables:
+            bill = bill_by_table.get(row["id"])
+            documents.append({
+                "id": row["id"],
+                "number": row["number"],
+                "restaurant_name": row["restaurant_name"],
+                "bill": bill,
+                "items": items_by_bill.get(bill["id"], []) if bill else [],
+                "guest_count": bill["guest_count"] or 0 if bill else 0,
+                "start_time": bill["start_time"] if bill else None,
+            })
+        return documents
+
+    # Versions
+    async def get_bill_version(self, id: str) -> Optional[str]:
+        row = await self._run(
+            self._fetchone,
+            "SELECT b.version AS bill_version, t.version AS table_version "
+            "FROM bills b LEFT JOIN tables t ON t.id = b.table_id WHERE b.id = ?",
+            (id,)
+        )
+        if not row:
+            return None
+        return f"{self._epoch}-{row['bill_version']}-{row['table_version'] or 0}"
+
+    async def get_dashboard_version(self, restaurant: Optional[str] = None) -> str:
+        row = await self._run(
+            self._fetchone,
+            "SELECT version FROM dashboard_versions WHERE restaurant_name = ?",
+            ("*" if restaurant is None else restaurant,)
+        )
+        return f"{self._epoch}-{row['version'] if row else 0}"
+
+    async def get_storage_stats(self) -> Dict[str, int]:
+        row = await self._run(
+            self._fetchone,
+            "SELECT (SELECT COUNT(*) FROM tables) AS tables, (SELECT COUNT(*) FROM bills) AS bills, "
+            "(SELECT COUNT(*) FROM bill_items) AS bill_items, (SELECT COUNT(*) FROM payments) AS payments"
+        )
+        return dict(row)
+
+    # Seeding
+    async def bulk_load(self, tables: List[TableRecord], bills: List[BillRecord], items: List[BillItemRecord],
+                        payments: List[PaymentRecord]) -> None:
+        def load():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Foreign keys are checked at commit, so rows can go in in any
+                # order. The per-row insert triggers only bump versions, which
+                # is done once below, so they are dropped for the load and
+                # recreated before commit; no other connection sees the gap.
+                self._conn.execute("PRAGMA defer_foreign_keys=ON")
+                triggers = self._conn.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%AFTER INSERT ON%'"
+                ).fetchall()
+                for trigger in triggers:
+                    self._conn.execute(f"DROP TRIGGER {trigger['name']}")
+                self._conn.executemany(
+                    "INSERT INTO tables (id, number, restaurant_name, qr_code, is_active, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(t.id, t.number, t.restaurant_name, t.qr_code, t.is_active, _to_db(t.created_at)) for t in tables]
+                )
+                self._conn.executemany(
+                    "INSERT INTO bill_items (id, bill_id, name, price, quantity, paid_quantity) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(i.id, i.bill_id, i.name, i.price, i.quantity, i.paid_quantity) for i in items]
+                )
+                self._conn.executemany(
+                    "INSERT INTO payments (id, bill_id, amount, tip, items, payment_method, status, processed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(p.id, p.bill_id, p.amount, p.tip, json.dumps(p.items), p.payment_method, p.status,
+                      _to_db(p.processed_at)) for p in payments]
+                )
+                self._conn.executemany(
+                    "INSERT INTO bills (id, table_id, total, paid, remaining, status, guest_count, start_time, is_active) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(b.id, b.table_id, b.total, b.paid, b.remaining, b.status, b.guest_count, _to_db(b.start_time),
+                      b.is_active) for b in bills]
+                )
+                for trigger in triggers:
+                    self._conn.execute(trigger["sql"])
+                table_ids = {t.id for t in tables} | {b.table_id for b in bills}
+                self._conn.execute(
+                    "INSERT INTO dashboard_versions (restaurant_name, version) "
+                    "SELECT restaurant_name, 1 FROM tables WHERE id IN (SELECT value FROM json_each(?)) "
+                    "UNION SELECT '*', 1 WHERE true ON CONFLICT (restaurant_name) DO UPDATE SET version = version + 1",
+                    (json.dumps(list(table_ids)),)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        await self._run(load)
+
+
+class ChangeLogPoller:
+    """Background task delivering change log entries from every worker to local subscribers.
+
+    Polls only while this process has subscribers, and prunes entries older
+    than `retention` seconds.
+    """
+
+    def __init__(self, storage: SqliteStorage, interval: float = 0.1, retention: float = 300.0):
+        self.storage = storage
+        self.interval = interval
+        self.retention = retention
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        last_id = await self.storage.last_change_id()
+        last_prune = time.monotonic()
+        while True:
+            try:
+                if self.storage.changes.has_subscribers():
+                    last_id = await self.storage.publish_logged_changes(last_id)
+                else:
+                    # Nobody listening: skip ahead instead of replaying later
+                    last_id = await self.storage.last_change_id()
+                if time.monotonic() - last_prune >= self.retention:
+                    await self.storage.prune_change_log(self.retention)
+                    last_prune = time.monotonic()
+            except Exception as e:
+                print(f"Change log poll failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,11 +1,102 @@
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
+import asyncio
+import bisect
+import itertools
+import os
+import time
 import uuid
-from schemas import Table, TableCreate, Bill, BillCreate, BillItem, BillItemCreate, Payment, PaymentCreate, BillWithItems, DashboardTable
+import weakref
+from archive import BillArchive
+from events import ChangeFeed
+from money import format_cents, line_total, to_cents
+from records import TableRecord, BillRecord, BillItemRecord, PaymentRecord, BillTotalsRecord, record_values, validate_updates
+from wal import WriteAheadLog
+from schemas import Table, TableCreate, Bill, BillCreate, BillItem, BillItemBase, BillItemCreate, Payment, PaymentCreate, BillWithItems, BillTotals, DashboardTable
+
+def bill_status(paid: int, remaining: int) -> str:
+    if remaining <= 0:
+        return "paid"
+    if paid > 0:
+        return "partial"
+    return "unpaid"
+
+def bill_balance(total: int, paid: int) -> dict:
+    """The total/paid/remaining/status fields of a bill, remaining and status derived from the other two"""
+    remaining = total - paid
+    
+    return {
+        "total": total,
+        "paid": paid,
+        "remaining": max(0, remaining),
+        "status": bill_status(paid, remaining),
+    }
+
+def bill_balanced(total: int, paid: Optional[int], remaining: int, status: Optional[str]) -> bool:
+    """Whether a bill's remaining and status are the ones its total and paid give"""
+    balance = bill_balance(total, paid or 0)
+    return (remaining, status) == (balance["remaining"], balance["status"])
+
+def payment_bill_updates(bill: Union[Bill, BillRecord], payment: PaymentCreate) -> dict:
+    """Compute the paid/remaining/status updates a payment applies to its bill"""
+    return bill_balance(bill.total, (bill.paid or 0) + payment.amount + (payment.tip or 0))
+
+def added_items_bill_updates(bill: Union[Bill, BillRecord], items: List[Union[BillItemBase, BillItemRecord]]) -> dict:
+    """Compute the total/remaining/status updates from adding items to a bill"""
+    return bill_balance(bill.total + sum(line_total(item.price, item.quantity) for item in items), bill.paid or 0)
+
+def changed_item_bill_delta(before: Union[BillItem, BillItemRecord], after: Union[BillItem, BillItemRecord]) -> Dict[str, int]:
+    """How much each bill's total moves when an item changes from `before` to `after`"""
+    deltas = {before.bill_id: -line_total(before.price, before.quantity)}
+    deltas[after.bill_id] = deltas.get(after.bill_id, 0) + line_total(after.price, after.quantity)
+    return {bill_id: delta for bill_id, delta in deltas.items() if delta}
+
+def payment_item_quantities(items) -> Iterator[Tuple[str, int]]:
+    """Yield (item_id, quantity in hundredths) pairs from a payment's items payload"""
+    if hasattr(items, '__iter__') and items:
+        for item_payment in items:
+            if isinstance(item_payment, dict):
+                item_id = item_payment.get("itemId")
+                quantity = item_payment.get("quantity")
+                if item_id and quantity:
+                    yield item_id, to_cents(quantity)
+
+def batch_item_quantities(payments: List[PaymentCreate]) -> Dict[str, int]:
+    """Total quantity in hundredths paid for per item id across several payments"""
+    quantities: Dict[str, int] = {}
+    for payment in payments:
+        for item_id, quantity in payment_item_quantities(payment.items):
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+    return quantities
+
+def check_item_quantities(quantities: Dict[str, int], unpaid: Dict[str, int]):
+    """Raise ValueError unless each item is on the bill with at least the quantity paid for still unpaid"""
+    for item_id, quantity in quantities.items():
+        if item_id not in unpaid:
+            raise ValueError(f"Item {item_id} is not on this bill")
+        if quantity > unpaid[item_id]:
+            raise ValueError(f"Item {item_id}: {format_cents(quantity)} paid for, {format_cents(unpaid[item_id])} unpaid")
+
+def _after(entries, after: Optional[str], key=None) -> list:
+    """The entries following the one whose id (or key(entry)) is `after`"""
+    if after is None:
+        return list(entries)
+    for index, entry in enumerate(entries):
+        if (key(entry) if key else entry) == after:
+            return list(entries[index + 1:])
+    raise ValueError(f"Unknown cursor: {after}")
 
 class IStorage:
     """Abstract storage interface"""
     
+    # Feed of bill, item and payment changes for push subscribers
+    changes: ChangeFeed
+    
+    # Payments that collided with a concurrent payment to the same bill, or
+    # None where payments cannot collide
+    payment_conflicts: Optional[int] = None
+    
     # Tables
     async def create_table(self, table: TableCreate) -> Table: ...
     async def get_table(self, id: str) -> Optional[Table]: ...
@@ -13,36 +104,273 @@ class IStorage:
     async def get_all_tables(self) -> List[Table]: ...
     async def update_table(self, id: str, updates: dict) -> Optional[Table]: ...
     
+    # Listings: documents (records in their JSON form, see records.py) in
+    # pages read as they are consumed. `after` is the id of the last
+    # document already seen; an unknown id raises ValueError.
+    def iter_table_documents(self, restaurant: Optional[str] = None, after: Optional[str] = None) -> AsyncIterator[dict]:
+        """Tables by number (then creation), optionally of one restaurant"""
+        ...
+    def iter_bill_item_documents(self, bill_id: str, after: Optional[str] = None) -> AsyncIterator[dict]:
+        """A bill's items in creation order"""
+        ...
+    def iter_payment_documents(self, bill_id: str, after: Optional[str] = None) -> AsyncIterator[dict]:
+        """A bill's payments in creation order"""
+        ...
+    def iter_bill_exports(self, restaurant: Optional[str] = None, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None) -> AsyncIterator[dict]:
+        """Bills started in [start, end), archived ones included, as {"bill", "items", "payments"} documents.
+        
+        Bills are read in batches as they are consumed, in no particular order.
+        """
+        ...
+    
     # Bills
     async def create_bill(self, bill: BillCreate) -> Bill: ...
     async def get_bill(self, id: str) -> Optional[Bill]: ...
     async def get_bill_by_table_id(self, table_id: str) -> Optional[Bill]: ...
     async def get_bill_with_items(self, id: str) -> Optional[BillWithItems]: ...
-    async def update_bill(self, id: str, updates: dict) -> Optional[Bill]: ...
+    async def update_bill(self, id: str, updates: dict) -> Optional[Bill]:
+        """Update a bill; remaining and status are re-derived from total and paid rather than taken from the updates"""
+        ...
     async def get_all_active_bills(self) -> List[Bill]: ...
     
     # Bill Items
-    async def create_bill_item(self, item: BillItemCreate) -> BillItem: ...
+    async def create_bill_item(self, item: BillItemCreate) -> BillItem:
+        """Create an item, adding its cost to its bill's total and remaining"""
+        ...
+    async def create_bill_items(self, items: List[BillItemCreate]) -> List[BillItem]:
+        """Create several items in one operation, adding their cost to each bill's total and remaining"""
+        ...
     async def get_bill_items(self, bill_id: str) -> List[BillItem]: ...
-    async def update_bill_item(self, id: str, updates: dict) -> Optional[BillItem]: ...
+    async def update_bill_item(self, id: str, updates: dict) -> Optional[BillItem]:
+        """Update an item; a change to its cost (price, quantity or bill) moves its bill's total by the difference"""
+        ...
     async def get_bill_item(self, id: str) -> Optional[BillItem]: ...
     
     # Payments
-    async def create_payment(self, payment: PaymentCreate) -> Payment: ...
+    async def create_payment(self, payment: PaymentCreate) -> Payment:
+        """Record a payment without applying it to its bill, which must exist"""
+        ...
+    async def apply_payment(self, payment: PaymentCreate) -> Optional[Tuple[Payment, Bill]]:
+        """Record a payment and update its bill and item paid quantities atomically.
+        
+        Its items are checked as in apply_payments first: ValueError, with
+        nothing recorded, if an item is not on the payment's bill or is paid
+        for beyond its unpaid quantity. Returns the payment and the updated
+        bill, or None without recording anything if the bill does not exist
+        (or is archived, so no longer takes payments).
+        """
+        ...
+    async def apply_payments(self, bill_id: str, payments: List[PaymentCreate]) -> Optional[List[Tuple[Payment, Bill]]]:
+        """Apply several payments to one bill atomically: all of them or, on error, none.
+        
+        The item quantities of the whole batch are checked against what is
+        still unpaid first; ValueError if an item is not on the bill or is
+        paid for beyond its unpaid quantity. Returns each payment with the
+        bill as it stood after it, the last being the final state, or None
+        if the bill does not exist.
+        """
+        ...
     async def get_payments_by_bill_id(self, bill_id: str) -> List[Payment]: ...
     
+    # Derived totals
+    async def get_bill_totals(self, bill_id: str) -> Optional[BillTotals]:
+        """A bill's balance with aggregates over its items and payments, None if the bill does not exist"""
+        ...
+    async def verify_bill_totals(self, rebuild: bool = False) -> List[str]:
+        """Ids of bills whose derived values disagree with their items and payments.
+        
+        With `rebuild`, those bills are corrected from their items and payments.
+        """
+        ...
+    
     # Dashboard
-    async def get_dashboard_tables(self) -> List[DashboardTable]: ...
+    async def get_dashboard_tables(self, restaurant: Optional[str] = None) -> List[DashboardTable]: ...
+    async def get_dashboard_documents(self, restaurant: Optional[str] = None) -> List[dict]:
+        """Dashboard tables in their JSON form, for encoding without models"""
+        return [table.model_dump(mode="json") for table in await self.get_dashboard_tables(restaurant)]
+    
+    # Versions: opaque tokens that change whenever the underlying data does
+    async def get_bill_version(self, id: str) -> Optional[str]:
+        """Version of a bill including its items and table, None if the bill does not exist"""
+        ...
+    async def get_dashboard_version(self, restaurant: Optional[str] = None) -> str:
+        """Version of the dashboard, overall or for a single restaurant"""
+        ...
+    async def get_storage_stats(self) -> Dict[str, int]:
+        """Number of records held, by kind"""
+        ...
+    async def bulk_load(self, tables: List[TableRecord], bills: List[BillRecord], items: List[BillItemRecord],
+                        payments: List[PaymentRecord]) -> None:
+        """Insert complete, already valid records in bulk (seeding); no change events are published"""
+        ...
 
 class MemStorage(IStorage):
-    """In-memory storage implementation"""
+    """In-memory storage implementation.
+    
+    With an archive, bills closed (inactive or paid) for `archive_after`
+    seconds can be moved out of memory by archive_closed_bills; they stay
+    readable by id but can no longer be updated.
+    
+    With a write-ahead log, every change is logged and mutating calls return
+    once the log is durable (per its fsync policy); state is recovered from
+    the latest snapshot plus the log tail on startup.
+    """
+    
+    def __init__(self, archive: Optional[BillArchive] = None, archive_after: float = 3600.0,
+                 wal: Optional[WriteAheadLog] = None, sample_data: bool = True):
+        self.tables: Dict[str, TableRecord] = {}
+        self.bills: Dict[str, BillRecord] = {}
+        self.bill_items: Dict[str, BillItemRecord] = {}
+        self.payments: Dict[str, PaymentRecord] = {}
+        
+        # Secondary indexes, kept in sync by the _index_* / _unindex_* helpers
+        self._table_by_number: Dict[Tuple[str, int], str] = {}
+        self._active_bills_by_table: Dict[str, List[str]] = {}
+        self._items_by_bill: Dict[str, List[str]] = {}
+        self._payments_by_bill: Dict[str, List[str]] = {}
+        # Running aggregates per bill, updated with the item and payment indexes
+        self._bill_totals: Dict[str, BillTotalsRecord] = {}
+        
+        # Per-bill locks serialising payment application; unused locks are dropped
+        self._bill_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        
+        self.changes = ChangeFeed()
+        
+        # Version counters, drawn from one monotonic sequence. The epoch keeps
+        # tokens from a previous process from matching after a restart.
+        self._epoch = uuid.uuid4().hex[:8]
+        self._next_version = itertools.count(1)
+        self._bill_versions: Dict[str, int] = {}
+        self._table_versions: Dict[str, int] = {}
+        self._dashboard_versions: Dict[str, int] = {}
+        self._dashboard_version = 0
+        
+        # Dashboard views sorted by (number, creation order), overall and per restaurant
+        self._table_seq: Dict[str, int] = {}
+        self._next_table_seq = itertools.count()
+        self._sorted_tables: List[Tuple[int, int, str]] = []
+        self._sorted_tables_by_restaurant: Dict[str, List[Tuple[int, int, str]]] = {}
+        
+        # Closed bills by the monotonic time of their last change, oldest first
+        self.archive = archive
+        self.archive_after = archive_after
+        self._closed_bills: "OrderedDict[str, float]" = OrderedDict()
+        self._archive_max_pause = 0.0
+        
+        # The log stays detached during recovery so replay is not re-logged
+        self.wal = None
+        if wal is None or not self._recover(wal):
+            if sample_data:
+                self._initialize_sample_data()
+            if wal is not None:
+                wal.snapshot_sync(self._capture_state())
+        self.wal = wal
     
-    def __init__(self):
-        self.tables: Dict[str, Table] = {}
-        self.bills: Dict[str, Bill] = {}
-        self.bill_items: Dict[str, BillItem] = {}
-        self.payments: Dict[str, Payment] = {}
-        self._initialize_sample_data()
+    def _touch_dashboard(self, restaurant_name: Optional[str], version: int):
+        self._dashboard_version = version
+        if restaurant_name is not None:
+            self._dashboard_versions[restaurant_name] = version
+    
+    def _changed(self, event: str, bill_id: str, record: Union[BillRecord, BillItemRecord, PaymentRecord]):
+        """Bump versions for a change to a bill or one of its records and publish it"""
+        if self.wal is not None:
+            self.wal.append((event, record_values(record)))
+        version = next(self._next_version)
+        self._bill_versions[bill_id] = version
+        
+        bill = self.bills.get(bill_id)
+        if not bill:
+            return
+        table = self.tables.get(bill.table_id)
+        restaurant_name = table.restaurant_name if table else None
+        self._touch_dashboard(restaurant_name, version)
+        if self.archive is not None:
+            self._track_closed(bill)
+        if self.changes.has_subscribers():
+            self.changes.publish_change(event, bill.table_id, restaurant_name, record.to_model())
+    
+    def _track_closed(self, bill: BillRecord):
+        if not bill.is_active or bill.status == "paid":
+            self._closed_bills[bill.id] = time.monotonic()
+            self._closed_bills.move_to_end(bill.id)
+        else:
+            self._closed_bills.pop(bill.id, None)
+    
+    def _table_changed(self, table: TableRecord, previous_restaurant: Optional[str] = None):
+        if self.wal is not None:
+            self.wal.append(("table", record_values(table)))
+        version = next(self._next_version)
+        self._table_versions[table.id] = version
+        self._touch_dashboard(table.restaurant_name, version)
+        if previous_restaurant is not None:
+            self._touch_dashboard(previous_restaurant, version)
+    
+    def _index_table(self, table: TableRecord):
+        self._table_by_number.setdefault((table.restaurant_name, table.number), table.id)
+        
+        seq = self._table_seq.setdefault(table.id, next(self._next_table_seq))
+        entry = (table.number, seq, table.id)
+        bisect.insort(self._sorted_tables, entry)
+        bisect.insort(self._sorted_tables_by_restaurant.setdefault(table.restaurant_name, []), entry)
+    
+    def _unindex_table(self, table: TableRecord):
+        entry = (table.number, self._table_seq[table.id], table.id)
+        for view in (self._sorted_tables, self._sorted_tables_by_restaurant[table.restaurant_name]):
+            del view[bisect.bisect_left(view, entry)]
+        if not self._sorted_tables_by_restaurant[table.restaurant_name]:
+            del self._sorted_tables_by_restaurant[table.restaurant_name]
+        
+        key = (table.restaurant_name, table.number)
+        if self._table_by_number.get(key) != table.id:
+            return
+        del self._table_by_number[key]
+        # Another table may share the same number; fall back to it
+        for other in self.tables.values():
+            if other.id != table.id and (other.restaurant_name, other.number) == key:
+                self._table_by_number[key] = other.id
+                break
+    
+    def _index_bill(self, bill: BillRecord):
+        if bill.is_active:
+            self._active_bills_by_table.setdefault(bill.table_id, []).append(bill.id)
+    
+    def _unindex_bill(self, bill: BillRecord):
+        active = self._active_bills_by_table.get(bill.table_id)
+        if active and bill.id in active:
+            active.remove(bill.id)
+            if not active:
+                del self._active_bills_by_table[bill.table_id]
+    
+    def _index_bill_item(self, item: BillItemRecord):
+        self._items_by_bill.setdefault(item.bill_id, []).append(item.id)
+        self._count_item(item)
+    
+    def _unindex_bill_item(self, item: BillItemRecord):
+        item_ids = self._items_by_bill.get(item.bill_id)
+        if item_ids and item.id in item_ids:
+            item_ids.remove(item.id)
+            if not item_ids:
+                del self._items_by_bill[item.bill_id]
+            self._uncount_item(item)
+    
+    def _index_payment(self, payment: PaymentRecord):
+        self._payments_by_bill.setdefault(payment.bill_id, []).append(payment.id)
+        self._bill_totals.setdefault(payment.bill_id, BillTotalsRecord()).add_payment(payment)
+    
+    # An item's price, quantities or bill are only changed between
+    # _uncount_item and _count_item, so the aggregates move by its delta
+    def _count_item(self, item: BillItemRecord):
+        self._bill_totals.setdefault(item.bill_id, BillTotalsRecord()).add_item(item)
+    
+    def _uncount_item(self, item: BillItemRecord):
+        self._bill_totals[item.bill_id].remove_item(item)
+    
+    def _set_bill_balance(self, bill: BillRecord, total: int):
+        # Values are already in cents, so they are assigned directly
+        # instead of going through BillRecord.update's validation
+        for key, value in bill_balance(total, bill.paid or 0).items():
+            setattr(bill, key, value)
     
     def _initialize_sample_data(self):
         """Initialize with sample data"""
@@ -56,7 +384,8 @@ class MemStorage(IStorage):
             is_active=True,
             created_at=datetime.now()
         )
-        self.tables[table_id] = table
+        self.tables[table_id] = table = TableRecord.from_model(table)
+        self._index_table(table)
         
         # Create sample bill
         bill_id = str(uuid.uuid4())
@@ -71,7 +400,8 @@ class MemStorage(IStorage):
             start_time=datetime.now(),
             is_active=True
         )
-        self.bills[bill_id] = bill
+        self.bills[bill_id] = bill = BillRecord.from_model(bill)
+        self._index_bill(bill)
         
         # Create sample bill items
         items_data = [
@@ -91,7 +421,8 @@ class MemStorage(IStorage):
                 quantity=item_data["quantity"],
                 paid_quantity=item_data["paid_quantity"]
             )
-            self.bill_items[item_id] = item
+            self.bill_items[item_id] = item = BillItemRecord.from_model(item)
+            self._index_bill_item(item)
         
         # Add more sample tables for dashboard
         for i in range(3, 13):
@@ -107,7 +438,8 @@ class MemStorage(IStorage):
                 is_active=True,
                 created_at=datetime.now()
             )
-            self.tables[t_id] = sample_table
+            self.tables[t_id] = sample_table = TableRecord.from_model(sample_table)
+            self._index_table(sample_table)
             
             # Create bills for some tables
             if i in [3, 5, 12]:
@@ -143,159 +475,684 @@ class MemStorage(IStorage):
                     start_time=datetime.now(),
                     is_active=True
                 )
-                self.bills[b_id] = sample_bill
+                self.bills[b_id] = sample_bill = BillRecord.from_model(sample_bill)
+                self._index_bill(sample_bill)
     
     async def create_table(self, table: TableCreate) -> Table:
         table_id = str(uuid.uuid4())
-        table = Table(
+        table = TableRecord(
             id=table_id,
             created_at=datetime.now(),
             **table.model_dump()
         )
         self.tables[table_id] = table
-        return table
+        self._index_table(table)
+        self._table_changed(table)
+        await self._commit()
+        return table.to_model()
     
     async def get_table(self, id: str) -> Optional[Table]:
-        return self.tables.get(id)
+        table = self.tables.get(id)
+        return table.to_model() if table else None
     
     async def get_table_by_number(self, number: int, restaurant_name: str) -> Optional[Table]:
-        for table in self.tables.values():
-            if table.number == number and table.restaurant_name == restaurant_name:
-                return table
-        return None
+        table_id = self._table_by_number.get((restaurant_name, number))
+        return self.tables[table_id].to_model() if table_id else None
     
     async def get_all_tables(self) -> List[Table]:
-        return list(self.tables.values())
+        return [table.to_model() for table in self.tables.values()]
+    
+    async def iter_table_documents(self, restaurant: Optional[str] = None, after: Optional[str] = None,
+                                   batch: int = 500) -> AsyncIterator[dict]:
+        key = None
+        if after is not None:
+            table = self.tables.get(after)
+            if table is None:
+                raise ValueError(f"Unknown cursor: {after}")
+            key = (table.number, self._table_seq[table.id] + 1)
+        while True:
+            # The sorted view may change while the caller consumes a batch,
+            # so each batch is found again from the last key (seqs are unique)
+            view = self._sorted_tables if restaurant is None else self._sorted_tables_by_restaurant.get(restaurant, [])
+            start = bisect.bisect_left(view, key) if key else 0
+            entries = view[start:start + batch]
+            for _, _, table_id in entries:
+                yield self.tables[table_id].to_document()
+            if len(entries) < batch:
+                return
+            number, seq, _ = entries[-1]
+            key = (number, seq + 1)
     
     async def update_table(self, id: str, updates: dict) -> Optional[Table]:
         table = self.tables.get(id)
         if not table:
             return None
         
-        for key, value in updates.items():
-            if hasattr(table, key):
-                setattr(table, key, value)
-        
-        self.tables[id] = table
-        return table
+        # Validated before the table leaves its indexes, so bad input leaves it untouched
+        updates = validate_updates(Table, updates)
+        previous_restaurant = table.restaurant_name
+        reindex = "number" in updates or "restaurant_name" in updates
+        if reindex:
+            self._unindex_table(table)
+        table.update(updates)
+        if reindex:
+            self._index_table(table)
+        self._table_changed(table, previous_restaurant)
+        await self._commit()
+        return table.to_model()
     
     async def create_bill(self, bill: BillCreate) -> Bill:
         bill_id = str(uuid.uuid4())
-        bill = Bill(
+        bill = BillRecord(
             id=bill_id,
             start_time=datetime.now(),
-            **bill.model_dump()
+            **{**bill.model_dump(), **bill_balance(bill.total, bill.paid or 0)}
         )
         self.bills[bill_id] = bill
-        return bill
+        self._index_bill(bill)
+        self._changed("bill", bill_id, bill)
+        await self._commit()
+        return bill.to_model()
     
     async def get_bill(self, id: str) -> Optional[Bill]:
-        return self.bills.get(id)
+        bill = self.bills.get(id)
+        if bill:
+            return bill.to_model()
+        archived = await self._archived_bill(id)
+        return Bill.model_validate(archived["bill"]) if archived else None
     
     async def get_bill_by_table_id(self, table_id: str) -> Optional[Bill]:
-        for bill in self.bills.values():
-            if bill.table_id == table_id and bill.is_active:
-                return bill
-        return None
+        active = self._active_bills_by_table.get(table_id)
+        return self.bills[active[0]].to_model() if active else None
     
     async def get_bill_with_items(self, id: str) -> Optional[BillWithItems]:
         bill = self.bills.get(id)
         if not bill:
-            return None
+            archived = await self._archived_bill(id)
+            if not archived:
+                return None
+            table = self.tables.get(archived["bill"]["table_id"])
+            if not table:
+                return None
+            return BillWithItems.model_validate({**archived["bill"], "items": archived["items"], "table": table.to_model()})
         
-        items = [item for item in self.bill_items.values() if item.bill_id == id]
         table = self.tables.get(bill.table_id)
         if not table:
             return None
         
-        return BillWithItems(
-            **bill.model_dump(),
-            items=items,
-            table=table
-        )
+        items = [self.bill_items[item_id] for item_id in self._items_by_bill.get(id, ())]
+        return bill.to_model_with_items(items, table)
     
     async def update_bill(self, id: str, updates: dict) -> Optional[Bill]:
         bill = self.bills.get(id)
         if not bill:
             return None
         
-        for key, value in updates.items():
-            if hasattr(bill, key):
-                setattr(bill, key, value)
-        
-        self.bills[id] = bill
-        return bill
+        updates = validate_updates(Bill, updates)
+        previous_table = self.tables.get(bill.table_id)
+        reindex = "is_active" in updates or "table_id" in updates
+        if reindex:
+            self._unindex_bill(bill)
+        bill.update(updates)
+        self._set_bill_balance(bill, bill.total)
+        if reindex:
+            self._index_bill(bill)
+        self._changed("bill", id, bill)
+        if previous_table and previous_table.id != bill.table_id:
+            # The bill moved tables; the old table's dashboard changed too
+            self._touch_dashboard(previous_table.restaurant_name, self._bill_versions[id])
+        await self._commit()
+        return bill.to_model()
     
     async def get_all_active_bills(self) -> List[Bill]:
-        return [bill for bill in self.bills.values() if bill.is_active]
+        return [self.bills[bill_id].to_model() for active in self._active_bills_by_table.values() for bill_id in active]
     
     async def create_bill_item(self, item: BillItemCreate) -> BillItem:
-        item_id = str(uuid.uuid4())
-        item = BillItem(
-            id=item_id,
-            **item.model_dump()
-        )
-        self.bill_items[item_id] = item
-        return item
+        return (await self.create_bill_items([item]))[0]
+    
+    async def create_bill_items(self, items: List[BillItemCreate]) -> List[BillItem]:
+        records = [BillItemRecord(id=str(uuid.uuid4()), **item.model_dump()) for item in items]
+        by_bill: Dict[str, List[BillItemRecord]] = {}
+        for record in records:
+            by_bill.setdefault(record.bill_id, []).append(record)
+        
+        for bill_id, bill_records in by_bill.items():
+            async with self._bill_lock(bill_id):
+                for record in bill_records:
+                    self.bill_items[record.id] = record
+                    self._index_bill_item(record)
+                    self._changed("item", bill_id, record)
+                
+                bill = self.bills.get(bill_id)
+                if bill:
+                    self._set_bill_balance(bill, added_items_bill_updates(bill, bill_records)["total"])
+                    self._changed("bill", bill_id, bill)
+        
+        await self._commit()
+        return [record.to_model() for record in records]
     
     async def get_bill_items(self, bill_id: str) -> List[BillItem]:
-        return [item for item in self.bill_items.values() if item.bill_id == bill_id]
+        if bill_id not in self.bills:
+            archived = await self._archived_bill(bill_id)
+            if archived:
+                return [BillItem.model_validate(item) for item in archived["items"]]
+        return [self.bill_items[item_id].to_model() for item_id in self._items_by_bill.get(bill_id, ())]
+    
+    async def iter_bill_item_documents(self, bill_id: str, after: Optional[str] = None) -> AsyncIterator[dict]:
+        if bill_id not in self.bills:
+            archived = await self._archived_bill(bill_id)
+            if archived:
+                for document in _after(archived["items"], after, lambda document: document["id"]):
+                    yield document
+                return
+        # A bill's item list is short, so a copy of the remainder is cheap
+        for item_id in _after(self._items_by_bill.get(bill_id, ()), after):
+            item = self.bill_items.get(item_id)
+            if item is not None:
+                yield item.to_document()
     
     async def update_bill_item(self, id: str, updates: dict) -> Optional[BillItem]:
         item = self.bill_items.get(id)
         if not item:
             return None
         
-        for key, value in updates.items():
-            if hasattr(item, key):
-                setattr(item, key, value)
+        updates = validate_updates(BillItem, updates)
+        before = BillItemRecord(*record_values(item))
+        reindex = "bill_id" in updates
+        if reindex:
+            self._unindex_bill_item(item)
+        else:
+            self._uncount_item(item)
+        item.update(updates)
+        if reindex:
+            self._index_bill_item(item)
+        else:
+            self._count_item(item)
+        self._changed("item", item.bill_id, item)
         
-        self.bill_items[id] = item
-        return item
+        for bill_id, delta in changed_item_bill_delta(before, item).items():
+            bill = self.bills.get(bill_id)
+            if bill:
+                self._set_bill_balance(bill, bill.total + delta)
+                self._changed("bill", bill_id, bill)
+        await self._commit()
+        return item.to_model()
     
     async def get_bill_item(self, id: str) -> Optional[BillItem]:
-        return self.bill_items.get(id)
+        item = self.bill_items.get(id)
+        if item:
+            return item.to_model()
+        archived = await self._archived(id)
+        if archived:
+            for item in archived["items"]:
+                if item["id"] == id:
+                    return BillItem.model_validate(item)
+        return None
     
-    async def create_payment(self, payment: PaymentCreate) -> Payment:
+    def _insert_payment(self, payment: PaymentCreate) -> PaymentRecord:
         payment_id = str(uuid.uuid4())
-        payment = Payment(
+        record = PaymentRecord(
             id=payment_id,
             processed_at=datetime.now(),
             **payment.model_dump()
         )
-        self.payments[payment_id] = payment
-        return payment
+        self.payments[payment_id] = record
+        self._index_payment(record)
+        self._changed("payment", record.bill_id, record)
+        return record
     
-    async def get_payments_by_bill_id(self, bill_id: str) -> List[Payment]:
-        return [payment for payment in self.payments.values() if payment.bill_id == bill_id]
+    async def create_payment(self, payment: PaymentCreate) -> Payment:
+        if payment.bill_id not in self.bills:
+            raise ValueError(f"Bill not found: {payment.bill_id}")
+        record = self._insert_payment(payment)
+        await self._commit()
+        return record.to_model()
+    
+    def _bill_lock(self, bill_id: str) -> asyncio.Lock:
+        lock = self._bill_locks.get(bill_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._bill_locks[bill_id] = lock
+        return lock
     
-    async def get_dashboard_tables(self) -> List[DashboardTable]:
-        dashboard_tables = []
+    async def apply_payment(self, payment: PaymentCreate) -> Optional[Tuple[Payment, Bill]]:
+        # Payments are applied without awaiting, so they never wait on each
+        # other here and payment_conflicts stays None
+        async with self._bill_lock(payment.bill_id):
+            result = self._apply_payment(payment)
+        await self._commit()
+        return result
+    
+    def _apply_payment(self, payment: PaymentCreate) -> Optional[Tuple[Payment, Bill]]:
+        bill = self.bills.get(payment.bill_id)
+        if not bill:
+            # Unknown or archived: the payment is not recorded
+            return None
+        quantities = batch_item_quantities([payment])
+        if quantities:
+            check_item_quantities(quantities, self._bill_totals.get(bill.id, BillTotalsRecord()).outstanding_quantity)
+        record = self._insert_payment(payment)
         
-        for table in self.tables.values():
-            bill = None
-            for b in self.bills.values():
-                if b.table_id == table.id and b.is_active:
-                    bill = b
-                    break
-            
-            items = []
-            if bill:
-                items = [item for item in self.bill_items.values() if item.bill_id == bill.id]
+        # Values below are already in cents, so they are assigned directly
+        # instead of going through update_bill's validation
+        for key, value in payment_bill_updates(bill, payment).items():
+            setattr(bill, key, value)
+        self._pay_bill_items(bill.id, quantities)
+        self._changed("bill", bill.id, bill)
+        return record.to_model(), bill.to_model()
+    
+    def _pay_bill_items(self, bill_id: str, quantities: Dict[str, int]):
+        """Add paid quantities already passed through check_item_quantities to their items"""
+        for item_id, quantity in quantities.items():
+            item = self.bill_items[item_id]
+            self._uncount_item(item)
+            item.paid_quantity = (item.paid_quantity or 0) + quantity
+            self._count_item(item)
+            self._changed("item", bill_id, item)
+    
+    async def apply_payments(self, bill_id: str, payments: List[PaymentCreate]) -> Optional[List[Tuple[Payment, Bill]]]:
+        async with self._bill_lock(bill_id):
+            bill = self.bills.get(bill_id)
+            if not bill:
+                return None
+            quantities = batch_item_quantities(payments)
+            # Checked before anything changes, so a rejected batch leaves no trace
+            check_item_quantities(quantities, self._bill_totals.get(bill_id, BillTotalsRecord()).outstanding_quantity)
             
-            dashboard_tables.append(DashboardTable(
+            results = []
+            for payment in payments:
+                record = self._insert_payment(payment)
+                for key, value in payment_bill_updates(bill, payment).items():
+                    setattr(bill, key, value)
+                results.append((record.to_model(), bill.to_model()))
+            self._pay_bill_items(bill_id, quantities)
+            self._changed("bill", bill_id, bill)
+        await self._commit()
+        return results
+    
+    async def get_payments_by_bill_id(self, bill_id: str) -> List[Payment]:
+        if bill_id not in self.bills:
+            archived = await self._archived_bill(bill_id)
+            if archived:
+                return [Payment.model_validate(payment) for payment in archived["payments"]]
+        return [self.payments[payment_id].to_model() for payment_id in self._payments_by_bill.get(bill_id, ())]
+    
+    async def get_bill_totals(self, bill_id: str) -> Optional[BillTotals]:
+        bill = self.bills.get(bill_id)
+        if bill:
+            return self._bill_totals.get(bill_id, BillTotalsRecord()).to_model(bill, self._items_by_bill.get(bill_id, []))
+        archived = await self._archived_bill(bill_id)
+        if not archived:
+            return None
+        # Archived bills no longer change, so their totals are counted on read
+        totals = BillTotalsRecord()
+        for item in archived["items"]:
+            totals.add_item(BillItem.model_validate(item))
+        for payment in archived["payments"]:
+            totals.add_payment(Payment.model_validate(payment))
+        return totals.to_model(Bill.model_validate(archived["bill"]))
+    
+    async def verify_bill_totals(self, rebuild: bool = False) -> List[str]:
+        counted: Dict[str, BillTotalsRecord] = {}
+        for item in self.bill_items.values():
+            counted.setdefault(item.bill_id, BillTotalsRecord()).add_item(item)
+        for payment in self.payments.values():
+            counted.setdefault(payment.bill_id, BillTotalsRecord()).add_payment(payment)
+        
+        empty = BillTotalsRecord()
+        mismatched = []
+        for bill_id in sorted(counted.keys() | self._bill_totals.keys() | self.bills.keys()):
+            bill = self.bills.get(bill_id)
+            balanced = bill is None or bill_balanced(bill.total, bill.paid, bill.remaining, bill.status)
+            if not balanced or counted.get(bill_id, empty) != self._bill_totals.get(bill_id, empty):
+                mismatched.append(bill_id)
+        
+        if rebuild and mismatched:
+            self._bill_totals = counted
+            for bill_id in mismatched:
+                bill = self.bills.get(bill_id)
+                if bill:
+                    self._set_bill_balance(bill, bill.total)
+                    self._changed("bill", bill_id, bill)
+            await self._commit()
+        return mismatched
+    
+    def _dashboard_records(self, restaurant: Optional[str]) -> Iterator[Tuple[TableRecord, Optional[BillRecord], List[BillItemRecord]]]:
+        """Each table of the dashboard with its active bill and the bill's items"""
+        # Views are kept sorted by table number, so no per-request sort is needed
+        if restaurant is None:
+            view = self._sorted_tables
+        else:
+            view = self._sorted_tables_by_restaurant.get(restaurant, [])
+        
+        for _, _, table_id in view:
+            active = self._active_bills_by_table.get(table_id)
+            bill = self.bills[active[0]] if active else None
+            items = [self.bill_items[item_id] for item_id in self._items_by_bill.get(bill.id, ())] if bill else []
+            yield self.tables[table_id], bill, items
+    
+    async def iter_payment_documents(self, bill_id: str, after: Optional[str] = None) -> AsyncIterator[dict]:
+        if bill_id not in self.bills:
+            archived = await self._archived_bill(bill_id)
+            if archived:
+                for document in _after(archived["payments"], after, lambda document: document["id"]):
+                    yield document
+                return
+        for payment_id in _after(self._payments_by_bill.get(bill_id, ()), after):
+            payment = self.payments.get(payment_id)
+            if payment is not None:
+                yield payment.to_document()
+    
+    async def iter_bill_exports(self, restaurant: Optional[str] = None, start: Optional[datetime] = None,
+                                end: Optional[datetime] = None, max_pause: float = 0.005) -> AsyncIterator[dict]:
+        # The event loop is held for at most about max_pause seconds at a time,
+        # counting the time the consumer spends on the documents
+        table_ids = None
+        if restaurant is not None:
+            table_ids = {table_id for _, _, table_id in self._sorted_tables_by_restaurant.get(restaurant, ())}
+        
+        def included(table_id: str, start_time: Optional[datetime]) -> bool:
+            if table_ids is not None and table_id not in table_ids:
+                return False
+            if start_time is None:
+                return False
+            return (start is None or start_time >= start) and (end is None or start_time < end)
+        
+        def archived_included(document: dict) -> bool:
+            bill = document["bill"]
+            start_time = bill["start_time"]
+            return included(bill["table_id"], datetime.fromisoformat(start_time) if start_time else None)
+        
+        paused = time.monotonic()
+        
+        # The archive is read up to where it ends when the export starts, then
+        # the bills in memory at that point, each from the archive if it has
+        # been evicted since: every bill is exported once
+        hot = list(self.bills)
+        if self.archive is not None:
+            archive_end = await asyncio.to_thread(self.archive.end)
+            position = (0, 0)
+            while position is not None:
+                documents, position = await asyncio.to_thread(self.archive.scan, position, archive_end)
+                paused = time.monotonic()
+                for document in documents:
+                    # A bill back in memory shadows its archived copy
+                    if document["bill"]["id"] not in self.bills and archived_included(document):
+                        yield document
+                    if time.monotonic() - paused > max_pause:
+                        await asyncio.sleep(0)
+                        paused = time.monotonic()
+        
+        for bill_id in hot:
+            bill = self.bills.get(bill_id)
+            if bill is not None:
+                if included(bill.table_id, bill.start_time):
+                    yield self._bill_document(bill_id)
+            else:
+                archived = await self._archived_bill(bill_id)
+                if archived and archived_included(archived):
+                    yield archived
+            if time.monotonic() - paused > max_pause:
+                await asyncio.sleep(0)
+                paused = time.monotonic()
+    
+    async def get_dashboard_tables(self, restaurant: Optional[str] = None) -> List[DashboardTable]:
+        return [
+            DashboardTable.model_construct(
                 id=table.id,
                 number=table.number,
                 restaurant_name=table.restaurant_name,
-                bill=bill,
-                items=items,
+                bill=bill.to_model() if bill else None,
+                items=[item.to_model() for item in items],
                 guest_count=bill.guest_count or 0 if bill else 0,
                 start_time=bill.start_time if bill else None
-            ))
+            )
+            for table, bill, items in self._dashboard_records(restaurant)
+        ]
+    
+    async def get_dashboard_documents(self, restaurant: Optional[str] = None) -> List[dict]:
+        # Straight from the records: no models are built
+        return [
+            {
+                "id": table.id,
+                "number": table.number,
+                "restaurant_name": table.restaurant_name,
+                "bill": bill.to_document() if bill else None,
+                "items": [item.to_document() for item in items],
+                "guest_count": bill.guest_count or 0 if bill else 0,
+                "start_time": bill.start_time.isoformat() if bill and bill.start_time else None,
+            }
+            for table, bill, items in self._dashboard_records(restaurant)
+        ]
+    
+    async def get_bill_version(self, id: str) -> Optional[str]:
+        bill = self.bills.get(id)
+        if not bill:
+            # Archived bills can no longer change
+            archived = await self._archived_bill(id)
+            return f"{self._epoch}-archived" if archived else None
+        return f"{self._epoch}-{self._bill_versions.get(id, 0)}-{self._table_versions.get(bill.table_id, 0)}"
+    
+    async def get_dashboard_version(self, restaurant: Optional[str] = None) -> str:
+        if restaurant is None:
+            return f"{self._epoch}-{self._dashboard_version}"
+        return f"{self._epoch}-{self._dashboard_versions.get(restaurant, 0)}"
+    
+    async def get_storage_stats(self) -> Dict[str, int]:
+        stats = {
+            "tables": len(self.tables),
+            "bills": len(self.bills),
+            "bill_items": len(self.bill_items),
+            "payments": len(self.payments),
+        }
+        if self.archive is not None:
+            stats["closed_bills"] = len(self._closed_bills)
+            stats["archive_max_pause_us"] = int(self._archive_max_pause * 1e6)
+            for key, value in (await asyncio.to_thread(self.archive.stats)).items():
+                stats[f"archive_{key}"] = value
+        return stats
+    
+    async def bulk_load(self, tables: List[TableRecord], bills: List[BillRecord], items: List[BillItemRecord],
+                        payments: List[PaymentRecord]) -> None:
+        # The records are kept as given, so callers must not reuse them
+        for table in tables:
+            self.tables[table.id] = table
+            self._index_table(table)
+        for bill in bills:
+            self.bills[bill.id] = bill
+            self._index_bill(bill)
+            if self.archive is not None:
+                self._track_closed(bill)
+        for item in items:
+            self.bill_items[item.id] = item
+            self._index_bill_item(item)
+        for payment in payments:
+            self.payments[payment.id] = payment
+            self._index_payment(payment)
+        
+        version = next(self._next_version)
+        for restaurant_name in {table.restaurant_name for table in tables}:
+            self._touch_dashboard(restaurant_name, version)
+        for bill in bills:
+            self._bill_versions[bill.id] = version
+        # Loads are not logged record by record; a snapshot makes them durable
+        await self.snapshot()
+    
+    # Durability
+    async def _commit(self):
+        if self.wal is not None:
+            await self.wal.commit()
+    
+    def _capture_state(self) -> dict:
+        return {
+            key: [record_values(record) for record in store.values()]
+            for _, store, key in self._record_stores().values()
+        }
+    
+    async def snapshot(self):
+        """Snapshot the current state so recovery only replays the log after it"""
+        if self.wal is not None:
+            await self.wal.snapshot(self._capture_state)
+    
+    def _recover(self, wal: WriteAheadLog) -> bool:
+        """Load the latest snapshot and replay the log tail; False if there was nothing to recover"""
+        stores = self._record_stores()
+        snapshot, entries = wal.recover()
+        recovered = snapshot is not None
+        if snapshot:
+            for cls, store, key in stores.values():
+                for values in snapshot[key]:
+                    record = cls(*values)
+                    store[record.id] = record
         
-        # Sort by table number
-        dashboard_tables.sort(key=lambda x: x.number)
-        return dashboard_tables
+        evicted = set()
+        for event, value in entries:
+            recovered = True
+            if event == "evict":
+                self.bills.pop(value, None)
+                evicted.add(value)
+                continue
+            cls, store, _ = stores[event]
+            record = cls(*value)
+            # Updating an existing key keeps its original insertion order
+            store[record.id] = record
+        if not recovered:
+            return False
+        
+        for store in (self.bill_items, self.payments):
+            for id in [id for id, record in store.items() if record.bill_id in evicted and record.bill_id not in self.bills]:
+                del store[id]
+        
+        for table in self.tables.values():
+            self._index_table(table)
+        for bill in self.bills.values():
+            self._index_bill(bill)
+            if self.archive is not None:
+                self._track_closed(bill)
+        for item in self.bill_items.values():
+            self._index_bill_item(item)
+        for payment in self.payments.values():
+            self._index_payment(payment)
+        return True
+    
+    def _record_stores(self) -> Dict[str, tuple]:
+        """Record class, dict and snapshot key for each logged event kind"""
+        return {
+            "table": (TableRecord, self.tables, "tables"),
+            "bill": (BillRecord, self.bills, "bills"),
+            "item": (BillItemRecord, self.bill_items, "bill_items"),
+            "payment": (PaymentRecord, self.payments, "payments"),
+        }
+    
+    # Archival
+    async def _archived(self, id: str) -> Optional[dict]:
+        """The archived bill document holding a bill, item or payment id"""
+        if self.archive is None:
+            return None
+        return await asyncio.to_thread(self.archive.get, id)
+    
+    async def _archived_bill(self, bill_id: str) -> Optional[dict]:
+        """The archived document of a bill id; an item or payment id does not resolve to its bill"""
+        archived = await self._archived(bill_id)
+        return archived if archived and archived["bill"]["id"] == bill_id else None
+    
+    def _bill_document(self, bill_id: str) -> dict:
+        return {
+            "bill": self.bills[bill_id].to_document(),
+            "items": [self.bill_items[item_id].to_document() for item_id in self._items_by_bill.get(bill_id, ())],
+            "payments": [self.payments[payment_id].to_document() for payment_id in self._payments_by_bill.get(bill_id, ())],
+        }
+    
+    def _evict_bill(self, bill_id: str):
+        if self.wal is not None:
+            self.wal.append(("evict", bill_id))
+        bill = self.bills.pop(bill_id)
+        self._unindex_bill(bill)
+        for item_id in self._items_by_bill.pop(bill_id, ()):
+            del self.bill_items[item_id]
+        for payment_id in self._payments_by_bill.pop(bill_id, ()):
+            del self.payments[payment_id]
+        self._bill_totals.pop(bill_id, None)
+        self._bill_versions.pop(bill_id, None)
+        self._closed_bills.pop(bill_id, None)
+        if bill.is_active:
+            # A paid bill still open on its table drops off the dashboard
+            table = self.tables.get(bill.table_id)
+            self._touch_dashboard(table.restaurant_name if table else None, next(self._next_version))
+    
+    async def archive_closed_bills(self, max_bills: int = 500, max_pause: float = 0.005) -> int:
+        """Move up to max_bills long-closed bills to the archive, returning how many moved.
+        
+        Collecting the bills holds the event loop for at most about max_pause
+        seconds; the archive is written from a worker thread.
+        """
+        if self.archive is None:
+            return 0
+        
+        started = time.monotonic()
+        cutoff = started - self.archive_after
+        documents = []
+        versions: Dict[str, int] = {}
+        for bill_id, closed_at in self._closed_bills.items():
+            if closed_at > cutoff or len(documents) >= max_bills or time.monotonic() - started > max_pause:
+                break
+            lock = self._bill_locks.get(bill_id)
+            if lock is not None and lock.locked():
+                continue
+            documents.append(self._bill_document(bill_id))
+            versions[bill_id] = self._bill_versions.get(bill_id, 0)
+        self._archive_max_pause = max(self._archive_max_pause, time.monotonic() - started)
+        if not documents:
+            return 0
+        
+        await asyncio.to_thread(self.archive.append, documents)
+        
+        # Bills changed while the batch was written stay in memory; their
+        # archived copy is shadowed and replaced when they are archived again
+        archived = 0
+        for bill_id, version in versions.items():
+            if bill_id in self.bills and self._bill_versions.get(bill_id, 0) == version:
+                self._evict_bill(bill_id)
+                archived += 1
+        return archived
+
+def create_storage() -> IStorage:
+    """Build the storage backend selected by SPLITPAY_STORAGE (memory, sqlite or postgres)"""
+    backend = os.getenv("SPLITPAY_STORAGE", "memory")
+    if backend == "memory":
+        archive = None
+        archive_dir = os.getenv("SPLITPAY_ARCHIVE_DIR")
+        if archive_dir:
+            archive = BillArchive(archive_dir, int(os.getenv("SPLITPAY_ARCHIVE_SEGMENT_BYTES", str(8 * 1024 * 1024))))
+        wal = None
+        wal_dir = os.getenv("SPLITPAY_WAL_DIR")
+        if wal_dir:
+            wal = WriteAheadLog(
+                wal_dir,
+                fsync=os.getenv("SPLITPAY_WAL_FSYNC", "batched"),
+                interval=float(os.getenv("SPLITPAY_WAL_INTERVAL_MS", "5")) / 1000,
+                batch_bytes=int(os.getenv("SPLITPAY_WAL_BATCH_BYTES", str(1024 * 1024))),
+            )
+        return MemStorage(
+            archive, float(os.getenv("SPLITPAY_ARCHIVE_AFTER", "3600")), wal,
+            sample_data=os.getenv("SPLITPAY_SAMPLE_DATA", "1") == "1",
+        )
+    if backend == "sqlite":
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage(
+            os.getenv("SPLITPAY_SQLITE_PATH", "splitpay.db"),
+            shared=os.getenv("SPLITPAY_SQLITE_SHARED") == "1",
+            busy_timeout=float(os.getenv("SPLITPAY_SQLITE_BUSY_TIMEOUT", "30")),
+        )
+    if backend == "postgres":
+        from postgres_storage import PostgresStorage
+        return PostgresStorage(
+            os.getenv("SPLITPAY_POSTGRES_DSN", "postgresql://localhost/splitpay"),
+            min_size=int(os.getenv("SPLITPAY_POSTGRES_POOL_MIN", "2")),
+            max_size=int(os.getenv("SPLITPAY_POSTGRES_POOL_MAX", "10")),
+            shared=os.getenv("SPLITPAY_POSTGRES_SHARED") == "1",
+        )
+    raise ValueError(f"Unknown storage backend: {backend}")
 
 # Global storage instance
-storage = MemStorage()
\ No newline at end of file
+storage = create_storage()
@@ -0,0 +1,101 @@
+import asyncio
+import os
+from typing import Iterable, List, Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+
+import routes
+from schemas import BillCreate, BillItemCreate, TableCreate
+from sqlite_storage import SqliteStorage
+from storage import MemStorage
+
+# PostgresStorage runs the same tests when a database is given, e.g.
+# SPLITPAY_TEST_POSTGRES_DSN=postgresql://postgres@127.0.0.1/splitpay
+# Each test recreates a splitpay_test schema there; other schemas are left alone.
+POSTGRES_DSN = os.getenv("SPLITPAY_TEST_POSTGRES_DSN")
+POSTGRES_SCHEMA = "splitpay_test"
+
+BACKENDS = [
+    "memory",
+    "sqlite",
+    pytest.param("postgres", marks=pytest.mark.skipif(not POSTGRES_DSN, reason="SPLITPAY_TEST_POSTGRES_DSN is not set")),
+]
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on the test's own event loop, which the storage under test stays bound to"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(params=BACKENDS)
+def storage(request, run, tmp_path):
+    """An empty storage, once per backend"""
+    if request.param == "memory":
+        yield MemStorage(sample_data=False)
+    elif request.param == "sqlite":
+        storage = SqliteStorage(str(tmp_path / "splitpay.db"))
+        yield storage
+        storage.close()
+    else:
+        # asyncpg is an optional dependency, only needed here
+        from postgres_storage import PostgresStorage
+        run(reset_postgres_schema())
+        separator = "&" if "?" in POSTGRES_DSN else "?"
+        storage = PostgresStorage(f"{POSTGRES_DSN}{separator}search_path={POSTGRES_SCHEMA}")
+        yield storage
+        run(storage.aclose())
+
+
+async def reset_postgres_schema():
+    import asyncpg
+    conn = await asyncpg.connect(POSTGRES_DSN)
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {POSTGRES_SCHEMA} CASCADE; CREATE SCHEMA {POSTGRES_SCHEMA}")
+    finally:
+        await conn.close()
+
+
+@pytest.fixture
+def make_bill(storage):
+    """Create a table with an empty bill and the given (name, price, quantity) items on it"""
+    numbers = iter(range(1, 1000))
+
+    async def make(items: Iterable[Tuple[str, str, str]] = (("Dish", "12.50", "1"),),
+                   restaurant: str = "test") -> Tuple[str, List[str]]:
+        number = next(numbers)
+        table = await storage.create_table(TableCreate(number=number, restaurant_name=restaurant, qr_code=f"QR-{restaurant}-{number}"))
+        bill = await storage.create_bill(BillCreate(table_id=table.id, total="0", remaining="0"))
+        records = await storage.create_bill_items([
+            BillItemCreate(bill_id=bill.id, name=name, price=price, quantity=quantity) for name, price, quantity in items
+        ])
+        return bill.id, [record.id for record in records]
+
+    return make
+
+
+@pytest.fixture
+def client(monkeypatch, storage):
+    """A client for the API served from `storage`"""
+    monkeypatch.setattr(routes, "storage", storage)
+    with TestClient(routes.app) as client:
+        yield client
+
+
+@pytest.fixture
+def api_bill(client):
+    """Create a table with an empty bill and the given items through the API, returning the bill with its items"""
+    numbers = iter(range(1, 1000))
+
+    def make(items: Iterable[dict] = ({"name": "Dish", "price": "12.50"},)) -> dict:
+        number = next(numbers)
+        table = client.post("/api/tables", json={"number": number, "restaurant_name": "test", "qr_code": f"QR-test-{number}"}).json()
+        bill = client.post("/api/bills", json={"table_id": table["id"], "total": "0", "remaining": "0"}).json()
+        response = client.post(f"/api/bills/{bill['id']}/items:batch", json=list(items))
+        assert response.status_code == 201, response.text
+        return client.get(f"/api/bills/{bill['id']}").json()
+
+    return make
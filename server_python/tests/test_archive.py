@@ -0,0 +1,99 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import routes
+from archive import BillArchive
+from schemas import PaymentCreate
+from storage import MemStorage
+
+
+@pytest.fixture
+def archived_storage(run, tmp_path):
+    """A storage whose sample bill has been paid, closed and archived"""
+    storage = MemStorage(archive=BillArchive(str(tmp_path)), archive_after=0)
+
+    async def close_and_archive():
+        table = await storage.get_table_by_number(7, "bella-vista")
+        bill = await storage.get_bill_by_table_id(table.id)
+        await storage.apply_payment(PaymentCreate(bill_id=bill.id, amount=str(bill.remaining // 100 + 1), items=[]))
+        await storage.update_bill(bill.id, {"is_active": False})
+        before = await storage.get_bill_with_items(bill.id)
+        assert await storage.archive_closed_bills() == 1
+        return before
+
+    before = run(close_and_archive())
+    yield storage, before
+    storage.archive.close()
+
+
+def test_archived_bill_reads_as_before(run, archived_storage):
+    storage, before = archived_storage
+    bill_id = before.id
+    assert bill_id not in storage.bills
+
+    assert run(storage.get_bill_with_items(bill_id)).model_dump() == before.model_dump()
+    assert run(storage.get_bill(bill_id)).model_dump() == before.model_dump(exclude={"items", "table"})
+    assert [item.model_dump() for item in run(storage.get_bill_items(bill_id))] == [item.model_dump() for item in before.items]
+    assert run(storage.get_bill_item(before.items[0].id)).model_dump() == before.items[0].model_dump()
+    assert len(run(storage.get_payments_by_bill_id(bill_id))) == 1
+    totals = run(storage.get_bill_totals(bill_id))
+    assert (totals.remaining, totals.status, totals.payment_count) == (0, "paid", 1)
+    assert run(storage.get_bill_version(bill_id)) is not None
+    assert run(storage.get_storage_stats())["archive_archived_bills"] == 1
+
+
+def test_export_includes_archived_bills_once(run, archived_storage):
+    storage, before = archived_storage
+
+    async def export():
+        return [document async for document in storage.iter_bill_exports()]
+
+    bill_ids = [document["bill"]["id"] for document in run(export())]
+    assert bill_ids.count(before.id) == 1
+    assert len(bill_ids) == len(set(bill_ids)) == len(storage.bills) + 1
+
+
+def test_item_and_payment_ids_do_not_resolve_to_their_archived_bill(run, archived_storage):
+    storage, before = archived_storage
+    payment_id = run(storage.get_payments_by_bill_id(before.id))[0].id
+
+    async def documents(iterator):
+        return [document async for document in iterator]
+
+    for id in (before.items[0].id, payment_id):
+        assert run(storage.get_bill(id)) is None
+        assert run(storage.get_bill_with_items(id)) is None
+        assert run(storage.get_bill_items(id)) == []
+        assert run(storage.get_payments_by_bill_id(id)) == []
+        assert run(documents(storage.iter_bill_item_documents(id))) == []
+        assert run(documents(storage.iter_payment_documents(id))) == []
+        assert run(storage.get_bill_totals(id)) is None
+        assert run(storage.get_bill_version(id)) is None
+
+
+def test_archived_bill_takes_no_payments(run, archived_storage):
+    storage, before = archived_storage
+    payment = PaymentCreate(bill_id=before.id, amount="1.00", items=[])
+    payments = len(storage.payments)
+
+    assert run(storage.apply_payment(payment)) is None
+    assert run(storage.apply_payments(before.id, [payment])) is None
+    with pytest.raises(ValueError):
+        run(storage.create_payment(payment))
+    assert len(storage.payments) == payments
+    assert len(run(storage.get_payments_by_bill_id(before.id))) == 1
+
+
+def test_archived_bill_routes(archived_storage, monkeypatch):
+    storage, before = archived_storage
+    monkeypatch.setattr(routes, "storage", storage)
+    item_id = before.items[0].id
+    with TestClient(routes.app) as client:
+        assert client.get(f"/api/bills/{before.id}").json()["id"] == before.id
+        assert client.get(f"/api/bills/{item_id}").status_code == 404
+        assert client.get(f"/api/bills/{item_id}/items").json() == []
+        assert client.post(f"/api/bills/{item_id}/items:batch", json=[{"name": "Dish", "price": "1.00"}]).status_code == 404
+        assert client.post("/api/payments", json={"bill_id": before.id, "amount": "1.00", "items": []}).status_code == 409
+        assert client.post(f"/api/bills/{before.id}/payments:batch", json=[{"amount": "1.00", "items": []}]).status_code == 409
+        assert client.post("/api/payments", json={"bill_id": item_id, "amount": "1.00", "items": []}).status_code == 404
+        assert len(client.get(f"/api/payments/bill/{before.id}").json()) == 1
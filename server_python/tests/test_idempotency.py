@@ -0,0 +1,146 @@
+import asyncio
+import uuid
+
+import pytest
+
+from idempotency import IdempotencyKeyReused, IdempotencyStore, SharedIdempotencyStore
+from sqlite_storage import SqliteStorage
+
+
+def test_retry_replays_the_first_payment(client, api_bill):
+    bill = api_bill()
+    key = {"Idempotency-Key": str(uuid.uuid4())}
+    body = {"bill_id": bill["id"], "amount": "5.00", "items": []}
+
+    first = client.post("/api/payments", json=body, headers=key)
+    retry = client.post("/api/payments", json=body, headers=key)
+    assert (first.status_code, retry.status_code) == (201, 201)
+    assert retry.content == first.content
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+    assert client.post("/api/payments", json={**body, "amount": "6.00"}, headers=key).status_code == 422
+    assert client.get(f"/api/bills/{bill['id']}").json()["paid"] == "5.00"
+    assert len(client.get(f"/api/payments/bill/{bill['id']}").json()) == 1
+
+
+def test_batch_retry_is_applied_once(client, api_bill):
+    bill = api_bill()
+    key = {"Idempotency-Key": str(uuid.uuid4())}
+    url = f"/api/bills/{bill['id']}/payments:batch"
+    body = [{"amount": "2.50", "items": []}, {"amount": "2.50", "items": []}]
+
+    first = client.post(url, json=body, headers=key)
+    assert client.post(url, json=body, headers=key).content == first.content
+    assert client.get(f"/api/bills/{bill['id']}").json()["paid"] == "5.00"
+
+
+def test_concurrent_duplicates_run_once(run):
+    store = IdempotencyStore()
+    calls = 0
+
+    async def execute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return b"paid"
+
+    async def duplicates():
+        return await asyncio.gather(*(store.run("key", "payment", execute) for _ in range(10)))
+
+    results = run(duplicates())
+    assert calls == 1
+    assert sorted(replayed for _, replayed in results) == [False] + [True] * 9
+    assert {body for body, _ in results} == {b"paid"}
+
+
+def test_failure_is_not_stored(run):
+    store = IdempotencyStore()
+
+    async def fail():
+        raise RuntimeError("declined")
+
+    async def succeed():
+        return b"paid"
+
+    with pytest.raises(RuntimeError):
+        run(store.run("key", "payment", fail))
+    assert run(store.run("key", "payment", succeed)) == (b"paid", False)
+    with pytest.raises(IdempotencyKeyReused):
+        run(store.run("key", "another payment", succeed))
+
+
+def test_entries_expire_and_are_bounded(run):
+    store = IdempotencyStore(max_entries=2, ttl=0.05)
+
+    async def succeed():
+        return b"paid"
+
+    for key in "abc":
+        run(store.run(key, "payment", succeed))
+    assert run(store.run("c", "payment", succeed)) == (b"paid", True)
+    assert run(store.run("a", "payment", succeed)) == (b"paid", False)
+    run(asyncio.sleep(0.06))
+    assert run(store.run("c", "payment", succeed)) == (b"paid", False)
+
+
+@pytest.fixture
+def worker_stores(run, storage):
+    """Idempotency stores of two worker processes sharing `storage`'s database"""
+    if hasattr(storage, "bills"):
+        pytest.skip("MemStorage is not shared between processes")
+    elif hasattr(storage, "_conn"):
+        other = SqliteStorage(storage.path, shared=True)
+        yield SharedIdempotencyStore(storage, poll_interval=0.01), SharedIdempotencyStore(other, poll_interval=0.01)
+        other.close()
+    else:
+        from postgres_storage import PostgresStorage
+        other = PostgresStorage(storage.dsn, shared=True)
+        yield SharedIdempotencyStore(storage, poll_interval=0.01), SharedIdempotencyStore(other, poll_interval=0.01)
+        run(other.aclose())
+
+
+def test_retry_on_another_worker_is_replayed(run, worker_stores):
+    first, second = worker_stores
+    calls = 0
+
+    async def pay():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return b"paid"
+
+    async def on_both():
+        return await asyncio.gather(first.run("key", "payment", pay), second.run("key", "payment", pay))
+
+    assert sorted(run(on_both())) == [(b"paid", False), (b"paid", True)]
+    assert run(second.run("key", "payment", pay)) == (b"paid", True)
+    assert calls == 1
+    with pytest.raises(IdempotencyKeyReused):
+        run(first.run("key", "another payment", pay))
+
+
+def test_failure_on_one_worker_frees_the_key(run, worker_stores):
+    first, second = worker_stores
+
+    async def fail():
+        raise RuntimeError("declined")
+
+    async def succeed():
+        return b"paid"
+
+    with pytest.raises(RuntimeError):
+        run(first.run("key", "payment", fail))
+    assert run(second.run("key", "payment", succeed)) == (b"paid", False)
+
+
+def test_claim_of_a_dead_worker_lapses(run, worker_stores):
+    first, second = worker_stores
+
+    async def succeed():
+        return b"paid"
+
+    # A worker that claimed the key and died without finishing
+    assert run(first.storage.claim_idempotency_key("key", "payment", "dead", 0.05))[0]
+    run(asyncio.sleep(0.1))
+    assert run(second.run("key", "payment", succeed)) == (b"paid", False)
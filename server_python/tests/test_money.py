@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+import pytest
+from pydantic import ValidationError
+
+from money import format_cents, line_total, to_cents
+from schemas import BillItemCreate, PaymentCreate
+
+
+@pytest.mark.parametrize("value, cents", [
+    ("12.50", 1250), ("12.5", 1250), ("12", 1200), ("0.01", 1), (" 3.10 ", 310), ("1.005", 101),
+    (12, 1200), (0, 0), (Decimal("7.25"), 725), (12.5, 1250),
+])
+def test_to_cents(value, cents):
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize("value", ["abc", "", "NaN", "Infinity", True, None])
+def test_to_cents_rejects(value):
+    with pytest.raises(ValueError):
+        to_cents(value)
+
+
+def test_format_and_line_total():
+    assert [format_cents(cents) for cents in (0, 5, 1250, -75)] == ["0.00", "0.05", "12.50", "-0.75"]
+    # 3.33 x 0.5 = 1.665, rounded half up
+    assert line_total(333, 50) == 167
+
+
+def test_ints_are_whole_units_like_strings():
+    assert BillItemCreate(bill_id="b", name="Dish", price=12, quantity=2) == BillItemCreate(bill_id="b", name="Dish", price="12", quantity="2")
+    payment = PaymentCreate(bill_id="b", amount=10, tip=1, items=[])
+    assert (payment.amount, payment.tip) == (1000, 100)
+
+
+@pytest.mark.parametrize("value", [True, 12.5, None, [1]])
+def test_other_amount_types_are_rejected(value):
+    with pytest.raises(ValidationError):
+        PaymentCreate(bill_id="b", amount=value, items=[])
+
+
+def test_integer_amounts_through_the_api(client, api_bill):
+    bill = api_bill([{"name": "Steak", "price": 12, "quantity": 2}])
+    item = bill["items"][0]
+    assert (item["price"], item["quantity"], bill["total"]) == ("12.00", "2.00", "24.00")
+
+    response = client.post("/api/payments", json={"bill_id": bill["id"], "amount": 10, "items": [{"itemId": item["id"], "quantity": 1}]})
+    assert response.status_code == 201
+    assert response.json()["amount"] == "10.00"
+    bill = client.get(f"/api/bills/{bill['id']}").json()
+    assert (bill["paid"], bill["remaining"], bill["items"][0]["paid_quantity"]) == ("10.00", "14.00", "1.00")
+
+    response = client.patch(f"/api/bill-items/{item['id']}", json={"price": 15})
+    assert response.json()["price"] == "15.00"
+    assert client.get(f"/api/bills/{bill['id']}").json()["total"] == "30.00"
@@ -0,0 +1,180 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import routes
+from schemas import PaymentCreate
+
+
+def test_concurrent_payments_lose_no_updates(run, storage, make_bill, monkeypatch):
+    # As benchmarks/stress_concurrent_payments.py, at a size that runs in a test
+    monkeypatch.setattr(routes, "storage", storage)
+    payments, bill_count = 400, 4
+
+    async def stress():
+        bills = [await make_bill([("Tasting Menu", "1.25", str(payments))]) for _ in range(bill_count)]
+        await asyncio.gather(*(
+            routes.create_payment(PaymentCreate(bill_id=bill_id, amount="1.25", items=[{"itemId": item_ids[0], "quantity": "0.25"}]))
+            for i in range(payments)
+            for bill_id, item_ids in [bills[i % bill_count]]
+        ))
+        return bills
+
+    bills = run(stress())
+    applied = payments // bill_count
+    for bill_id, (item_id,) in bills:
+        bill = run(storage.get_bill(bill_id))
+        assert bill.paid == 125 * applied
+        assert bill.remaining == 125 * payments - 125 * applied
+        assert bill.status == "partial"
+        assert run(storage.get_bill_item(item_id)).paid_quantity == 25 * applied
+        assert len(run(storage.get_payments_by_bill_id(bill_id))) == applied
+
+
+def test_payment_settles_bill(run, storage, make_bill):
+    bill_id, (salad, wine) = run(make_bill([("Salad", "18.50", "1"), ("Wine", "45.00", "1")]))
+
+    _, bill = run(storage.apply_payment(PaymentCreate(
+        bill_id=bill_id, amount="41.00", tip="2.00", items=[{"itemId": salad, "quantity": "1"}, {"itemId": wine, "quantity": "0.5"}],
+    )))
+    assert (bill.total, bill.paid, bill.remaining, bill.status) == (6350, 4300, 2050, "partial")
+
+    _, bill = run(storage.apply_payment(PaymentCreate(bill_id=bill_id, amount="22.50", items=[{"itemId": wine, "quantity": "0.5"}])))
+    assert (bill.paid, bill.remaining, bill.status) == (6550, 0, "paid")
+    assert [item.paid_quantity for item in run(storage.get_bill_items(bill_id))] == [100, 100]
+
+
+def test_payment_batch_is_all_or_nothing(run, storage, make_bill):
+    bill_id, (dish,) = run(make_bill([("Dish", "10.00", "2")]))
+    payments = [
+        PaymentCreate(bill_id=bill_id, amount="10.00", items=[{"itemId": dish, "quantity": "1"}]),
+        PaymentCreate(bill_id=bill_id, amount="15.00", items=[{"itemId": dish, "quantity": "1.5"}]),
+    ]
+    with pytest.raises(ValueError):
+        run(storage.apply_payments(bill_id, payments))
+    assert run(storage.get_bill(bill_id)).paid == 0
+    assert run(storage.get_bill_item(dish)).paid_quantity == 0
+    assert run(storage.get_payments_by_bill_id(bill_id)) == []
+
+    results = run(storage.apply_payments(bill_id, payments[:1] + [PaymentCreate(bill_id=bill_id, amount="10.00", items=[{"itemId": dish, "quantity": "1"}])]))
+    assert [(bill.remaining, bill.status) for _, bill in results] == [(1000, "partial"), (0, "paid")]
+    assert run(storage.apply_payments("missing", payments[:1])) is None
+
+
+def test_payment_batch_route(client, api_bill):
+    bill = api_bill([{"name": "Dish", "price": "10.00", "quantity": "2"}])
+    dish = bill["items"][0]["id"]
+    url = f"/api/bills/{bill['id']}/payments:batch"
+
+    response = client.post(url, json=[{"amount": "10.00", "items": [{"itemId": dish, "quantity": "1.5"}]}] * 2)
+    assert response.status_code == 409
+    assert client.post(url, json=[]).status_code == 400
+    assert client.post("/api/bills/missing/payments:batch", json=[{"amount": "1.00", "items": []}]).status_code == 404
+
+    response = client.post(url, json=[{"amount": "10.00", "items": [{"itemId": dish, "quantity": "1"}]}] * 2)
+    assert response.status_code == 201
+    batch = response.json()
+    assert [(result["remaining"], result["status"]) for result in batch["payments"]] == [("10.00", "partial"), ("0.00", "paid")]
+    assert batch["bill"]["items"][0]["paid_quantity"] == "2.00"
+
+
+def test_payment_to_unknown_bill_is_not_recorded(run, storage):
+    assert run(storage.apply_payment(PaymentCreate(bill_id="missing", amount="1.00", items=[]))) is None
+    assert run(storage.get_payments_by_bill_id("missing")) == []
+
+
+def test_payment_route_to_unknown_bill(client):
+    response = client.post("/api/payments", json={"bill_id": "missing", "amount": "1.00", "items": []})
+    assert response.status_code == 404
+    assert client.get("/api/payments/bill/missing").json() == []
+
+
+def test_payment_for_another_bills_item_is_rejected(run, storage, make_bill):
+    bill_id, _ = run(make_bill())
+    other_bill_id, (other_item,) = run(make_bill())
+
+    with pytest.raises(ValueError):
+        run(storage.apply_payment(PaymentCreate(bill_id=bill_id, amount="12.50", items=[{"itemId": other_item, "quantity": "1"}])))
+    assert run(storage.get_bill(bill_id)).paid == 0
+    assert run(storage.get_payments_by_bill_id(bill_id)) == []
+    assert run(storage.get_bill_item(other_item)).paid_quantity == 0
+    assert run(storage.get_bill_totals(other_bill_id)).outstanding_quantity == {other_item: 100}
+
+
+def test_item_overpayment_is_rejected(run, storage, make_bill):
+    bill_id, (dish,) = run(make_bill([("Dish", "10.00", "2")]))
+    run(storage.apply_payment(PaymentCreate(bill_id=bill_id, amount="15.00", items=[{"itemId": dish, "quantity": "1.5"}])))
+
+    with pytest.raises(ValueError):
+        run(storage.apply_payment(PaymentCreate(bill_id=bill_id, amount="10.00", items=[{"itemId": dish, "quantity": "1"}])))
+    assert run(storage.get_bill(bill_id)).paid == 1500
+    assert run(storage.get_bill_item(dish)).paid_quantity == 150
+    assert len(run(storage.get_payments_by_bill_id(bill_id))) == 1
+
+    _, bill = run(storage.apply_payment(PaymentCreate(bill_id=bill_id, amount="5.00", items=[{"itemId": dish, "quantity": "0.5"}])))
+    assert (bill.remaining, bill.status) == (0, "paid")
+
+
+def test_payment_route_rejects_items_it_cannot_pay(client, api_bill):
+    bill, other = api_bill(), api_bill()
+    response = client.post("/api/payments", json={"bill_id": bill["id"], "amount": "12.50", "items": [{"itemId": other["items"][0]["id"], "quantity": "1"}]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"Item {other['items'][0]['id']} is not on this bill"
+    response = client.post("/api/payments", json={"bill_id": bill["id"], "amount": "25.00", "items": [{"itemId": bill["items"][0]["id"], "quantity": "2"}]})
+    assert response.status_code == 400
+    assert client.get(f"/api/bills/{bill['id']}").json() == bill
+
+
+def test_payment_route_does_not_hide_storage_errors(client, api_bill, monkeypatch, storage):
+    bill = api_bill()
+
+    async def broken(payment):
+        raise RuntimeError("storage bug")
+
+    monkeypatch.setattr(storage, "apply_payment", broken)
+    with pytest.raises(RuntimeError):
+        client.post("/api/payments", json={"bill_id": bill["id"], "amount": "1.00", "items": []})
+
+
+def test_payment_conflicts_count_payments_that_waited(run, storage, make_bill):
+    bill_id, _ = run(make_bill())
+    payment = PaymentCreate(bill_id=bill_id, amount="1.00", items=[])
+
+    async def two_payments():
+        return await asyncio.gather(storage.apply_payment(payment), storage.apply_payment(payment))
+
+    if hasattr(storage, "bills"):
+        # Payments are applied without awaiting, so neither ever waits
+        run(two_payments())
+        assert storage.payment_conflicts is None
+    elif hasattr(storage, "_conn"):
+        # Another process holds the write lock past the busy timeout
+        other = sqlite3.connect(storage.path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        run(storage._run(storage._conn.execute, "PRAGMA busy_timeout = 50"))
+        try:
+            with pytest.raises(sqlite3.OperationalError):
+                run(storage.apply_payment(payment))
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+        assert storage.payment_conflicts == 1
+        run(two_payments())
+    else:
+        # A second payment finds the bill row locked by the first and waits
+        async def held_payments():
+            async with storage._transaction() as conn:
+                await conn.execute("SELECT id FROM bills WHERE id = $1 FOR UPDATE", bill_id)
+                waiting = asyncio.gather(storage.apply_payment(payment), storage.apply_payment(payment))
+                await asyncio.sleep(0.2)
+            await waiting
+
+        run(held_payments())
+        assert storage.payment_conflicts == 2
+    assert run(storage.get_bill(bill_id)).paid == 200
+
+
+def test_metrics_report_payment_conflicts_only_where_counted(client, storage):
+    metrics = client.get("/metrics").text
+    assert ("splitpay_payment_conflicts_total" in metrics) == (storage.payment_conflicts is not None)
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+from profiling import RequestProfiler
+
+
+def busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_samples_are_charged_to_the_running_request(run):
+    profiler = RequestProfiler(sample_rate=1.0, interval=0.001)
+
+    async def request(name: str, work):
+        token = profiler.begin()
+        start = time.perf_counter()
+        await asyncio.sleep(0)
+        await work()
+        profiler.end(token, time.perf_counter() - start, {"path": name})
+
+    async def computes():
+        busy(0.1)
+
+    async def waits():
+        await asyncio.sleep(0.1)
+
+    async def both():
+        await asyncio.gather(request("computes", computes), request("waits", waits))
+
+    try:
+        run(both())
+    finally:
+        profiler.stop()
+
+    profiles = {profile["path"]: profile for profile in profiler.profiles}
+    assert profiles["computes"]["sampled_ms"] > 0
+    assert any(row["frame"].endswith(" busy") for row in profiles["computes"]["self"])
+    assert profiles["waits"]["sampled_ms"] == 0
+    assert not profiler._active and not profiler._frames
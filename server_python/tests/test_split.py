@@ -0,0 +1,125 @@
+import random
+
+import pytest
+
+from schemas import BillTotals, SplitRequest
+from split import allocate, compute_split
+
+
+def totals(outstanding: dict, quantities: dict, remaining: int) -> BillTotals:
+    return BillTotals.model_construct(
+        bill_id="bill", total=remaining, paid=0, remaining=remaining, status="unpaid",
+        item_total=remaining, paid_quantity=0, outstanding_total=sum(outstanding.values()),
+        outstanding=outstanding, outstanding_quantity=quantities, payment_count=0, payment_total=0,
+    )
+
+
+def test_allocate_gives_leftover_cents_to_largest_remainders_then_earlier_parts():
+    assert allocate(100, [1, 1, 1]) == [34, 33, 33]
+    assert allocate(1000, [1, 2]) == [333, 667]
+    assert allocate(5, [0, 0]) == [0, 0]
+    assert allocate(0, [3, 1]) == [0, 0]
+
+
+def test_allocate_always_adds_up():
+    rng = random.Random(24)
+    for _ in range(2000):
+        weights = [rng.randint(0, 10000) for _ in range(rng.randint(1, 20))]
+        amount = rng.randint(0, 10 ** 7)
+        parts = allocate(amount, weights)
+        total = sum(weights)
+        assert sum(parts) == (amount if total else 0)
+        # Each part is its exact share rounded down or up
+        assert all(total == 0 or abs(part * total - amount * weight) < total for part, weight in zip(parts, weights))
+
+
+def test_splits_add_up_to_the_remaining_amount():
+    rng = random.Random(2024)
+    for _ in range(300):
+        ids = [f"item{i}" for i in range(rng.randint(1, 12))]
+        quantities = {id: rng.randint(1, 400) for id in ids}
+        outstanding = {id: rng.randint(0, 9000) for id in ids}
+        remaining = sum(outstanding.values()) + rng.randint(-500, 500)
+        guests = rng.randint(1, 8)
+        percentages = allocate(10000, [rng.randint(0, 9) + 1 for _ in range(guests)])
+        body = {
+            "mode": rng.choice(["even", "by_item", "by_percentage", "mixed"]),
+            "guests": [
+                {
+                    "name": f"Guest {g}",
+                    "percentage": f"{percentages[g] // 100}.{percentages[g] % 100:02d}",
+                    "items": [{"item_id": id} for id in ids if rng.random() < 0.3],
+                }
+                for g in range(guests)
+            ],
+        }
+        request = SplitRequest.model_validate(body)
+        split = compute_split(totals(outstanding, quantities, max(0, remaining)), request)
+
+        assert sum(share.amount for share in split.shares) + split.unassigned == max(0, remaining, sum(share.item_amount for share in split.shares))
+        assert split.unassigned >= 0
+        assert compute_split(totals(outstanding, quantities, max(0, remaining)), request) == split
+        # Every fully claimed item is paid for in full, quantities included
+        claimed = {claim.item_id for guest in request.guests for claim in guest.items} if request.mode in ("by_item", "mixed") else set()
+        for id in claimed:
+            assert sum(int(float(item["quantity"]) * 100 + 0.5) for share in split.shares for item in share.items if item["itemId"] == id) == quantities[id]
+
+
+def test_even_split_differs_by_at_most_a_cent():
+    split = compute_split(totals({}, {}, 10000), SplitRequest.model_validate({"mode": "even", "guests": [{"name": str(g)} for g in range(3)]}))
+    assert [share.amount for share in split.shares] == [3334, 3333, 3333]
+
+
+def test_shared_item_with_an_explicit_claim():
+    request = SplitRequest.model_validate({"mode": "by_item", "guests": [
+        {"name": "Ana", "items": [{"item_id": "wine", "quantity": "0.50"}]},
+        {"name": "Ben", "items": [{"item_id": "wine"}]},
+        {"name": "Cai", "items": [{"item_id": "wine"}]},
+    ]})
+    split = compute_split(totals({"wine": 4500}, {"wine": 100}, 4500), request)
+    assert [share.amount for share in split.shares] == [2250, 1125, 1125]
+    assert [share.items for share in split.shares] == [
+        [{"itemId": "wine", "quantity": "0.50"}],
+        [{"itemId": "wine", "quantity": "0.25"}],
+        [{"itemId": "wine", "quantity": "0.25"}],
+    ]
+
+
+@pytest.mark.parametrize("body, error", [
+    ({"mode": "even", "guests": []}, "at least one guest"),
+    ({"mode": "by_item", "guests": [{"name": "Ana", "items": [{"item_id": "nope"}]}]}, "Unknown item"),
+    ({"mode": "by_item", "guests": [{"name": "Ana", "items": [{"item_id": "wine", "quantity": "2"}]}]}, "claimed"),
+    ({"mode": "by_percentage", "guests": [{"name": "Ana", "percentage": "60"}, {"name": "Ben", "percentage": "30"}]}, "add up"),
+    ({"mode": "by_percentage", "guests": [{"name": "Ana", "percentage": "100"}, {"name": "Ben"}]}, "percentage"),
+])
+def test_invalid_splits_are_rejected(body, error):
+    with pytest.raises(ValueError, match=error):
+        compute_split(totals({"wine": 4500}, {"wine": 100}, 4500), SplitRequest.model_validate(body))
+
+
+def test_integer_percentages_and_quantities_are_whole_units():
+    body = {"mode": "mixed", "guests": [
+        {"name": "Ana", "percentage": 50, "items": [{"item_id": "wine", "quantity": 1}]},
+        {"name": "Ben", "percentage": 50},
+    ]}
+    split = compute_split(totals({"wine": 4500}, {"wine": 200}, 10000), SplitRequest.model_validate(body))
+    assert [(share.item_amount, share.shared_amount) for share in split.shares] == [(2250, 3875), (0, 3875)]
+    assert split.shares[0].items == [{"itemId": "wine", "quantity": "1.00"}]
+    assert SplitRequest.model_validate(body) == SplitRequest.model_validate({"mode": "mixed", "guests": [
+        {"name": "Ana", "percentage": "50.00", "items": [{"item_id": "wine", "quantity": "1.00"}]},
+        {"name": "Ben", "percentage": "50"},
+    ]})
+
+
+def test_split_route(client, api_bill):
+    bill = api_bill([{"name": "Pizza", "price": 20, "quantity": 1}, {"name": "Wine", "price": 30, "quantity": 2}])
+    pizza, wine = (item["id"] for item in bill["items"])
+    response = client.post(f"/api/bills/{bill['id']}/split", json={"mode": "by_item", "guests": [
+        {"name": "Ana", "items": [{"item_id": pizza}, {"item_id": wine, "quantity": 1}]},
+        {"name": "Ben", "items": [{"item_id": wine, "quantity": 1}]},
+    ]})
+    assert response.status_code == 200
+    assert [share["amount"] for share in response.json()["shares"]] == ["50.00", "30.00"]
+    assert client.post(f"/api/bills/{bill['id']}/split", json={"mode": "by_percentage", "guests": [
+        {"name": "Ana", "percentage": 60}, {"name": "Ben", "percentage": 30},
+    ]}).status_code == 400
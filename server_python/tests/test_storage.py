@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from schemas import Bill, BillCreate, BillItem, Payment, PaymentCreate, Table, TableCreate
+from seed import SeedConfig, seed_storage
+
+
+async def documents(iterator) -> list:
+    return [document async for document in iterator]
+
+
+def test_tables(run, storage):
+    first = run(storage.create_table(TableCreate(number=2, restaurant_name="bella-vista", qr_code="QR-2")))
+    second = run(storage.create_table(TableCreate(number=1, restaurant_name="bella-vista", qr_code="QR-1")))
+    other = run(storage.create_table(TableCreate(number=1, restaurant_name="other", qr_code="QR-o1")))
+
+    assert run(storage.get_table(first.id)) == first
+    assert run(storage.get_table("missing")) is None
+    assert run(storage.get_table_by_number(1, "bella-vista")) == second
+    assert {table.id for table in run(storage.get_all_tables())} == {first.id, second.id, other.id}
+    assert [document["id"] for document in run(documents(storage.iter_table_documents("bella-vista")))] == [second.id, first.id]
+    assert [document["id"] for document in run(documents(storage.iter_table_documents("bella-vista", after=second.id)))] == [first.id]
+    with pytest.raises(ValueError):
+        run(documents(storage.iter_table_documents(after="missing")))
+
+    moved = run(storage.update_table(first.id, {"number": 5, "id": "ignored"}))
+    assert (moved.id, moved.number) == (first.id, 5)
+    assert run(storage.get_table_by_number(5, "bella-vista")) == moved
+    assert run(storage.get_table_by_number(2, "bella-vista")) is None
+    assert run(storage.update_table("missing", {"number": 3})) is None
+
+
+def test_bills_derive_their_balance(run, storage, make_bill):
+    table = run(storage.create_table(TableCreate(number=1, restaurant_name="test", qr_code="QR")))
+    bill = run(storage.create_bill(BillCreate(table_id=table.id, total="50.00", paid="20.00", remaining="1.00", status="paid")))
+    assert (bill.total, bill.paid, bill.remaining, bill.status) == (5000, 2000, 3000, "partial")
+    assert run(storage.get_bill(bill.id)) == bill
+    assert run(storage.get_bill_by_table_id(table.id)) == bill
+    assert [active.id for active in run(storage.get_all_active_bills())] == [bill.id]
+
+    updated = run(storage.update_bill(bill.id, {"paid": "50.00", "remaining": "9.00", "guest_count": 3}))
+    assert (updated.remaining, updated.status, updated.guest_count) == (0, "paid", 3)
+    closed = run(storage.update_bill(bill.id, {"is_active": False}))
+    assert closed.is_active is False
+    assert run(storage.get_bill_by_table_id(table.id)) is None
+    assert run(storage.get_all_active_bills()) == []
+    assert run(storage.update_bill("missing", {"guest_count": 1})) is None
+
+
+def test_bill_with_items(run, storage, make_bill):
+    bill_id, item_ids = run(make_bill([("Salad", "18.50", "1"), ("Wine", "45.00", "2")]))
+    bill = run(storage.get_bill_with_items(bill_id))
+    assert (bill.total, bill.remaining, bill.status) == (10850, 10850, "unpaid")
+    assert [item.id for item in bill.items] == item_ids
+    assert bill.table == run(storage.get_table(bill.table_id))
+    assert run(storage.get_bill_items(bill_id)) == bill.items
+    assert run(storage.get_bill_item(item_ids[1])) == bill.items[1]
+    assert run(storage.get_bill_with_items("missing")) is None
+    assert [document["id"] for document in run(documents(storage.iter_bill_item_documents(bill_id, after=item_ids[0])))] == item_ids[1:]
+
+
+def test_documents_match_models(run, storage, make_bill):
+    # The listings encode records without building models; the JSON must be the same
+    bill_id, (item_id,) = run(make_bill())
+    run(storage.apply_payment(PaymentCreate(bill_id=bill_id, amount="5.00", tip="0.50", items=[{"itemId": item_id, "quantity": "0.5"}])))
+    bill = run(storage.get_bill(bill_id))
+
+    def normalized(value) -> str:
+        return json.dumps(json.loads(json.dumps(value, default=str)), sort_keys=True)
+
+    table, = run(documents(storage.iter_table_documents()))
+    assert Table.model_validate(table) == run(storage.get_table(bill.table_id))
+    item, = run(documents(storage.iter_bill_item_documents(bill_id)))
+    assert BillItem.model_validate(item) == run(storage.get_bill_item(item_id))
+    payment, = run(documents(storage.iter_payment_documents(bill_id)))
+    assert Payment.model_validate(payment) == run(storage.get_payments_by_bill_id(bill_id))[0]
+    dashboard, = run(storage.get_dashboard_documents())
+    assert normalized(dashboard) == normalized(run(storage.get_dashboard_tables())[0].model_dump(mode="json"))
+    assert Bill.model_validate(dashboard["bill"]) == bill
+
+
+def test_versions_change_with_the_data(run, storage, make_bill):
+    bill_id, (item_id,) = run(make_bill())
+    versions = [run(storage.get_bill_version(bill_id))]
+    dashboard = [run(storage.get_dashboard_version())]
+
+    run(storage.update_bill_item(item_id, {"name": "Soup"}))
+    versions.append(run(storage.get_bill_version(bill_id)))
+    run(storage.apply_payment(PaymentCreate(bill_id=bill_id, amount="1.00", items=[])))
+    versions.append(run(storage.get_bill_version(bill_id)))
+    dashboard.append(run(storage.get_dashboard_version()))
+
+    assert None not in versions and len(set(versions)) == 3
+    assert dashboard[0] != dashboard[1]
+    assert run(storage.get_bill_version("missing")) is None
+
+
+def test_bulk_load_and_export(run, storage):
+    config = SeedConfig(restaurants=2, tables=4, bills=3, seed=7)
+    counts = run(seed_storage(storage, config))
+    stats = run(storage.get_storage_stats())
+    assert {key: stats[key] for key in counts} == counts
+
+    exported = run(documents(storage.iter_bill_exports()))
+    assert len(exported) == stats["bills"]
+    assert sum(len(document["items"]) for document in exported) == stats["bill_items"]
+    assert sum(len(document["payments"]) for document in exported) == stats["payments"]
+    restaurant = run(storage.get_all_tables())[0].restaurant_name
+    assert 0 < len(run(documents(storage.iter_bill_exports(restaurant)))) < len(exported)
+    assert run(storage.verify_bill_totals()) == []
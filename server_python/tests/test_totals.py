@@ -0,0 +1,82 @@
+import random
+
+from money import line_total
+from records import unpaid_quantity
+from schemas import BillItemCreate, PaymentCreate
+
+
+def recount(run, storage, bill_id):
+    """A bill's totals worked out from scratch from its items and payments"""
+    items = run(storage.get_bill_items(bill_id))
+    payments = run(storage.get_payments_by_bill_id(bill_id))
+    return {
+        "item_total": sum(line_total(item.price, item.quantity) for item in items),
+        "paid_quantity": sum(item.paid_quantity or 0 for item in items),
+        "outstanding": {item.id: line_total(item.price, unpaid_quantity(item)) for item in items},
+        "payment_count": len(payments),
+        "payment_total": sum(payment.amount + (payment.tip or 0) for payment in payments),
+    }
+
+
+def test_totals_follow_item_and_payment_changes(run, storage, make_bill):
+    rng = random.Random(23)
+    bills = [run(make_bill([(f"Dish {i}", f"{rng.randint(1, 40)}.{rng.randint(0, 99):02d}", str(rng.randint(1, 3))) for i in range(4)]))
+             for _ in range(3)]
+    items = {item_id: bill_id for bill_id, item_ids in bills for item_id in item_ids}
+
+    for _ in range(60):
+        bill_id, item_ids = rng.choice(bills)
+        action = rng.randrange(4)
+        if action == 0:
+            item = run(storage.create_bill_item(BillItemCreate(bill_id=bill_id, name="Extra", price=f"{rng.randint(1, 9)}.50")))
+            item_ids.append(item.id)
+            items[item.id] = bill_id
+        elif action == 1:
+            run(storage.update_bill_item(rng.choice(item_ids), {"price": f"{rng.randint(1, 30)}.{rng.randint(0, 99):02d}"}))
+        elif action == 2:
+            item_id = rng.choice(item_ids)
+            unpaid = unpaid_quantity(run(storage.get_bill_item(item_id)))
+            quantity = min(unpaid, rng.choice([25, 50, 100]))
+            run(storage.apply_payment(PaymentCreate(
+                bill_id=bill_id, amount=f"{rng.randint(1, 20)}.00", tip="0.50",
+                items=[{"itemId": item_id, "quantity": f"{quantity / 100:.2f}"}] if quantity else [],
+            )))
+        else:
+            # Move an item to another bill
+            item_id = rng.choice(item_ids)
+            other_id, other_items = rng.choice(bills)
+            if other_id != bill_id and len(item_ids) > 1:
+                run(storage.update_bill_item(item_id, {"bill_id": other_id}))
+                item_ids.remove(item_id)
+                other_items.append(item_id)
+
+    for bill_id, _ in bills:
+        totals = run(storage.get_bill_totals(bill_id))
+        bill = run(storage.get_bill(bill_id))
+        expected = recount(run, storage, bill_id)
+        assert {key: getattr(totals, key) for key in expected} == expected
+        assert totals.outstanding_total == sum(expected["outstanding"].values())
+        assert totals.outstanding_quantity == {item.id: unpaid_quantity(item) for item in run(storage.get_bill_items(bill_id))}
+        assert bill.total == expected["item_total"]
+        assert bill.remaining == max(0, bill.total - bill.paid)
+    assert run(storage.verify_bill_totals()) == []
+
+
+def test_unknown_bill_has_no_totals(run, storage):
+    assert run(storage.get_bill_totals("missing")) is None
+
+
+def test_verify_repairs_a_drifted_bill(run, storage, make_bill):
+    bill_id, _ = run(make_bill([("Dish", "12.50", "2")]))
+    # Drift the stored balance behind the storage's back
+    if hasattr(storage, "bills"):
+        storage.bills[bill_id].remaining = 1
+    elif hasattr(storage, "_conn"):
+        run(storage._run(storage._conn.execute, "UPDATE bills SET remaining = 1 WHERE id = ?", (bill_id,)))
+    else:
+        run(storage._execute("UPDATE bills SET remaining = 1 WHERE id = $1", bill_id))
+
+    assert run(storage.verify_bill_totals()) == [bill_id]
+    assert run(storage.verify_bill_totals(rebuild=True)) == [bill_id]
+    assert run(storage.verify_bill_totals()) == []
+    assert run(storage.get_bill(bill_id)).remaining == 2500
@@ -0,0 +1,46 @@
+import pytest
+from pydantic import ValidationError
+
+
+def test_invalid_item_update_changes_nothing(client, api_bill):
+    bill = api_bill([{"name": "Salad", "price": "18.50"}, {"name": "Salmon", "price": "32.00"}])
+    item = bill["items"][0]
+    totals = client.get(f"/api/bills/{bill['id']}/totals").json()
+
+    response = client.patch(f"/api/bill-items/{item['id']}", json={"bill_id": bill["id"], "price": "abc"})
+    assert response.status_code == 400
+    assert client.get(f"/api/bills/{bill['id']}").json() == bill
+    assert client.get(f"/api/bills/{bill['id']}/totals").json() == totals
+
+    response = client.patch(f"/api/bill-items/{item['id']}", json={"price": "20.00"})
+    assert response.status_code == 200
+    assert client.get(f"/api/bills/{bill['id']}/totals").json()["item_total"] == "52.00"
+
+
+def test_invalid_bill_update_changes_nothing(client, api_bill):
+    bill = api_bill()
+    response = client.patch(f"/api/bills/{bill['id']}", json={"is_active": True, "guest_count": "many"})
+    assert response.status_code == 400
+    assert client.get(f"/api/bills/{bill['id']}").json() == bill
+    assert client.get("/api/qr/1/test").json()["id"] == bill["id"]
+
+    assert client.patch(f"/api/bills/{bill['id']}", json={"guest_count": 3}).json()["guest_count"] == 3
+    assert client.patch(f"/api/bills/{bill['id']}", json={"is_active": False}).status_code == 200
+    assert client.get("/api/qr/1/test").status_code == 404
+
+
+def test_invalid_table_update_changes_nothing(run, storage, make_bill):
+    bill_id, _ = run(make_bill())
+    bill = run(storage.get_bill(bill_id))
+    table = run(storage.get_table(bill.table_id))
+
+    with pytest.raises(ValidationError):
+        run(storage.update_table(table.id, {"number": 70, "is_active": "not a flag"}))
+    assert run(storage.get_table(table.id)) == table
+    assert run(storage.get_table_by_number(table.number, table.restaurant_name)) == table
+    assert run(storage.get_table_by_number(70, table.restaurant_name)) is None
+    assert [listed.id for listed in run(storage.get_all_tables())] == [table.id]
+    assert [listed.id for listed in run(storage.get_dashboard_tables())] == [table.id]
+
+    run(storage.update_table(table.id, {"number": 70}))
+    assert run(storage.get_table_by_number(70, table.restaurant_name)).id == table.id
@@ -0,0 +1,59 @@
+import pytest
+
+from records import record_values
+from schemas import BillItemCreate, PaymentCreate
+from storage import MemStorage
+from wal import WriteAheadLog
+
+
+async def close(wal: WriteAheadLog):
+    # A lazy flush can still be pending under fsync=none
+    if wal._flusher is not None:
+        await wal._flusher
+    await wal.close()
+
+
+def state(storage: MemStorage) -> dict:
+    return {
+        kind: sorted(repr(record_values(record)) for record in records.values())
+        for _, records, kind in storage._record_stores().values()
+    }
+
+
+@pytest.mark.parametrize("fsync", ["always", "batched", "none"])
+def test_recovery_replays_snapshot_and_log(run, tmp_path, fsync):
+    storage = MemStorage(wal=WriteAheadLog(str(tmp_path), fsync=fsync))
+
+    async def work():
+        table = await storage.get_table_by_number(7, "bella-vista")
+        bill = await storage.get_bill_by_table_id(table.id)
+        items = await storage.get_bill_items(bill.id)
+        await storage.apply_payment(PaymentCreate(bill_id=bill.id, amount="5.00", items=[{"itemId": items[0].id, "quantity": "0.5"}]))
+        await storage.create_bill_items([BillItemCreate(bill_id=bill.id, name="Espresso", price="3.00")])
+        await storage.update_bill_item(items[1].id, {"price": "10.00"})
+        await storage.update_table(table.id, {"number": 70})
+        await storage.snapshot()
+        # After the snapshot, only in the log
+        await storage.apply_payments(bill.id, [PaymentCreate(bill_id=bill.id, amount="1.00", items=[{"itemId": items[2].id, "quantity": "0.25"}])])
+        await storage.update_bill(bill.id, {"guest_count": 9})
+        await storage.wal.flush()
+
+    run(work())
+    recovered = MemStorage(wal=WriteAheadLog(str(tmp_path), fsync=fsync))
+
+    assert state(recovered) == state(storage)
+    assert run(recovered.verify_bill_totals()) == []
+    table = run(recovered.get_table_by_number(70, "bella-vista"))
+    assert table is not None
+    assert run(recovered.get_table_by_number(7, "bella-vista")) is None
+    bill = run(recovered.get_bill_by_table_id(table.id))
+    assert (bill.guest_count, bill.paid) == (9, 3275 + 600)
+    assert run(recovered.get_bill_totals(bill.id)) == run(storage.get_bill_totals(bill.id))
+    run(close(storage.wal))
+    run(close(recovered.wal))
+
+
+def test_recovery_without_snapshot_or_log_starts_fresh(run, tmp_path):
+    storage = MemStorage(wal=WriteAheadLog(str(tmp_path)), sample_data=False)
+    assert state(storage) == {kind: [] for kind in state(storage)}
+    run(close(storage.wal))
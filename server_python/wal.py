@@ -0,0 +1,276 @@
+import asyncio
+import os
+import pickle
+import struct
+import zlib
+from typing import Any, Iterator, List, Optional, Tuple
+
+# Durability for MemStorage. Every change is appended to a binary log as a
+# pickled (lsn, entry) frame; snapshots of the full state let recovery skip
+# everything up to the snapshot's lsn and replay only the tail.
+#
+# Frame layout: 4-byte big-endian payload length, 4-byte CRC32 of the
+# payload, payload. A torn or corrupt frame ends replay of its segment.
+
+_HEADER = struct.Struct(">II")
+
+FSYNC_POLICIES = ("always", "batched", "none")
+
+
+def _segment_name(first_lsn: int) -> str:
+    return f"wal-{first_lsn:020d}.log"
+
+
+def _snapshot_name(lsn: int) -> str:
+    return f"snapshot-{lsn:020d}.pkl"
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """Append-only, segmented change log with group commit.
+
+    fsync policies:
+      always  - every commit() writes and fsyncs before returning; commits
+                that arrive while a sync is in flight share the next one
+      batched - appends are buffered and written with one fsync once
+                `interval` seconds pass or `batch_bytes` are pending;
+                commit() waits for the fsync covering its entries
+      none    - appends are written on the same schedule without fsync and
+                commit() does not wait
+    """
+
+    def __init__(self, directory: str, fsync: str = "batched", interval: float = 0.005, batch_bytes: int = 1024 * 1024):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.directory = directory
+        self.fsync = fsync
+        self.interval = interval
+        self.batch_bytes = batch_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._next_lsn = 0
+        self._synced_lsn = 0
+        self._buffer = bytearray()
+        self._file = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._io_lock: Optional[asyncio.Lock] = None
+        self.bytes_since_snapshot = 0
+        self.snapshot_lsn = 0
+
+    @property
+    def lsn(self) -> int:
+        return self._next_lsn
+
+    def _files(self, prefix: str, suffix: str) -> List[Tuple[int, str]]:
+        return sorted(
+            (int(name[len(prefix):-len(suffix)]), name)
+            for name in os.listdir(self.directory)
+            if name.startswith(prefix) and name.endswith(suffix)
+        )
+
+    # Recovery
+    def recover(self) -> Tuple[Optional[dict], Iterator[Any]]:
+        """Load the latest snapshot and iterate the log entries written after it.
+
+        Must be called, and the iterator exhausted, before the first append.
+        """
+        snapshot = None
+        snapshots = self._files("snapshot-", ".pkl")
+        if snapshots:
+            with open(os.path.join(self.directory, snapshots[-1][1]), "rb") as f:
+                snapshot = pickle.load(f)
+            self._next_lsn = self.snapshot_lsn = snapshot["lsn"]
+        return snapshot, self._replay(self._next_lsn)
+
+    def _replay(self, after_lsn: int) -> Iterator[Any]:
+        for _, name in self._files("wal-", ".log"):
+            path = os.path.join(self.directory, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + _HEADER.size <= len(data):
+                length, crc = _HEADER.unpack_from(data, offset)
+                payload = data[offset + _HEADER.size:offset + _HEADER.size + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                offset += _HEADER.size + length
+                lsn, entry = pickle.loads(payload)
+                if lsn > after_lsn:
+                    self._next_lsn = lsn
+                    yield entry
+            if offset < len(data):
+                # Drop the torn tail so new frames are not appended after garbage
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+        self._synced_lsn = self._next_lsn
+
+    def _open_segment(self):
+        segments = self._files("wal-", ".log")
+        name = segments[-1][1] if segments else _segment_name(self._next_lsn + 1)
+        self._file = open(os.path.join(self.directory, name), "ab")
+
+    # Appending
+    def append(self, entry: Any):
+        """Buffer a log entry; it is durable once a later commit() returns"""
+        self._next_lsn += 1
+        payload = pickle.dumps((self._next_lsn, entry), pickle.HIGHEST_PROTOCOL)
+        self._buffer += _HEADER.pack(len(payload), zlib.crc32(payload))
+        self._buffer += payload
+        if self._batch_full is not None and len(self._buffer) >= self.batch_bytes:
+            self._batch_full.set()
+
+    async def commit(self):
+        """Wait until every entry appended so far is durable under the fsync policy"""
+        target = self._next_lsn
+        if self.fsync == "none":
+            if self._flusher is None and self._buffer:
+                self._flusher = asyncio.create_task(self._flush_soon())
+            return
+        while self._synced_lsn < target:
+            if self._flusher is None:
+                self._flusher = asyncio.create_task(self._flush_soon())
+            await asyncio.shield(self._flusher)
+
+    async def _flush_soon(self):
+        try:
+            if self.fsync != "always":
+                self._batch_full = asyncio.Event()
+                if len(self._buffer) < self.batch_bytes:
+                    try:
+                        await asyncio.wait_for(self._batch_full.wait(), self.interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._batch_full = None
+            await self.flush()
+        finally:
+            self._flusher = None
+
+    def _write(self, file, data: bytes, sync: bool):
+        if data:
+            file.write(data)
+            file.flush()
+        if sync:
+            os.fsync(file.fileno())
+
+    async def flush(self):
+        """Write out buffered entries now, fsyncing unless the policy is none"""
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        async with self._io_lock:
+            if self._file is None:
+                self._open_segment()
+            lsn = self._next_lsn
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            self.bytes_since_snapshot += len(data)
+            await asyncio.to_thread(self._write, self._file, data, self.fsync != "none" and bool(data))
+            self._synced_lsn = max(self._synced_lsn, lsn)
+
+    # Snapshots
+    def _write_snapshot(self, snapshot: dict):
+        path = os.path.join(self.directory, _snapshot_name(snapshot["lsn"]))
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_directory(self.directory)
+
+        # Everything up to the snapshot is now redundant
+        for lsn, name in self._files("snapshot-", ".pkl"):
+            if lsn < snapshot["lsn"]:
+                os.remove(os.path.join(self.directory, name))
+        segments = self._files("wal-", ".log")
+        for first_lsn, name in segments:
+            if first_lsn <= snapshot["lsn"] and name != os.path.basename(self._file.name):
+                os.remove(os.path.join(self.directory, name))
+
+    def snapshot_sync(self, state: dict):
+        """Write a snapshot outside the event loop (at startup, before any append)"""
+        if self._file is None:
+            self._open_segment()
+        self._write_snapshot({"lsn": self._next_lsn, **state})
+        self.snapshot_lsn = self._next_lsn
+
+    async def snapshot(self, capture):
+        """Snapshot the state returned by `capture()` and start a new log segment.
+
+        `capture` runs synchronously, so the state it returns matches the
+        current lsn exactly; pickling and writing happen in a worker thread.
+        """
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        async with self._io_lock:
+            if self._file is None:
+                self._open_segment()
+            lsn = self._next_lsn
+            state = capture()
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            previous = self._file
+            self._file = open(os.path.join(self.directory, _segment_name(lsn + 1)), "ab")
+            self.bytes_since_snapshot = 0
+
+            def finish():
+                self._write(previous, data, self.fsync != "none")
+                previous.close()
+                self._write_snapshot({"lsn": lsn, **state})
+
+            await asyncio.to_thread(finish)
+            self._synced_lsn = max(self._synced_lsn, lsn)
+            self.snapshot_lsn = lsn
+
+    async def close(self):
+        await self.flush()
+        self._file.close()
+        self._file = None
+
+
+class Snapshotter:
+    """Background task snapshotting a storage once its log has grown enough or aged.
+
+    A snapshot is taken every `interval` seconds if anything was logged, or
+    as soon as `max_log_bytes` have been written since the last one.
+    """
+
+    def __init__(self, storage, interval: float = 300.0, max_log_bytes: int = 64 * 1024 * 1024, poll: float = 1.0):
+        self.storage = storage
+        self.interval = interval
+        self.max_log_bytes = max_log_bytes
+        self.poll = poll
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while True:
+            await asyncio.sleep(self.poll)
+            wal = self.storage.wal
+            due = loop.time() - last >= self.interval and wal.lsn > wal.snapshot_lsn
+            if due or wal.bytes_since_snapshot >= self.max_log_bytes:
+                try:
+                    await self.storage.snapshot()
+                except Exception as e:
+                    print(f"Snapshot failed: {e}")
+                last = loop.time()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
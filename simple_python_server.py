@@ -3,12 +3,19 @@
 Simple working Python FastAPI server with the same API as Node.js version
 """
 
+import os
+import sys
+
+# Share the money helpers with the main backend
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'server_python'))
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from datetime import datetime
 import uuid
+from money import to_cents, format_cents
 
 app = FastAPI(title="SplitBill Python API")
 
@@ -67,7 +74,8 @@ def init_sample_data():
             **item_data
         }
 
-init_sample_data()
+if os.getenv("SPLITPAY_SAMPLE_DATA", "1") == "1":
+    init_sample_data()
 
 @app.get("/")
 async def root():
@@ -145,9 +153,9 @@ async def create_payment(payment_data: Dict[str, Any]):
     bill_id = payment_data["bill_id"]
     if bill_id in bills_db:
         bill = bills_db[bill_id]
-        total_amount = float(payment_data["amount"]) + float(payment_data.get("tip", "0"))
-        new_paid = float(bill.get("paid", "0")) + total_amount
-        new_remaining = float(bill["total"]) - new_paid
+        total_amount = to_cents(payment_data["amount"]) + to_cents(payment_data.get("tip", "0"))
+        new_paid = to_cents(bill.get("paid", "0")) + total_amount
+        new_remaining = to_cents(bill["total"]) - new_paid
         
         status_value = "unpaid"
         if new_remaining <= 0:
@@ -156,8 +164,8 @@ async def create_payment(payment_data: Dict[str, Any]):
             status_value = "partial"
         
         bills_db[bill_id].update({
-            "paid": f"{new_paid:.2f}",
-            "remaining": f"{max(0, new_remaining):.2f}",
+            "paid": format_cents(new_paid),
+            "remaining": format_cents(max(0, new_remaining)),
             "status": status_value,
         })
         
@@ -167,8 +175,8 @@ async def create_payment(payment_data: Dict[str, Any]):
             quantity = item_payment.get("quantity", 0)
             
             if item_id in items_db:
-                current_paid = float(items_db[item_id].get("paid_quantity", "0"))
-                items_db[item_id]["paid_quantity"] = f"{current_paid + float(quantity):.2f}"
+                current_paid = to_cents(items_db[item_id].get("paid_quantity", "0"))
+                items_db[item_id]["paid_quantity"] = format_cents(current_paid + to_cents(quantity))
     
     return payment
 